@@ -0,0 +1,102 @@
+"""
+semantic segmentationのセグメントファイルを出力する処理のマイクロベンチマーク。
+
+従来の方法（クラスごとにマスクで点を抽出して`SegmentData(list(...)).to_json()`で出力する）と、
+`group_point_indices_by_class`と`write_segment_file`で出力する方法の、処理時間とメモリ確保量を比較します。
+
+`--input_dir`を指定するとPandaSetの1フレームを、指定しなければ乱数で生成したフレームを使います。
+
+    $ poetry run python benchmarks/bench_write_segment_file.py
+    $ poetry run python benchmarks/bench_write_segment_file.py --input_dir pandaset --sequence_id 001
+"""
+
+import tempfile
+import timeit
+import tracemalloc
+from argparse import ArgumentParser
+from pathlib import Path
+
+import numpy
+import pandas
+from annofab_3dpc.annotation import SegmentData
+
+from panda2anno.common.semseg import group_point_indices_by_class, write_segment_file
+
+
+def legacy(semseg_data: pandas.DataFrame, output_dir: Path) -> None:
+    for class_id in semseg_data["class"].unique():
+        df_by_label = semseg_data[semseg_data["class"] == class_id]
+        with (output_dir / f"legacy-{class_id}").open("w") as f:
+            f.write(SegmentData(list(df_by_label.index)).to_json())
+
+
+def fast(semseg_data: pandas.DataFrame, output_dir: Path) -> None:
+    for class_id, point_indices in group_point_indices_by_class(
+        semseg_data["class"].to_numpy(), point_indices=semseg_data.index.to_numpy()
+    ):
+        write_segment_file(point_indices, output_dir / f"fast-{class_id}")
+
+
+def measure_peak_allocation(func, semseg_data: pandas.DataFrame, output_dir: Path) -> int:
+    """関数の実行中に確保したメモリのピーク[byte]を返す"""
+    tracemalloc.start()
+    func(semseg_data, output_dir)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def load_semseg_data(input_dir: Path, sequence_id: str, frame_index: int) -> pandas.DataFrame:
+    from pandaset import DataSet
+
+    from panda2anno.common.frame_reader import SequenceFrameReader
+
+    sequence = DataSet(str(input_dir))[sequence_id]
+    return SequenceFrameReader(sequence).read_semseg(frame_index)
+
+
+def main() -> None:
+    parser = ArgumentParser()
+    parser.add_argument("--input_dir", type=Path, help="pandasetのディレクトリ")
+    parser.add_argument("--sequence_id", type=str, default="001")
+    parser.add_argument("--frame_index", type=int, default=0)
+    parser.add_argument("--points", type=int, default=170_000, help="`--input_dir`を指定しない場合の、1フレームの点数")
+    parser.add_argument("--classes", type=int, default=40, help="`--input_dir`を指定しない場合の、1フレームのクラス数")
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.input_dir is not None:
+        semseg_data = load_semseg_data(args.input_dir, args.sequence_id, args.frame_index)
+    else:
+        rng = numpy.random.default_rng(0)
+        semseg_data = pandas.DataFrame({"class": rng.integers(1, args.classes + 1, size=args.points)})
+
+    print(f"{len(semseg_data)} points, {semseg_data['class'].nunique()} classes")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        output_dir = Path(tmp_dir)
+
+        legacy(semseg_data, output_dir)
+        fast(semseg_data, output_dir)
+        for class_id in semseg_data["class"].unique():
+            assert (output_dir / f"legacy-{class_id}").read_bytes() == (output_dir / f"fast-{class_id}").read_bytes()
+
+        for name, func in [("legacy", legacy), ("fast", fast)]:
+            elapsed = min(timeit.repeat(lambda: func(semseg_data, output_dir), number=1, repeat=args.repeat))
+            peak = measure_peak_allocation(func, semseg_data, output_dir)
+            print(f"{name:>6}: {elapsed * 1000:8.2f} ms/frame, peak allocation {peak / 1024 / 1024:7.2f} MiB")
+
+        # 1個のセグメントに全点が含まれる場合の、出力処理だけのメモリ確保量
+        point_indices = semseg_data.index.to_numpy()
+        for name, func in [
+            ("legacy", lambda: (output_dir / "legacy-all").write_text(SegmentData(list(semseg_data.index)).to_json())),
+            ("fast", lambda: write_segment_file(point_indices, output_dir / "fast-all")),
+        ]:
+            tracemalloc.start()
+            func()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"{name:>6}: peak allocation of writing {len(point_indices)} points {peak / 1024 / 1024:7.2f} MiB")
+
+
+if __name__ == "__main__":
+    main()
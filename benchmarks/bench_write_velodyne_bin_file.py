@@ -0,0 +1,82 @@
+"""
+KITTIのvelodyne bin fileを出力する処理のマイクロベンチマーク。
+
+従来の方法と、現在の方法（`Pose.inverse`で求めた逆変換で、`transform_and_pack_points`が(N,4)のfloat32の配列に直接書き込む）の、
+処理時間とメモリ確保量を比較します。
+従来の方法は、変更前の`Pose`の計算をそのまま再現します。フレームごとにpyquaternionで逆変換と4x4の同次変換行列を求め、
+点群を同次座標にして座標変換し、`numpy.hstack`で強度を結合してからfloat32に変換します。
+
+    $ poetry run python benchmarks/bench_write_velodyne_bin_file.py
+"""
+
+import timeit
+import tracemalloc
+from argparse import ArgumentParser
+
+import numpy
+import pandas
+from pyquaternion import Quaternion
+
+from panda2anno.common.pointcloud import transform_and_pack_points
+from panda2anno.common.pose import Pose
+
+pandaset_pose = {
+    "position": {"x": 2.5866664556528294, "y": 2.466240979290467, "z": 1.8213244045644146},
+    "heading": {"w": 0.6554122851680118, "x": -0.650630103896342, "y": 0.27605590080108616, "z": -0.26628620690449},
+}
+
+
+def legacy(lidar_data: pandas.DataFrame, lidar_pose: Pose) -> numpy.ndarray:
+    # 変更前の`Pose.inverse`。`Pose`はキャッシュを持たないので、フレームごとにpyquaternionで計算していた
+    qinv = Quaternion(lidar_pose.wxyz).inverse
+    tvec = qinv.rotate(-lidar_pose.tvec)
+    # 変更前の`Pose.matrix`と`Pose.__mul__`。点群を同次座標にして、4x4の行列で変換していた
+    matrix = qinv.transformation_matrix
+    matrix[:3, 3] = tvec
+    points = lidar_data[["x", "y", "z"]].values
+    homogeneous_points = numpy.hstack([points, numpy.ones((len(points), 1))]).T
+    converted_data = (numpy.dot(matrix, homogeneous_points).T)[:, :3]
+
+    data = numpy.hstack((converted_data, lidar_data[["i"]].values))
+    return data.flatten().astype(numpy.float32)
+
+
+def fused(lidar_data: pandas.DataFrame, lidar_pose: Pose) -> numpy.ndarray:
+    return transform_and_pack_points(
+        lidar_data[["x", "y", "z"]].to_numpy(dtype=numpy.float64), lidar_data["i"].to_numpy(), lidar_pose.inverse()
+    )
+
+
+def measure_peak_allocation(func, lidar_data: pandas.DataFrame, pose: Pose) -> int:
+    """関数の実行中に確保したメモリのピーク[byte]を返す"""
+    tracemalloc.start()
+    func(lidar_data, pose)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def main() -> None:
+    parser = ArgumentParser()
+    parser.add_argument("--points", type=int, default=170_000, help="1フレームの点数")
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    rng = numpy.random.default_rng(0)
+    lidar_data = pandas.DataFrame(rng.uniform(-100, 100, size=(args.points, 4)), columns=["x", "y", "z", "i"])
+    pose = Pose.from_pandaset_pose(pandaset_pose)
+
+    numpy.testing.assert_allclose(fused(lidar_data, pose).flatten(), legacy(lidar_data, pose), rtol=1e-6, atol=1e-4)
+
+    frame_bytes = args.points * 3 * 8
+    for name, func in [("legacy", legacy), ("fused", fused)]:
+        elapsed = min(timeit.repeat(lambda: func(lidar_data, pose), number=1, repeat=args.repeat))
+        peak = measure_peak_allocation(func, lidar_data, pose)
+        print(
+            f"{name:>6}: {elapsed * 1000:8.2f} ms/frame, peak allocation {peak / 1024 / 1024:7.2f} MiB "
+            f"({peak / frame_bytes:.1f}x of (N,3) float64)"
+        )
+
+
+if __name__ == "__main__":
+    main()
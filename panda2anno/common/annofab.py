@@ -1,4 +1,20 @@
+import json
+import os
 import re
+import uuid
+from json.encoder import encode_basestring_ascii
+from pathlib import Path
+from typing import Any, Iterable, Iterator, Optional, Sequence
+
+import numpy
+from annofab_3dpc.annotation import ANNOTATION_TYPE_UNKNOWN
+
+from panda2anno.common.utils import is_file_content_equal
+
+_SEMSEG_ANNOTATION_ID_NAMESPACE = uuid.UUID("a7a0b51a-c6c7-5bcc-81b1-e46a86490ce0")
+"""semantic segmentationのannotation_idを生成するときの、UUID version 5の名前空間"""
+
+_ENCODED_ANNOTATION_TYPE_UNKNOWN = json.dumps(ANNOTATION_TYPE_UNKNOWN)
 
 
 def get_label_id_from_pandaset(label: str) -> str:
@@ -12,3 +28,163 @@ def get_input_data_id_from_pandaset(sequence_id: str, frame_index: int) -> str:
     pandasetのsequence_idとフレーム番号から、Annofabのinput_data_idを取得する。
     """
     return f"{sequence_id}-{str(frame_index)}"
+
+
+def get_semseg_annotation_id(input_data_id: str, class_id: int) -> str:
+    """
+    semantic segmentationのannotation_idを取得する。
+    input_data_idはsequence_idとフレーム番号から決まるので、annotation_idは(sequence_id, フレーム番号, クラスID)から一意に決まる。
+    何度変換しても同じannotation_idになるので、変換結果を比較できる。
+    """
+    return str(uuid.uuid5(_SEMSEG_ANNOTATION_ID_NAMESPACE, f"{input_data_id}/{class_id}"))
+
+
+CUBOID_SHAPE_COLUMNS = [
+    "width",
+    "height",
+    "depth",
+    "x",
+    "y",
+    "z",
+    "yaw",
+    "front.x",
+    "front.y",
+    "front.z",
+    "up.x",
+    "up.y",
+    "up.z",
+]
+"""`encode_cuboid_data`に渡す配列の列"""
+
+_CUBOID_DATA_TEMPLATE = (
+    '{"shape":{"dimensions":{"width":%r,"height":%r,"depth":%r},'
+    '"location":{"x":%r,"y":%r,"z":%r},'
+    '"rotation":{"x":0,"y":0,"z":%r},'
+    '"direction":{"front":{"x":%r,"y":%r,"z":%r},"up":{"x":%r,"y":%r,"z":%r}}},'
+    '"kind":"CUBOID","version":"2"}'
+)
+"""
+cuboidのアノテーションの`data`（JSON文字列）のテンプレート。`get_cuboid_data_dict`を`separators=(",", ":")`でJSONにしたものと同じです。
+有限のfloatの`repr`は、`json.dumps`の数値の表現と同じです。
+"""
+
+_ENCODED_CUBOID_DATA_TEMPLATE = json.dumps(_CUBOID_DATA_TEMPLATE)
+"""
+`_CUBOID_DATA_TEMPLATE`をJSONの文字列リテラルにエスケープしたもの。
+数値はエスケープが必要な文字を含まないので、値を埋め込むだけでエスケープ済の文字列になります。
+"""
+
+
+def get_cuboid_data_dict(values: Sequence[float]) -> dict[str, Any]:
+    """
+    cuboidのアノテーションの`data`を、`CuboidAnnotationDetailDataV2.to_dict()`と同じ構造のdictで取得します。
+
+    Args:
+        values: `CUBOID_SHAPE_COLUMNS`の順に並んだ値
+    """
+    width, height, depth, x, y, z, yaw, front_x, front_y, front_z, up_x, up_y, up_z = values
+    return {
+        "shape": {
+            "dimensions": {"width": width, "height": height, "depth": depth},
+            "location": {"x": x, "y": y, "z": z},
+            "rotation": {"x": 0, "y": 0, "z": yaw},
+            "direction": {
+                "front": {"x": front_x, "y": front_y, "z": front_z},
+                "up": {"x": up_x, "y": up_y, "z": up_z},
+            },
+        },
+        "kind": "CUBOID",
+        "version": "2",
+    }
+
+
+def encode_cuboid_data(values: numpy.ndarray) -> list[str]:
+    """
+    cuboidのアノテーションの`data`を、JSONの文字列リテラルにエンコードします。
+    `json.dumps(json.dumps(get_cuboid_data_dict(row), separators=(",", ":")))`と同じ文字列を、テンプレートへの埋め込みだけで生成します。
+
+    Args:
+        values: (N,13)の配列。列は`CUBOID_SHAPE_COLUMNS`
+
+    Returns:
+        cuboidごとのエンコード済の文字列
+    """
+    assert values.ndim == 2 and values.shape[1] == len(CUBOID_SHAPE_COLUMNS)
+    is_finite = numpy.isfinite(values).all(axis=1).tolist()
+    result = []
+    for row, finite in zip(values.tolist(), is_finite):
+        if finite:
+            result.append(_ENCODED_CUBOID_DATA_TEMPLATE % tuple(row))
+        else:
+            # NaNやinfは`repr`と`json.dumps`で表現が異なる
+            result.append(json.dumps(json.dumps(get_cuboid_data_dict(row), separators=(",", ":"))))
+    return result
+
+
+def _encode_value(value: Any) -> str:
+    if isinstance(value, str):
+        return encode_basestring_ascii(value)
+    return json.dumps(value)
+
+
+def encode_annotation_detail(
+    annotation_id: str, label: str, encoded_data: str, *, attributes: Optional[dict[str, Any]] = None
+) -> str:
+    """
+    1個のアノテーションを、`json.dumps`と同じ形式の文字列にエンコードします。
+
+    Args:
+        encoded_data: アノテーションの`data.data`をエンコード済の文字列。`encode_cuboid_data`の戻り値など
+        attributes: 属性。Noneなら`attributes`を出力しません。
+    """
+    chunks = ['{"annotation_id": ', _encode_value(annotation_id), ', "label": ', _encode_value(label)]
+    if attributes is not None:
+        chunks.append(', "attributes": {')
+        chunks.append(", ".join(f"{_encode_value(name)}: {_encode_value(value)}" for name, value in attributes.items()))
+        chunks.append("}")
+    chunks.extend([', "data": {"data": ', encoded_data, ', "_type": ', _ENCODED_ANNOTATION_TYPE_UNKNOWN, "}}"])
+    return "".join(chunks)
+
+
+def iter_annotation_file_chunks(encoded_details: Iterable[str]) -> Iterator[str]:
+    """アノテーションファイル（`{"details": [...]}`）の内容を、アノテーションごとに分割して返します。"""
+    yield '{"details": ['
+    for i, encoded_detail in enumerate(encoded_details):
+        if i > 0:
+            yield ", "
+        yield encoded_detail
+    yield "]}"
+
+
+def write_annotation_file(
+    output_file: Path, encoded_details: Iterable[str], *, skip_if_unchanged: bool = False
+) -> bool:
+    """
+    Annofabのアノテーションファイル（`{"details": [...]}`）を出力します。
+    `json.dump({"details": details}, f)`と同じバイト列を、アノテーションごとにファイルに書き込みます。
+    一時ファイルに書き込んでからrenameするので、書き込み途中のファイルは残りません。
+
+    Args:
+        encoded_details: `encode_annotation_detail`でエンコードしたアノテーション
+        skip_if_unchanged: Trueなら、出力先のファイルの内容が同じ場合は書き込みません。
+
+    Returns:
+        ファイルを書き込んだらTrue
+    """
+    if skip_if_unchanged:
+        encoded_details = list(encoded_details)
+        if is_file_content_equal(
+            output_file, (chunk.encode("utf-8") for chunk in iter_annotation_file_chunks(encoded_details))
+        ):
+            return False
+
+    tmp_file = output_file.with_name(f".{output_file.name}.tmp")
+    try:
+        with tmp_file.open("w", encoding="utf-8") as f:
+            for chunk in iter_annotation_file_chunks(encoded_details):
+                f.write(chunk)
+        os.replace(tmp_file, output_file)
+    except BaseException:
+        tmp_file.unlink(missing_ok=True)
+        raise
+    return True
@@ -0,0 +1,96 @@
+import logging
+import os
+import zipfile
+from pathlib import Path
+from types import TracebackType
+from typing import Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_FORMATS = ["directory", "zip"]
+"""
+アノテーションの出力形式。
+* directory: タスクごとのディレクトリに、入力データごとのJSONファイルとセグメントファイルを出力する
+* zip: ディレクトリと同じ構成のエントリを、1個のzipファイルに直接書き込む
+"""
+
+ZIP_COMPRESSIONS = {"stored": zipfile.ZIP_STORED, "deflate": zipfile.ZIP_DEFLATED}
+"""zipファイルのエントリの圧縮方式。storedは圧縮しません。"""
+
+ZIP_SCOPES = ["sequence", "dataset"]
+"""
+zipファイルの単位。
+* sequence: シーケンスごとに`{出力先ディレクトリ}/{sequence_id}.zip`を出力する
+* dataset: すべてのシーケンスを`{出力先ディレクトリ}/annotation.zip`に出力する
+"""
+
+DATASET_ARCHIVE_FILENAME = "annotation.zip"
+
+
+class AnnotationArchive:
+    """
+    Annofabのアノテーションを、1個のzipファイルに直接書き込みます。
+    エントリの構成は`{task_id}/{input_data_id}.json`、`{task_id}/{input_data_id}/{annotation_id}`で、
+    ディレクトリに出力した場合と同じです。`annofabcli annotation import`にそのまま指定できます。
+
+    エントリは一時ファイル`.{zipファイル名}.tmp`にストリームで書き込み、`close`で`zip_file`にリネームします。
+    `with`文の中で例外が発生した場合は一時ファイルを削除するので、途中までしか書き込まれていないzipファイルは出力されません。
+    その場合、既存の`zip_file`は変更しません。
+    zipファイルは毎回作り直すので、出力済のフレームをスキップする機能は使えません。
+
+    Args:
+        zip_file: 出力先のzipファイル
+        compression: `ZIP_COMPRESSIONS`のkey
+    """
+
+    def __init__(self, zip_file: Path, compression: str = "deflate") -> None:
+        if compression not in ZIP_COMPRESSIONS:
+            raise ValueError(f"{compression=}は不正な値です。{list(ZIP_COMPRESSIONS)}のいずれかを指定してください。")
+        zip_file.parent.mkdir(exist_ok=True, parents=True)
+        self.zip_file = zip_file
+        self.entry_count = 0
+        self._tmp_file = zip_file.with_name(f".{zip_file.name}.tmp")
+        self._zip = zipfile.ZipFile(self._tmp_file, mode="w", compression=ZIP_COMPRESSIONS[compression])
+
+    def write_chunks(self, arcname: str, chunks: Iterable[str]) -> None:
+        """
+        文字列を連結した内容のエントリを書き込みます。
+
+        Args:
+            arcname: zipファイル内のパス
+            chunks: エントリの内容。UTF-8でエンコードして書き込みます。
+        """
+        with self._zip.open(arcname, mode="w") as f:
+            for chunk in chunks:
+                f.write(chunk.encode("utf-8"))
+        self.entry_count += 1
+
+    def close(self) -> None:
+        """zipファイルを閉じて、一時ファイルを`zip_file`にリネームします。"""
+        try:
+            self._zip.close()
+            os.replace(self._tmp_file, self.zip_file)
+        except BaseException:
+            self._tmp_file.unlink(missing_ok=True)
+            raise
+        logger.debug(f"'{self.zip_file}'に{self.entry_count}件のエントリを書き込みました。")
+
+    def abort(self) -> None:
+        """zipファイルを閉じて、一時ファイルを削除します。`zip_file`は出力しません。"""
+        self._zip.close()
+        self._tmp_file.unlink(missing_ok=True)
+        logger.debug(f"'{self.zip_file}'の出力を中止しました。")
+
+    def __enter__(self) -> "AnnotationArchive":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
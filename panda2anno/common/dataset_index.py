@@ -0,0 +1,243 @@
+import hashlib
+import logging
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+
+import numpy
+import pandas
+from dataclasses_json import DataClassJsonMixin
+from pandaset.sequence import Sequence
+
+from panda2anno.common.frame_reader import SequenceFrameReader
+from panda2anno.common.manifest import InputFileFingerprint
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INDEX_ROOT_DIR = "~/.cache/panda2anno/index"
+"""
+インデックスのデフォルトの出力先の親ディレクトリ。環境変数`XDG_CACHE_HOME`が設定されていれば`$XDG_CACHE_HOME/panda2anno/index`。
+pandasetのディレクトリは読み取り専用や共有のマウントであることが多いので、pandasetのディレクトリには出力しない。
+"""
+
+INDEX_FILENAME = "index.json"
+
+ATTRIBUTE_COLUMN_PREFIX = "attributes."
+
+
+def get_default_index_dir(input_dir: Path) -> Path:
+    """
+    インデックスのデフォルトの出力先ディレクトリ。
+    `DEFAULT_INDEX_ROOT_DIR`の下の、pandasetのディレクトリの絶対パスから決まる名前のディレクトリを返します。
+    """
+    cache_home = os.environ.get("XDG_CACHE_HOME")
+    root_dir = Path(cache_home) / "panda2anno/index" if cache_home else Path(DEFAULT_INDEX_ROOT_DIR).expanduser()
+    resolved_input_dir = input_dir.resolve()
+    key = hashlib.sha256(str(resolved_input_dir).encode("utf-8")).hexdigest()[:16]
+    return root_dir / f"{resolved_input_dir.name}-{key}"
+
+
+@dataclass
+class FrameIndex(DataClassJsonMixin):
+    """
+    1フレーム分のアノテーションの集計結果
+
+    Args:
+        cuboid_label_counts: cuboidのlabelごとの個数
+        cuboid_attribute_counts: cuboidの属性ごとの、値ごとの個数。keyは`attributes.`を除いた列名。値が欠損している場合のkeyは`nan`
+        semseg_class_counts: semantic segmentationのクラスIDごとの点の数。keyはクラスIDの文字列
+    """
+
+    cuboid_label_counts: dict[str, int] = field(default_factory=dict)
+    cuboid_attribute_counts: dict[str, dict[str, int]] = field(default_factory=dict)
+    semseg_class_counts: dict[str, int] = field(default_factory=dict)
+
+    def get_flat_attribute_counts(self) -> dict[str, int]:
+        """cuboidの属性の値ごとの個数を、keyが`{属性名}.{値}`のdictで返します。"""
+        return {
+            f"{attribute_name}.{value}": count
+            for attribute_name, value_counts in self.cuboid_attribute_counts.items()
+            for value, count in value_counts.items()
+        }
+
+
+@dataclass
+class SequenceIndex(DataClassJsonMixin):
+    """
+    1個のシーケンスのインデックス。
+    print_*コマンドが、シーケンスのpickleファイルを読み込まずに結果を出力するために利用します。
+
+    Args:
+        sequence_id: sequence_id
+        frame_count: 点群のフレーム数
+        lidar_poses: 全フレームのLiDARのpose
+        lidar_timestamps: 全フレームのLiDARのタイムスタンプ
+        camera_timestamps: keyがカメラ名、valueが全フレームのカメラのタイムスタンプ。シーケンスに存在するカメラだけを含みます。
+        semseg_classes: semantic segmentationのクラスIDとクラス名の対応。semantic segmentationがなければNone
+        frames: フレームごとのアノテーションの集計結果
+        source_files: インデックスの作成に利用したファイルの情報。keyはシーケンスディレクトリからの相対パス
+    """
+
+    sequence_id: str
+    frame_count: int
+    lidar_poses: list[dict[str, dict[str, float]]]
+    lidar_timestamps: list[float]
+    camera_timestamps: dict[str, list[float]]
+    semseg_classes: Optional[dict[str, str]]
+    frames: list[FrameIndex]
+    source_files: dict[str, InputFileFingerprint]
+    version: str = "1"
+
+    @property
+    def camera_names(self) -> list[str]:
+        return list(self.camera_timestamps.keys())
+
+
+def _get_source_files(reader: SequenceFrameReader) -> list[Path]:
+    """インデックスの作成に利用するファイルの一覧"""
+    result = [reader.get_lidar_poses_file_path(), reader.get_lidar_timestamps_file_path()]
+    result.extend(reader.get_camera_timestamps_file_path(camera_name) for camera_name in reader.get_camera_names())
+    if reader.has_cuboids():
+        result.extend(reader.get_cuboids_file_path(index) for index in range(reader.get_cuboids_frame_count()))
+    if reader.has_semseg():
+        result.append(reader.get_semseg_classes_file_path())
+        result.extend(reader.get_semseg_file_path(index) for index in range(reader.get_semseg_frame_count()))
+    return result
+
+
+def get_source_fingerprints(reader: SequenceFrameReader) -> dict[str, InputFileFingerprint]:
+    """
+    インデックスの作成に利用するファイルの情報を取得します。ファイルは読み込まないので、すぐに終わります。
+    """
+    sequence_dir = reader.get_sequence_dir()
+    return {
+        path.relative_to(sequence_dir).as_posix(): InputFileFingerprint.from_path(path)
+        for path in _get_source_files(reader)
+    }
+
+
+def get_value_counts(series: pandas.Series) -> dict[str, int]:
+    """値ごとの個数を取得します。欠損値（NoneとNaN）は`nan`にまとめます。"""
+    value_counts = series.value_counts(dropna=False, sort=False)
+    return {str(value): int(count) for value, count in value_counts.items()}
+
+
+def create_cuboid_frame_index(cuboid_data: pandas.DataFrame) -> FrameIndex:
+    return FrameIndex(
+        cuboid_label_counts=get_value_counts(cuboid_data["label"]),
+        cuboid_attribute_counts={
+            column[len(ATTRIBUTE_COLUMN_PREFIX) :]: get_value_counts(cuboid_data[column])
+            for column in cuboid_data.columns
+            if column.startswith(ATTRIBUTE_COLUMN_PREFIX)
+        },
+    )
+
+
+def get_semseg_class_counts(semseg_data: pandas.DataFrame) -> dict[str, int]:
+    counts = numpy.bincount(semseg_data["class"].to_numpy())
+    return {str(class_id): int(counts[class_id]) for class_id in numpy.flatnonzero(counts)}
+
+
+def create_sequence_index(
+    sequence: Sequence, sequence_id: str, previous: Optional[SequenceIndex] = None
+) -> tuple[SequenceIndex, int]:
+    """
+    シーケンスのインデックスを作成します。
+
+    Args:
+        previous: 前回作成したインデックス。cuboid、semantic segmentationのファイルが前回から変わっていないフレームは、
+            ファイルを読み込まずに前回の集計結果を利用します。
+
+    Returns:
+        tuple(インデックス, 前回の集計結果を利用したフレーム数)
+    """
+    reader = SequenceFrameReader(sequence)
+    source_files = get_source_fingerprints(reader)
+    sequence_dir = reader.get_sequence_dir()
+
+    def is_unchanged(path: Path) -> bool:
+        if previous is None:
+            return False
+        key = path.relative_to(sequence_dir).as_posix()
+        return previous.source_files.get(key) == source_files[key]
+
+    cuboids_frame_count = reader.get_cuboids_frame_count() if reader.has_cuboids() else 0
+    semseg_frame_count = reader.get_semseg_frame_count() if reader.has_semseg() else 0
+    frames = []
+    reused_frame_count = 0
+    for index in range(max(cuboids_frame_count, semseg_frame_count)):
+        frame_files = []
+        if index < cuboids_frame_count:
+            frame_files.append(reader.get_cuboids_file_path(index))
+        if index < semseg_frame_count:
+            frame_files.append(reader.get_semseg_file_path(index))
+
+        if previous is not None and index < len(previous.frames) and all(is_unchanged(e) for e in frame_files):
+            frames.append(previous.frames[index])
+            reused_frame_count += 1
+            continue
+
+        frame = create_cuboid_frame_index(reader.read_cuboids(index)) if index < cuboids_frame_count else FrameIndex()
+        if index < semseg_frame_count:
+            frame.semseg_class_counts = get_semseg_class_counts(reader.read_semseg(index))
+        frames.append(frame)
+
+    sequence_index = SequenceIndex(
+        sequence_id=sequence_id,
+        frame_count=reader.get_frame_count(),
+        lidar_poses=reader.get_lidar_poses(),
+        lidar_timestamps=reader.get_lidar_timestamps(),
+        camera_timestamps={
+            camera_name: reader.get_camera_timestamps(camera_name) for camera_name in reader.get_camera_names()
+        },
+        semseg_classes=reader.get_semseg_classes() if reader.has_semseg() else None,
+        frames=frames,
+        source_files=source_files,
+    )
+    return sequence_index, reused_frame_count
+
+
+def get_index_file_path(index_dir: Path, sequence_id: str) -> Path:
+    return index_dir / sequence_id / INDEX_FILENAME
+
+
+def load_sequence_index(index_dir: Path, sequence_id: str) -> Optional[SequenceIndex]:
+    """
+    インデックスを読み込みます。インデックスが存在しない、または読み込めない場合はNoneを返します。
+    """
+    index_file = get_index_file_path(index_dir, sequence_id)
+    if not index_file.exists():
+        return None
+    try:
+        return SequenceIndex.from_json(index_file.read_text(encoding="utf-8"))
+    except Exception:
+        logger.warning(f"'{index_file}'を読み込めませんでした。", exc_info=True)
+        return None
+
+
+def save_sequence_index(index_dir: Path, sequence_index: SequenceIndex) -> Path:
+    index_file = get_index_file_path(index_dir, sequence_index.sequence_id)
+    index_file.parent.mkdir(exist_ok=True, parents=True)
+    tmp_file = index_file.with_name(f"{index_file.name}.tmp")
+    tmp_file.write_text(sequence_index.to_json(ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp_file, index_file)
+    return index_file
+
+
+def load_up_to_date_sequence_index(index_dir: Path, sequence: Sequence, sequence_id: str) -> Optional[SequenceIndex]:
+    """
+    インデックスを読み込みます。
+    インデックスが存在しない場合や、インデックスの作成後にシーケンスのファイルが変更された場合は、Noneを返します。
+    """
+    sequence_index = load_sequence_index(index_dir, sequence_id)
+    if sequence_index is None:
+        return None
+
+    if sequence_index.source_files != get_source_fingerprints(SequenceFrameReader(sequence)):
+        logger.warning(
+            f"{sequence_id=} :: インデックスの作成後にファイルが変更されているので、インデックスを利用しません。"
+            f"`panda2anno.create_dataset_index`でインデックスを更新してください。"
+        )
+        return None
+    return sequence_index
@@ -0,0 +1,241 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+import numpy
+import pandas
+
+logger = logging.getLogger(__name__)
+
+FRAME_CACHE_DIR_ENV = "PANDA2ANNO_FRAME_CACHE_DIR"
+"""フレームキャッシュのディレクトリを指定する環境変数。設定されている場合だけ、キャッシュを利用します。"""
+
+FRAME_CACHE_MAX_SIZE_MB_ENV = "PANDA2ANNO_FRAME_CACHE_MAX_SIZE_MB"
+"""フレームキャッシュの最大サイズ[MB]を指定する環境変数"""
+
+DEFAULT_FRAME_CACHE_MAX_SIZE_MB = 10240
+
+_CACHE_FORMAT_VERSION = "2"
+"""キャッシュのファイル形式のバージョン。形式を変更したら更新して、古いキャッシュを使わないようにする"""
+
+_META_FILENAME = "meta.json"
+
+
+def _get_directory_size(directory: Path) -> int:
+    return sum(e.stat().st_size for e in directory.iterdir() if e.is_file())
+
+
+class FrameCache:
+    """
+    pandasetの`*.pkl.gz`を読み込んだDataFrameを、圧縮しない列ごとのnpyファイルとして保存するキャッシュ。
+
+    2回目以降はgzipの展開とunpickleを行わず、メモリマップで読み込みます。
+    キャッシュディレクトリのファイルをunpickleしないように、すべての列とインデックスが数値型（boolを含む）のDataFrameだけを保存します。
+    文字列などのobject型や拡張型の列を含むDataFrame（cuboidなど）は、毎回元ファイルから読み込みます。
+    キャッシュのキーは、元ファイルのパス、サイズ、更新日時から決まるので、元ファイルが更新されると別のキーになります。
+    合計サイズが`max_size`を超えたら、最後に利用した日時が古いものから削除します。
+
+    Args:
+        cache_dir: キャッシュを保存するディレクトリ
+        max_size: キャッシュの合計サイズの上限[byte]
+    """
+
+    def __init__(self, cache_dir: Path, max_size: int) -> None:
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.cache_dir.mkdir(exist_ok=True, parents=True)
+        self.hit_count = 0
+        self.miss_count = 0
+        self._lock = threading.Lock()
+        self._total_size: Optional[int] = None
+
+    @staticmethod
+    def get_key(source_file: Path) -> str:
+        """元ファイルのパス、サイズ、更新日時から、キャッシュのキーを生成します。"""
+        stat = source_file.stat()
+        value = f"{_CACHE_FORMAT_VERSION}\n{source_file.resolve()}\n{stat.st_size}\n{stat.st_mtime_ns}"
+        return hashlib.sha256(value.encode("utf-8")).hexdigest()
+
+    def _get_entry_dir(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / key
+
+    def contains(self, source_file: Path) -> bool:
+        """`source_file`のキャッシュが保存されているかどうか"""
+        return (self._get_entry_dir(self.get_key(source_file)) / _META_FILENAME).exists()
+
+    def load_dataframe(self, source_file: Path, loader: Callable[[str], pandas.DataFrame]) -> pandas.DataFrame:
+        """
+        キャッシュからDataFrameを読み込みます。キャッシュになければ`loader`で読み込んで、キャッシュに保存します。
+
+        数値の列は読み取り専用のメモリマップなので、DataFrameの値を変更する場合はコピーしてください。
+
+        Args:
+            source_file: 元ファイル（`*.pkl.gz`）
+            loader: 元ファイルのパスを受け取ってDataFrameを返す関数
+        """
+        entry_dir = self._get_entry_dir(self.get_key(source_file))
+        if (entry_dir / _META_FILENAME).exists():
+            try:
+                df = self._read_entry(entry_dir)
+                # LRUで削除するために、最後に利用した日時を更新する
+                os.utime(entry_dir / _META_FILENAME)
+                self.hit_count += 1
+                return df
+            except Exception:
+                logger.warning(
+                    f"'{entry_dir}'のキャッシュを読み込めなかったので、'{source_file}'を読み込みます。", exc_info=True
+                )
+
+        self.miss_count += 1
+        df = loader(str(source_file))
+        if not self._is_cacheable(df):
+            return df
+        try:
+            self._write_entry(entry_dir, df)
+        except Exception:
+            logger.warning(f"'{source_file}'のキャッシュを保存できませんでした。", exc_info=True)
+        return df
+
+    @staticmethod
+    def _read_entry(entry_dir: Path) -> pandas.DataFrame:
+        with (entry_dir / _META_FILENAME).open(encoding="utf-8") as f:
+            meta = json.load(f)
+
+        columns = {}
+        for i, column in enumerate(meta["columns"]):
+            # numpy.memmapのサブクラスのままだと演算結果もmemmapになるので、ndarrayのビューにする
+            array = numpy.asarray(numpy.load(entry_dir / f"{i}.npy", mmap_mode="r", allow_pickle=False))
+            columns[column] = pandas.Series(array, dtype=array.dtype, copy=False)
+
+        index_meta = meta["index"]
+        if index_meta["type"] == "range":
+            index = pandas.RangeIndex(
+                index_meta["start"], index_meta["stop"], index_meta["step"], name=index_meta["name"]
+            )
+        else:
+            index = pandas.Index(numpy.load(entry_dir / "index.npy", allow_pickle=False), name=index_meta["name"])
+
+        df = pandas.DataFrame(columns, copy=False)
+        df.index = index
+        # 列名のIndexの型（objectかstrか）を元のDataFrameに合わせる
+        df.columns = pandas.Index(meta["columns"], dtype=meta["columns_dtype"])
+        return df
+
+    @staticmethod
+    def _is_cacheable(df: pandas.DataFrame) -> bool:
+        """すべての列とインデックスが数値型で、pickleを使わずにnpyファイルに保存できるかどうか"""
+        if not all(isinstance(column, str) for column in df.columns) or df.columns.has_duplicates:
+            return False
+        dtypes = [*df.dtypes, df.index.dtype]
+        return all(isinstance(dtype, numpy.dtype) and dtype.kind in "biuf" for dtype in dtypes)
+
+    def _write_entry(self, entry_dir: Path, df: pandas.DataFrame) -> None:
+        entry_dir.parent.mkdir(exist_ok=True, parents=True)
+        # 書き込み途中のキャッシュを読み込まないように、一時ディレクトリに書き込んでからrenameする
+        tmp_dir = Path(tempfile.mkdtemp(prefix=f".{entry_dir.name}.", dir=entry_dir.parent))
+        try:
+            meta: dict[str, Any] = {"columns": list(df.columns), "columns_dtype": str(df.columns.dtype)}
+            for i, column in enumerate(df.columns):
+                numpy.save(tmp_dir / f"{i}.npy", df[column].to_numpy(), allow_pickle=False)
+
+            if isinstance(df.index, pandas.RangeIndex):
+                meta["index"] = {
+                    "type": "range",
+                    "start": df.index.start,
+                    "stop": df.index.stop,
+                    "step": df.index.step,
+                    "name": df.index.name,
+                }
+            else:
+                meta["index"] = {"type": "array", "name": df.index.name}
+                numpy.save(tmp_dir / "index.npy", df.index.to_numpy(), allow_pickle=False)
+
+            with (tmp_dir / _META_FILENAME).open("w", encoding="utf-8") as f:
+                json.dump(meta, f)
+
+            entry_size = _get_directory_size(tmp_dir)
+            try:
+                os.rename(tmp_dir, entry_dir)
+            except OSError:
+                # 他のプロセスが同じキャッシュを保存済
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+                return
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+        with self._lock:
+            if self._total_size is None:
+                self._total_size = self._get_total_size()
+            else:
+                self._total_size += entry_size
+            if self._total_size > self.max_size:
+                self.evict()
+
+    def _list_entries(self) -> list[Path]:
+        return [
+            entry_dir
+            for prefix_dir in self.cache_dir.iterdir()
+            if prefix_dir.is_dir()
+            for entry_dir in prefix_dir.iterdir()
+            if (entry_dir / _META_FILENAME).exists()
+        ]
+
+    def _get_total_size(self) -> int:
+        return sum(_get_directory_size(entry_dir) for entry_dir in self._list_entries())
+
+    def evict(self) -> None:
+        """
+        キャッシュの合計サイズが上限以下になるまで、最後に利用した日時が古いものから削除します。
+        """
+        entries = []
+        for entry_dir in self._list_entries():
+            try:
+                entries.append(
+                    ((entry_dir / _META_FILENAME).stat().st_mtime_ns, _get_directory_size(entry_dir), entry_dir)
+                )
+            except FileNotFoundError:
+                # 他のプロセスが削除した
+                continue
+
+        total_size = sum(size for _, size, _ in entries)
+        deleted_count = 0
+        for _, size, entry_dir in sorted(entries, key=lambda e: e[0]):
+            if total_size <= self.max_size:
+                break
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total_size -= size
+            deleted_count += 1
+
+        self._total_size = total_size
+        if deleted_count > 0:
+            logger.debug(f"フレームキャッシュを{deleted_count}件削除しました。 :: 合計サイズ={total_size} byte")
+
+
+_default_frame_cache: Optional[FrameCache] = None
+
+
+def get_default_frame_cache() -> Optional[FrameCache]:
+    """
+    環境変数`PANDA2ANNO_FRAME_CACHE_DIR`が設定されていれば、そのディレクトリのFrameCacheを返します。
+    設定されていなければNoneを返します。
+    """
+    global _default_frame_cache
+    cache_dir = os.environ.get(FRAME_CACHE_DIR_ENV)
+    if cache_dir is None or cache_dir == "":
+        return None
+
+    max_size = int(float(os.environ.get(FRAME_CACHE_MAX_SIZE_MB_ENV, DEFAULT_FRAME_CACHE_MAX_SIZE_MB)) * 1024 * 1024)
+    if (
+        _default_frame_cache is None
+        or _default_frame_cache.cache_dir != Path(cache_dir)
+        or _default_frame_cache.max_size != max_size
+    ):
+        _default_frame_cache = FrameCache(Path(cache_dir), max_size=max_size)
+    return _default_frame_cache
@@ -0,0 +1,185 @@
+import logging
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Callable, Iterable, Iterator, Optional, TypeVar
+
+import numpy
+
+from panda2anno.common.utils import set_default_logger
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+@dataclass(frozen=True)
+class SharedArraySpec:
+    """共有メモリに格納した配列の情報"""
+
+    memory_name: str
+    shape: tuple[int, ...]
+    dtype: str
+
+
+class SharedArrays:
+    """
+    名前付きの複数のnumpy配列を、`multiprocessing.shared_memory`に格納します。
+
+    親プロセスで`put`した配列を、ワーカプロセスは`open`でコピーせずに参照します。
+    pickle化すると共有メモリの名前だけが渡されるので、点群などの大きい配列をプロセス間で渡してもpickle化のコストがかかりません。
+    共有メモリは、生成した親プロセスが`release`で解放してください。
+    """
+
+    def __init__(self) -> None:
+        self.specs: dict[str, SharedArraySpec] = {}
+        self._memories: dict[str, SharedMemory] = {}
+
+    def __getstate__(self) -> dict[str, Any]:
+        return {"specs": self.specs}
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        self.specs = state["specs"]
+        self._memories = {}
+
+    def put(self, key: str, array: numpy.ndarray) -> None:
+        """配列を共有メモリにコピーします。"""
+        # サイズ0の共有メモリは作成できない
+        memory = SharedMemory(create=True, size=max(array.nbytes, 1))
+        self._memories[key] = memory
+        self.specs[key] = SharedArraySpec(memory_name=memory.name, shape=array.shape, dtype=array.dtype.str)
+        shared_array: numpy.ndarray = numpy.ndarray(array.shape, dtype=array.dtype, buffer=memory.buf)
+        shared_array[...] = array
+        # 共有メモリをcloseできるように、参照を残さない
+        del shared_array
+
+    @contextmanager
+    def open(self) -> Iterator[dict[str, numpy.ndarray]]:
+        """
+        共有メモリの配列を参照します。
+        配列は共有メモリのビューなので、`with`文の外に持ち出す場合はコピーしてください。
+        """
+        memories = []
+        arrays: dict[str, numpy.ndarray] = {}
+        try:
+            for key, spec in self.specs.items():
+                memory = SharedMemory(name=spec.memory_name)
+                memories.append(memory)
+                arrays[key] = numpy.ndarray(spec.shape, dtype=spec.dtype, buffer=memory.buf)
+            yield arrays
+        finally:
+            arrays.clear()
+            for memory in memories:
+                memory.close()
+
+    def release(self) -> None:
+        """共有メモリを解放します。親プロセスで呼び出してください。"""
+        for memory in self._memories.values():
+            memory.close()
+            memory.unlink()
+        self._memories.clear()
+
+
+def _initialize_worker() -> None:
+    set_default_logger()
+
+
+def _get_mp_context() -> multiprocessing.context.BaseContext:
+    """
+    ワーカプロセスの開始方法を取得します。
+    forkだと、読み込みスレッドが共有メモリを作成中（resource trackerのロックを取得中）にワーカプロセスがforkされると、
+    ワーカプロセスがロックを取得できずに停止するので、forkserverかspawnを使います。
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("forkserver")
+    return multiprocessing.get_context("spawn")
+
+
+def map_frames(
+    load: Callable[[T], tuple[Any, SharedArrays]],
+    func: Callable[[Any, SharedArrays], R],
+    items: Iterable[T],
+    *,
+    workers: int,
+    max_pending: Optional[int] = None,
+) -> Iterator[tuple[Any, R]]:
+    """
+    シーケンス内のフレームを、プロセスプールで並列に処理します。
+
+    親プロセスで`load`を`workers`個のスレッドで実行してフレームを読み込み、点群などの配列を共有メモリに格納します。
+    ワーカプロセスは`func(task, shared_arrays)`で共有メモリの配列を参照して処理します。
+    結果は`items`の順番で返すので、マニフェストの記録などの処理を親プロセスで直列に行えます。
+    結果を返した後、または処理を中断した時に、共有メモリを解放します。
+
+    Args:
+        load: `items`の要素を受け取って、tuple(ワーカプロセスに渡すタスク, 共有メモリの配列)を返す関数。
+            複数のスレッドから呼び出されます。
+        func: ワーカプロセスで実行する関数。ワーカプロセスはforkserver（使えなければspawn）で開始するので、
+            importできるモジュールのトップレベルの関数を指定してください。
+            タスクと戻り値もpickle化されるので、大きいデータを含めないでください。
+        items: 処理対象。親プロセスのメインスレッドで順番に取り出します。
+        workers: ワーカプロセス数
+        max_pending: 読み込み中または処理中のフレームの数の上限。Noneなら`workers`の2倍です。
+            共有メモリの使用量は、1フレームのサイズ×`max_pending`程度に収まります。
+
+    Returns:
+        tuple(タスク, `func`の戻り値)のiterator
+    """
+    if workers < 1:
+        raise ValueError(f"workersには1以上を指定してください。 :: {workers=}")
+    if max_pending is None:
+        max_pending = workers * 2
+    if max_pending < workers:
+        raise ValueError(f"max_pendingにはworkers以上を指定してください。 :: {max_pending=}, {workers=}")
+
+    item_iterator = iter(items)
+    is_item_exhausted = False
+    # どちらも`items`の順番に並んでいる
+    loading: deque[Future] = deque()
+    processing: deque[tuple[Any, SharedArrays, Future]] = deque()
+
+    with ThreadPoolExecutor(max_workers=workers) as load_executor, ProcessPoolExecutor(
+        max_workers=workers, mp_context=_get_mp_context(), initializer=_initialize_worker
+    ) as process_executor:
+        try:
+            while True:
+                while not is_item_exhausted and len(loading) + len(processing) < max_pending:
+                    try:
+                        item = next(item_iterator)
+                    except StopIteration:
+                        is_item_exhausted = True
+                        break
+                    loading.append(load_executor.submit(load, item))
+
+                # 読み込みが終わったフレームから順に、ワーカプロセスに投入する
+                while len(loading) > 0 and len(processing) < workers:
+                    task, shared_arrays = loading.popleft().result()
+                    processing.append((task, shared_arrays, process_executor.submit(func, task, shared_arrays)))
+
+                if len(processing) > 0:
+                    task, shared_arrays, future = processing.popleft()
+                    try:
+                        result = future.result()
+                    finally:
+                        shared_arrays.release()
+                    yield task, result
+                elif is_item_exhausted and len(loading) == 0:
+                    break
+
+        finally:
+            # 例外などで中断した場合は、ワーカプロセスが共有メモリを参照し終わるのを待ってから解放する
+            for load_future in loading:
+                load_future.cancel()
+            for load_future in loading:
+                if not load_future.cancelled() and load_future.exception() is None:
+                    _, shared_arrays = load_future.result()
+                    shared_arrays.release()
+            for _, shared_arrays, future in processing:
+                future.cancel()
+                if not future.cancelled():
+                    future.exception()
+                shared_arrays.release()
@@ -0,0 +1,230 @@
+import io
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Optional
+
+import pandas
+from pandaset.sensors import Camera, Intrinsics
+from pandaset.sequence import Sequence
+from PIL import Image
+
+from panda2anno.common.frame_cache import FrameCache, get_default_frame_cache
+from panda2anno.common.manifest import InputFileFingerprint
+from panda2anno.common.utils import copy_file
+
+if TYPE_CHECKING:
+    from panda2anno.common.prefetch import FilePrefetcher
+
+
+class SequenceFrameReader:
+    """
+    pandasetのSequenceから、フレーム単位でデータを読み込みます。
+
+    `sequence.load_lidar()`や`sequence.load_camera()`はシーケンス全体のフレームを読み込むため、メモリを大量に消費します。
+    このクラスは、指定されたフレームのファイルだけを読み込みます。
+    poses.jsonなどの小さいファイルは、初回アクセス時に読み込んでキャッシュします。
+    点群、cuboid、semantic segmentationのファイルは、フレームキャッシュが有効ならフレームキャッシュを経由して読み込みます。
+    `prefetcher`を設定すると、点群などのフレームごとのファイルは、先読みしたバイト列から読み込みます。
+
+    Args:
+        sequence: pandasetのSequence。`load_*`メソッドを呼ぶ必要はありません。
+        frame_cache: フレームキャッシュ。Noneなら環境変数`PANDA2ANNO_FRAME_CACHE_DIR`で指定されたフレームキャッシュを利用します。
+    """
+
+    has_camera_image_files = True
+    """カメラ画像がファイルシステム上のファイルとして存在するかどうか。Falseならワーカプロセスにパスを渡して読み込めません。"""
+
+    supports_prefetch = True
+    """`prefetcher`を設定して、ファイルを先読みできるかどうか"""
+
+    def __init__(self, sequence: Sequence, frame_cache: Optional[FrameCache] = None) -> None:
+        self.sequence = sequence
+        self.frame_cache = frame_cache if frame_cache is not None else get_default_frame_cache()
+        self._lidar_poses: Optional[list[dict[str, Any]]] = None
+        self._lidar_timestamps: Optional[list[float]] = None
+        self._camera_poses: dict[str, list[dict[str, Any]]] = {}
+        self._camera_intrinsics: dict[str, Intrinsics] = {}
+        self._semseg_classes: Optional[dict[str, str]] = None
+        self.prefetcher: Optional["FilePrefetcher"] = None
+
+    def _get_prefetched_bytes(self, file_path: Path) -> Optional[bytes]:
+        """先読みの対象のファイルなら、先読みしたバイト列を返します。対象でなければNoneを返します。"""
+        if self.prefetcher is None or not self.prefetcher.is_target(file_path):
+            return None
+        return self.prefetcher.read_bytes(file_path)
+
+    def _load_pickle(self, file_path: str, loader: Callable[[str], pandas.DataFrame]) -> pandas.DataFrame:
+        data = self._get_prefetched_bytes(Path(file_path))
+        if data is None:
+            return loader(file_path)
+        with io.BytesIO(data) as f:
+            return pandas.read_pickle(f, compression="gzip")
+
+    def _read_dataframe(self, file_path: Path, loader: Callable[[str], pandas.DataFrame]) -> pandas.DataFrame:
+        if self.prefetcher is not None:
+            original_loader = loader
+
+            def loader(path: str) -> pandas.DataFrame:
+                return self._load_pickle(path, original_loader)
+
+        if self.frame_cache is None:
+            return loader(str(file_path))
+        return self.frame_cache.load_dataframe(file_path, loader)
+
+    def is_frame_cached(self, file_path: Path) -> bool:
+        """フレームキャッシュに保存されていて、`file_path`を読み込まずにDataFrameを取得できるかどうか"""
+        return self.frame_cache is not None and self.frame_cache.contains(file_path)
+
+    def get_input_fingerprint(self, path: Path) -> InputFileFingerprint:
+        """入力ファイルが変更されたかどうかを判定するための情報を取得します。"""
+        return InputFileFingerprint.from_path(path)
+
+    def get_sequence_dir(self) -> Path:
+        """シーケンスのディレクトリを取得します。"""
+        return Path(self.sequence._directory)
+
+    def get_frame_count(self) -> int:
+        """点群のフレーム数を取得します。"""
+        return len(self.sequence.lidar._data_structure)
+
+    def get_lidar_poses(self) -> list[dict[str, Any]]:
+        """全フレームのLiDARのposeを取得します。点群ファイルは読み込みません。"""
+        if self._lidar_poses is None:
+            lidar = self.sequence.lidar
+            lidar._load_poses()
+            self._lidar_poses = lidar.poses
+        return self._lidar_poses
+
+    def get_lidar_poses_file_path(self) -> Path:
+        return Path(self.sequence.lidar._poses_structure)
+
+    def get_lidar_timestamps(self) -> list[float]:
+        """全フレームのLiDARのタイムスタンプを取得します。"""
+        if self._lidar_timestamps is None:
+            lidar = self.sequence.lidar
+            lidar._load_timestamps()
+            self._lidar_timestamps = lidar.timestamps
+        return self._lidar_timestamps
+
+    def get_lidar_timestamps_file_path(self) -> Path:
+        return Path(self.sequence.lidar._timestamps_structure)
+
+    def get_lidar_file_path(self, index: int) -> Path:
+        """指定したフレームの点群ファイルのパスを取得します。"""
+        return Path(self.sequence.lidar._data_structure[index])
+
+    def read_lidar(self, index: int) -> pandas.DataFrame:
+        """指定したフレームの点群を読み込みます。"""
+        return self._read_dataframe(self.get_lidar_file_path(index), self.sequence.lidar._load_data_file)
+
+    def get_camera_names(self) -> list[str]:
+        """シーケンスに存在するカメラ名の一覧を取得します。"""
+        if self.sequence.camera is None:
+            return []
+        return list(self.sequence.camera.keys())
+
+    def _get_camera(self, camera_name: str) -> Camera:
+        return self.sequence.camera[camera_name]
+
+    def get_camera_poses(self, camera_name: str) -> list[dict[str, Any]]:
+        """全フレームのカメラのposeを取得します。画像ファイルは読み込みません。"""
+        if camera_name not in self._camera_poses:
+            camera = self._get_camera(camera_name)
+            camera._load_poses()
+            self._camera_poses[camera_name] = camera.poses
+        return self._camera_poses[camera_name]
+
+    def get_camera_poses_file_path(self, camera_name: str) -> Path:
+        return Path(self._get_camera(camera_name)._poses_structure)
+
+    def get_camera_timestamps(self, camera_name: str) -> list[float]:
+        """全フレームのカメラのタイムスタンプを取得します。"""
+        camera = self._get_camera(camera_name)
+        camera._load_timestamps()
+        return camera.timestamps
+
+    def get_camera_timestamps_file_path(self, camera_name: str) -> Path:
+        return Path(self._get_camera(camera_name)._timestamps_structure)
+
+    def get_camera_intrinsics_file_path(self, camera_name: str) -> Path:
+        return Path(self._get_camera(camera_name)._intrinsics_structure)
+
+    def get_camera_intrinsics(self, camera_name: str) -> Intrinsics:
+        """カメラの内部パラメータを取得します。"""
+        if camera_name not in self._camera_intrinsics:
+            camera = self._get_camera(camera_name)
+            camera._load_intrinsics()
+            self._camera_intrinsics[camera_name] = camera.intrinsics
+        return self._camera_intrinsics[camera_name]
+
+    def get_camera_image_path(self, camera_name: str, index: int) -> Path:
+        """指定したフレームのカメラ画像のパスを取得します。"""
+        return Path(self._get_camera(camera_name)._data_structure[index])
+
+    def read_camera_image(self, camera_name: str, index: int) -> Image.Image:
+        """
+        指定したフレームのカメラ画像を読み込みます。
+        ファイルハンドルを開いたままにしないように、`with`文で利用してください。
+        """
+        image_path = self.get_camera_image_path(camera_name, index)
+        data = self._get_prefetched_bytes(image_path)
+        if data is not None:
+            return Image.open(io.BytesIO(data))
+        return self._get_camera(camera_name)._load_data_file(str(image_path))
+
+    def copy_camera_image(self, camera_name: str, index: int, output_file: Path, *, hardlink: bool = False) -> None:
+        """
+        指定したフレームのカメラ画像を、デコードせずにそのまま出力します。
+
+        Args:
+            hardlink: Trueならハードリンクを作成します。作成できない場合はコピーします。
+        """
+        image_path = self.get_camera_image_path(camera_name, index)
+        data = self._get_prefetched_bytes(image_path)
+        if data is not None:
+            output_file.unlink(missing_ok=True)
+            output_file.write_bytes(data)
+            return
+        copy_file(image_path, output_file, hardlink=hardlink)
+
+    def has_cuboids(self) -> bool:
+        """シーケンスにcuboidのアノテーションが存在するかどうか"""
+        return self.sequence.cuboids is not None
+
+    def get_cuboids_frame_count(self) -> int:
+        """cuboidのファイルの数を取得します。"""
+        return len(self.sequence.cuboids._data_structure)
+
+    def get_cuboids_file_path(self, index: int) -> Path:
+        """指定したフレームのcuboidのファイルのパスを取得します。"""
+        return Path(self.sequence.cuboids._data_structure[index])
+
+    def read_cuboids(self, index: int) -> pandas.DataFrame:
+        """指定したフレームのcuboidを読み込みます。"""
+        return self._read_dataframe(self.get_cuboids_file_path(index), self.sequence.cuboids._load_data_file)
+
+    def has_semseg(self) -> bool:
+        """シーケンスにsemantic segmentationのアノテーションが存在するかどうか"""
+        return self.sequence.semseg is not None
+
+    def get_semseg_frame_count(self) -> int:
+        """semantic segmentationのファイルの数を取得します。"""
+        return len(self.sequence.semseg._data_structure)
+
+    def get_semseg_classes_file_path(self) -> Path:
+        return Path(self.sequence.semseg._classes_structure)
+
+    def get_semseg_classes(self) -> dict[str, str]:
+        """semantic segmentationのクラスIDとクラス名の対応を取得します。"""
+        if self._semseg_classes is None:
+            semseg = self.sequence.semseg
+            semseg._load_classes()
+            self._semseg_classes = semseg.classes
+        return self._semseg_classes
+
+    def get_semseg_file_path(self, index: int) -> Path:
+        """指定したフレームのsemantic segmentationのファイルのパスを取得します。"""
+        return Path(self.sequence.semseg._data_structure[index])
+
+    def read_semseg(self, index: int) -> pandas.DataFrame:
+        """指定したフレームのsemantic segmentationを読み込みます。"""
+        return self._read_dataframe(self.get_semseg_file_path(index), self.sequence.semseg._load_data_file)
@@ -0,0 +1,201 @@
+import logging
+from argparse import ArgumentParser, Namespace
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy
+from dataclasses_json import DataClassJsonMixin
+
+from panda2anno.common.frame_reader import SequenceFrameReader
+from panda2anno.common.pose import PoseArray
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MIN_TRANSLATION = 1.0
+"""`target_count`だけを指定した場合に、移動量の単位とする移動距離[m]"""
+
+DEFAULT_MIN_ROTATION = 5.0
+"""`target_count`だけを指定した場合に、移動量の単位とする回転角度[deg]"""
+
+
+def _get_rotation_angles(wxyz1: numpy.ndarray, wxyz2: numpy.ndarray) -> numpy.ndarray:
+    """2個のクォータニオンの間の回転角度[deg]"""
+    # 相対回転`q1^-1 * q2`から求める。arccosは回転角度が小さいと誤差が大きいので、arctan2を使う
+    w1, v1 = wxyz1[..., :1], wxyz1[..., 1:]
+    w2, v2 = wxyz2[..., :1], wxyz2[..., 1:]
+    w = numpy.abs(numpy.sum(wxyz1 * wxyz2, axis=-1))
+    v = numpy.linalg.norm(w1 * v2 - w2 * v1 - numpy.cross(v1, v2), axis=-1)
+    return numpy.degrees(2.0 * numpy.arctan2(v, w))
+
+
+@dataclass(frozen=True)
+class FrameSampler(DataClassJsonMixin):
+    """
+    変換するフレーム（キーフレーム）を選ぶ条件。
+    すべての変換で同じ条件を使うので、拡張KITTI形式の`id_list`と、cuboid、semsegのアノテーションのフレームは一致します。
+
+    `min_translation`、`min_rotation`、`target_count`のいずれかを指定すると、LiDARのpose（`lidar/poses.json`）だけを読み込んで、
+    自車の移動量でフレームを選びます。停車中の似たフレームは選ばず、高速で移動している区間のフレームは多く選びます。
+    点群ファイルは読み込みません。
+
+    Args:
+        sampling_step: 指定した値ごとにフレームを選びます。
+        min_translation: 前のキーフレームからの移動距離[m]がこの値以上になったフレームを選びます。
+        min_rotation: 前のキーフレームからの回転角度[deg]がこの値以上になったフレームを選びます。
+        target_count: 選ぶフレームの数。自車の移動量が等間隔になるようにフレームを選びます。
+            `min_translation`、`min_rotation`を指定した場合は、その値を移動量の単位にします。
+    """
+
+    sampling_step: int = 1
+    min_translation: Optional[float] = None
+    min_rotation: Optional[float] = None
+    target_count: Optional[int] = None
+
+    def __post_init__(self) -> None:
+        if self.sampling_step < 1:
+            raise ValueError(f"sampling_stepには1以上を指定してください。 :: {self.sampling_step=}")
+        if self.min_translation is not None and self.min_translation <= 0:
+            raise ValueError(f"min_translationには正の値を指定してください。 :: {self.min_translation=}")
+        if self.min_rotation is not None and self.min_rotation <= 0:
+            raise ValueError(f"min_rotationには正の値を指定してください。 :: {self.min_rotation=}")
+        if self.target_count is not None and self.target_count < 1:
+            raise ValueError(f"target_countには1以上を指定してください。 :: {self.target_count=}")
+        if self.is_motion_based() and self.sampling_step != 1:
+            raise ValueError("sampling_stepと、min_translation、min_rotation、target_countは同時に指定できません。")
+
+    def is_motion_based(self) -> bool:
+        """自車の移動量でフレームを選ぶかどうか"""
+        return self.min_translation is not None or self.min_rotation is not None or self.target_count is not None
+
+    def _get_thresholds(self) -> tuple[Optional[float], Optional[float]]:
+        if self.min_translation is None and self.min_rotation is None:
+            return DEFAULT_MIN_TRANSLATION, DEFAULT_MIN_ROTATION
+        return self.min_translation, self.min_rotation
+
+    def get_motions(
+        self, wxyz1: numpy.ndarray, tvec1: numpy.ndarray, wxyz2: numpy.ndarray, tvec2: numpy.ndarray
+    ) -> numpy.ndarray:
+        """
+        poseの間の移動量を、閾値を1とした値で返します。移動距離と回転角度のうち、大きい方の値です。
+
+        Args:
+            wxyz1: (N,4)または(4,)の移動前のクォータニオン
+            tvec1: (N,3)または(3,)の移動前の位置
+            wxyz2: (N,4)の移動後のクォータニオン
+            tvec2: (N,3)の移動後の位置
+
+        Returns:
+            (N,)の移動量
+        """
+        min_translation, min_rotation = self._get_thresholds()
+        result = numpy.zeros(len(tvec2))
+        if min_translation is not None:
+            result = numpy.maximum(result, numpy.linalg.norm(tvec2 - tvec1, axis=-1) / min_translation)
+        if min_rotation is not None:
+            result = numpy.maximum(result, _get_rotation_angles(wxyz1, wxyz2) / min_rotation)
+        return result
+
+    def _select_by_threshold(self, poses: PoseArray) -> list[int]:
+        result = [0]
+        while True:
+            last_index = result[-1]
+            next_index = last_index + 1
+            motions = self.get_motions(
+                poses.wxyz[last_index], poses.tvec[last_index], poses.wxyz[next_index:], poses.tvec[next_index:]
+            )
+            (over_indices,) = numpy.nonzero(motions >= 1.0)
+            if len(over_indices) == 0:
+                return result
+            result.append(next_index + int(over_indices[0]))
+
+    def _select_by_count(self, poses: PoseArray, target_count: int) -> list[int]:
+        frame_count = len(poses)
+        target_count = min(target_count, frame_count)
+        step_motions = self.get_motions(poses.wxyz[:-1], poses.tvec[:-1], poses.wxyz[1:], poses.tvec[1:])
+        cumulative_motions = numpy.concatenate([[0.0], numpy.cumsum(step_motions)])
+        total_motion = float(cumulative_motions[-1])
+        if total_motion == 0:
+            # 移動していない場合は、フレームの間隔が等しくなるように選ぶ
+            cumulative_motions = numpy.arange(frame_count, dtype=numpy.float64)
+            total_motion = float(frame_count)
+
+        # 累積の移動量が等間隔になるフレームを選ぶ
+        positions = numpy.arange(target_count) * (total_motion / target_count)
+        selected = {int(e) for e in numpy.searchsorted(cumulative_motions, positions, side="left")}
+
+        # 1フレームで大きく移動した場合は重複するので、フレームの間隔が最も大きい区間を分割して補う
+        while len(selected) < target_count:
+            boundaries = sorted(selected) + [frame_count]
+            gaps = numpy.diff(boundaries)
+            gap_index = int(numpy.argmax(gaps))
+            selected.add(boundaries[gap_index] + int(gaps[gap_index]) // 2)
+        return sorted(selected)
+
+    def select_keyframes(self, poses: PoseArray) -> list[int]:
+        """
+        自車の移動量でキーフレームを選びます。最初のフレームは必ず選びます。
+
+        Args:
+            poses: 全フレームのLiDARのpose
+
+        Returns:
+            キーフレームの番号。昇順です。
+        """
+        if len(poses) == 0:
+            return []
+        if self.target_count is not None:
+            return self._select_by_count(poses, self.target_count)
+        return self._select_by_threshold(poses)
+
+    def select_frames(self, reader: SequenceFrameReader) -> list[int]:
+        """
+        変換するフレームの番号を、昇順で返します。
+        自車の移動量で選ぶ場合も、読み込むのは`lidar/poses.json`だけです。
+        """
+        frame_count = reader.get_frame_count()
+        if not self.is_motion_based():
+            return list(range(0, frame_count, self.sampling_step))
+
+        result = self.select_keyframes(PoseArray.from_pandaset_poses(reader.get_lidar_poses()[:frame_count]))
+        logger.debug(f"自車の移動量で、{frame_count}件中{len(result)}件のフレームを選びました。 :: {self}")
+        return result
+
+
+def add_frame_sampler_arguments(parser: ArgumentParser) -> None:
+    """
+    変換するフレームを選ぶ条件の引数（`--sampling_step`、`--min_translation`、`--min_rotation`、`--target_frame_count`）を追加します。
+    """
+    parser.add_argument(
+        "--sampling_step", type=int, default=1, required=False, help="指定した値ごとにフレームを出力します。"
+    )
+    parser.add_argument(
+        "--min_translation",
+        type=float,
+        required=False,
+        help="前に出力したフレームからの自車の移動距離[m]がこの値以上になったフレームを出力します。"
+        "`lidar/poses.json`だけを読み込んでフレームを選ぶので、点群ファイルは読み込みません。`--sampling_step`とは同時に指定できません。",
+    )
+    parser.add_argument(
+        "--min_rotation",
+        type=float,
+        required=False,
+        help="前に出力したフレームからの自車の回転角度[deg]がこの値以上になったフレームを出力します。"
+        "`--sampling_step`とは同時に指定できません。",
+    )
+    parser.add_argument(
+        "--target_frame_count",
+        type=int,
+        required=False,
+        help="シーケンスごとに出力するフレームの数。自車の移動量が等間隔になるようにフレームを選びます。"
+        "`--min_translation`、`--min_rotation`を指定した場合は、その値を移動量の単位にします。`--sampling_step`とは同時に指定できません。",
+    )
+
+
+def create_frame_sampler_from_args(args: Namespace) -> FrameSampler:
+    """`add_frame_sampler_arguments`で追加した引数から、`FrameSampler`を生成します。"""
+    return FrameSampler(
+        sampling_step=args.sampling_step,
+        min_translation=args.min_translation,
+        min_rotation=args.min_rotation,
+        target_count=args.target_frame_count,
+    )
@@ -43,7 +43,12 @@ class CameraViewSettings(DataClassJsonMixin):
 
 @dataclass(frozen=True)
 class KittiImageSeries(Series):
-    image_dir: str
+    """
+    Args:
+        image_dir: カメラ画像のディレクトリ。カメラ画像を出力しない場合はNoneで、`scene.meta`には出力しません。
+    """
+
+    image_dir: Optional[str] = None
     calib_dir: Optional[str] = None
     camera_view_setting: Optional[CameraViewSettings] = None
     display_name: Optional[str] = None
@@ -109,7 +114,8 @@ class Scene(DataClassJsonMixin):
 
         def convert_image(image: KittiImageSeries) -> KittiImageSeries:
             calib_dir = convert_path(image.calib_dir) if image.calib_dir is not None else None
-            return replace(image, image_dir=convert_path(image.image_dir), calib_dir=calib_dir)
+            image_dir = convert_path(image.image_dir) if image.image_dir is not None else None
+            return replace(image, image_dir=image_dir, calib_dir=calib_dir)
 
         def convert_label(label: KittiLabelSeries) -> KittiLabelSeries:
             return replace(
@@ -139,12 +145,20 @@ class Scene(DataClassJsonMixin):
         result = cls.from_dict(series_dict)
         return result
 
+    @staticmethod
+    def _encode_image(image: KittiImageSeries) -> dict:
+        image_dict = image.to_dict()
+        if image.image_dir is None:
+            # 存在しないディレクトリを参照しないように、カメラ画像を出力しない場合はキーごと出力しない
+            del image_dict["image_dir"]
+        return image_dict
+
     def encode(self, json_str: str):
         serieses = (
             [
                 self.velodyne.to_dict(),
             ]
-            + [e.to_dict() for e in self.images]
+            + [self._encode_image(e) for e in self.images]
             + [e.to_dict() for e in self.labels]
         )
         scene_dict = {"id_list": self.id_list, "serieses": serieses}
@@ -0,0 +1,288 @@
+import json
+import logging
+import os
+import threading
+from argparse import ArgumentParser
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Collection, Optional
+
+from dataclasses_json import DataClassJsonMixin
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILENAME = ".panda2anno_manifest"
+"""
+マニフェストファイルの名前。
+`annofabcli annotation import`が読み込むJSONファイルと区別できるように、拡張子を付けない。
+"""
+
+MANIFEST_JOURNAL_FILENAME = f"{MANIFEST_FILENAME}.journal"
+"""
+`compact`するまでの間、記録したフレームを1行ずつ追記するファイル。
+異常終了した場合は、次回マニフェストファイルを読み込むときに反映します。
+"""
+
+MANIFEST_VERSION = "2"
+
+
+def _normalize_parameters(parameters: dict[str, Any]) -> dict[str, Any]:
+    """
+    マニフェストファイルから読み込んだ値と比較できるように、JSONに変換して戻します。（tupleをlistに変換するなど）
+    """
+    return json.loads(json.dumps(parameters))
+
+
+@dataclass(frozen=True)
+class InputFileFingerprint(DataClassJsonMixin):
+    """入力ファイルが変更されたかどうかを判定するための情報"""
+
+    size: int
+    mtime_ns: int
+
+    @classmethod
+    def from_path(cls, path: Path) -> "InputFileFingerprint":
+        stat = path.stat()
+        return cls(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+
+
+@dataclass(frozen=True)
+class OutputFileFingerprint(DataClassJsonMixin):
+    """出力ファイルが変更または削除されたかどうかを判定するための情報"""
+
+    size: int
+    mtime_ns: int
+
+    @classmethod
+    def from_path(cls, path: Path) -> "OutputFileFingerprint":
+        stat = path.stat()
+        return cls(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+
+
+@dataclass
+class FrameManifest(DataClassJsonMixin):
+    """
+    1フレーム分の出力の記録
+
+    Args:
+        parameters: フレームの出力内容に影響する変換パラメータ
+        inputs: 入力ファイルの情報。keyはシーケンスディレクトリからの相対パス
+        outputs: 出力ファイルの情報。keyは出力先ディレクトリからの相対パス
+    """
+
+    parameters: dict[str, Any]
+    inputs: dict[str, InputFileFingerprint]
+    outputs: dict[str, OutputFileFingerprint]
+
+
+@dataclass
+class OutputManifest(DataClassJsonMixin):
+    """
+    出力先ディレクトリに出力したファイルの記録
+
+    Args:
+        parameters: 最後に実行したときの変換パラメータ（`sampling_step`など）
+        frames: フレームごとの出力の記録。keyはinput_data_id
+    """
+
+    parameters: dict[str, Any] = field(default_factory=dict)
+    frames: dict[str, FrameManifest] = field(default_factory=dict)
+    version: str = MANIFEST_VERSION
+
+
+class ManifestRecorder:
+    """
+    出力先ディレクトリのマニフェストを読み書きして、出力済のフレームの変換をスキップできるようにします。
+
+    入力ファイルのサイズと更新日時、変換パラメータが前回と同じで、出力ファイルのサイズと更新日時も記録した時から変わっていなければ、
+    そのフレームは出力済とみなします。
+    フレームの単位で記録するので、`sampling_step`だけを変えて実行した場合も、前回と重複するフレームは再利用できます。
+
+    `record_frame`はフレームを`MANIFEST_JOURNAL_FILENAME`に1行ずつ追記するだけなので、フレーム数に比例した時間で記録できます。
+    すべてのフレームを出力した後に`compact`を呼び出して、マニフェストファイルにまとめてください。
+    `compact`に今回のフレームを渡すと、前回だけ出力したフレームのファイルを削除します。
+
+    Args:
+        output_dir: シーケンスの出力先ディレクトリ
+        sequence_dir: pandasetのシーケンスのディレクトリ
+        parameters: シーケンス全体の変換パラメータ
+        force: Trueなら、マニフェストの内容に関わらずすべてのフレームを変換します。
+        get_input_fingerprint: 入力ファイルの情報を取得する関数。zipファイル内のファイルなど、statできない入力ファイルの場合に指定します。
+    """
+
+    def __init__(
+        self,
+        output_dir: Path,
+        sequence_dir: Path,
+        parameters: dict[str, Any],
+        *,
+        force: bool = False,
+        get_input_fingerprint: Callable[[Path], InputFileFingerprint] = InputFileFingerprint.from_path,
+    ):
+        self.output_dir = output_dir
+        self.sequence_dir = sequence_dir
+        self.force = force
+        self._get_input_fingerprint = get_input_fingerprint
+        self.manifest = self._load(output_dir / MANIFEST_FILENAME)
+        self._journal_file = output_dir / MANIFEST_JOURNAL_FILENAME
+        self._replay_journal()
+        parameters = _normalize_parameters(parameters)
+        if len(self.manifest.frames) > 0 and self.manifest.parameters != parameters:
+            logger.debug(f"変換パラメータが前回と異なります。 :: 前回={self.manifest.parameters}, 今回={parameters}")
+        self.manifest.parameters = parameters
+
+        self._fingerprint_cache: dict[Path, InputFileFingerprint] = {}
+        self.skipped_frame_count = 0
+        # 複数のスレッドから`record_frame`を呼び出せるようにする
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _load(manifest_file: Path) -> OutputManifest:
+        if not manifest_file.exists():
+            return OutputManifest()
+        try:
+            manifest_dict = json.loads(manifest_file.read_text(encoding="utf-8"))
+            if manifest_dict.get("version") != MANIFEST_VERSION:
+                logger.info(f"'{manifest_file}'は古い形式なので、すべてのフレームを変換します。")
+                return OutputManifest()
+            return OutputManifest.from_dict(manifest_dict)
+        except Exception:
+            logger.warning(f"'{manifest_file}'を読み込めなかったので、すべてのフレームを変換します。", exc_info=True)
+            return OutputManifest()
+
+    def _replay_journal(self) -> None:
+        """前回`compact`せずに終了した場合に、ジャーナルファイルに追記されたフレームをマニフェストに反映します。"""
+        if not self._journal_file.exists():
+            return
+        with self._journal_file.open(encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    self.manifest.frames[entry["frame_id"]] = FrameManifest.from_dict(entry["frame"])
+                except Exception:
+                    # 異常終了して、最後の行が途中までしか書き込まれていない場合など
+                    logger.debug(f"'{self._journal_file}'の途中から読み込めませんでした。", exc_info=True)
+                    break
+
+    def _get_input_fingerprints(self, input_files: list[Path]) -> dict[str, InputFileFingerprint]:
+        result = {}
+        for path in input_files:
+            fingerprint = self._fingerprint_cache.get(path)
+            if fingerprint is None:
+                # poses.jsonなど、複数のフレームで共通のファイルは1回だけstatする
+                fingerprint = self._get_input_fingerprint(path)
+                self._fingerprint_cache[path] = fingerprint
+            result[path.relative_to(self.sequence_dir).as_posix()] = fingerprint
+        return result
+
+    def is_frame_up_to_date(
+        self, frame_id: str, input_files: list[Path], parameters: dict[str, Any], *, count_skipped: bool = True
+    ) -> bool:
+        """
+        フレームが出力済で、入力ファイルと変換パラメータが前回から変わっていなければTrueを返します。
+
+        Args:
+            count_skipped: Trueなら、出力済のフレームを`skipped_frame_count`に数えます。
+                変換の前に、出力するフレームを調べるだけの場合はFalseを指定します。
+        """
+        if self.force:
+            return False
+
+        frame = self.manifest.frames.get(frame_id)
+        if frame is None or frame.parameters != _normalize_parameters(parameters):
+            return False
+
+        if frame.inputs != self._get_input_fingerprints(input_files):
+            return False
+
+        for relative_path, output in frame.outputs.items():
+            output_file = self.output_dir / relative_path
+            if not output_file.exists() or OutputFileFingerprint.from_path(output_file) != output:
+                return False
+
+        if count_skipped:
+            self.skipped_frame_count += 1
+        return True
+
+    def get_previous_output_files(self, frame_id: str) -> list[Path]:
+        """前回出力したフレームのファイルを取得します。"""
+        frame = self.manifest.frames.get(frame_id)
+        if frame is None:
+            return []
+        return [self.output_dir / relative_path for relative_path in frame.outputs]
+
+    def record_frame(
+        self, frame_id: str, input_files: list[Path], output_files: list[Path], parameters: dict[str, Any]
+    ) -> None:
+        """
+        出力したフレームを記録して、ジャーナルファイルに追記します。
+        前回出力したファイルのうち、今回出力しなかったファイルは削除します。
+        """
+        output_file_set = set(output_files)
+        for previous_output_file in self.get_previous_output_files(frame_id):
+            if previous_output_file not in output_file_set:
+                previous_output_file.unlink(missing_ok=True)
+
+        frame_manifest = FrameManifest(
+            parameters=_normalize_parameters(parameters),
+            inputs=self._get_input_fingerprints(input_files),
+            outputs={
+                output_file.relative_to(self.output_dir).as_posix(): OutputFileFingerprint.from_path(output_file)
+                for output_file in output_files
+            },
+        )
+        line = json.dumps({"frame_id": frame_id, "frame": frame_manifest.to_dict()}, ensure_ascii=False)
+        with self._lock:
+            self.manifest.frames[frame_id] = frame_manifest
+            # 途中で異常終了しても、そこまでの変換結果を再利用できるように、フレームごとに追記する
+            self.output_dir.mkdir(exist_ok=True, parents=True)
+            with self._journal_file.open("a", encoding="utf-8") as f:
+                f.write(f"{line}\n")
+
+    def save(self) -> None:
+        self.output_dir.mkdir(exist_ok=True, parents=True)
+        manifest_file = self.output_dir / MANIFEST_FILENAME
+        tmp_file = manifest_file.with_name(f"{manifest_file.name}.tmp")
+        tmp_file.write_text(self.manifest.to_json(ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp_file, manifest_file)
+
+    def _remove_frame_outputs(self, frame_id: str) -> None:
+        """フレームの出力ファイルを削除して、マニフェストから削除します。空になったディレクトリも削除します。"""
+        frame = self.manifest.frames.pop(frame_id)
+        for relative_path in frame.outputs:
+            output_file = self.output_dir / relative_path
+            output_file.unlink(missing_ok=True)
+            parent_dir = output_file.parent
+            while parent_dir != self.output_dir and parent_dir.is_dir() and not any(parent_dir.iterdir()):
+                parent_dir.rmdir()
+                parent_dir = parent_dir.parent
+
+    def compact(self, frame_ids: Optional[Collection[str]] = None) -> None:
+        """
+        ジャーナルファイルに追記したフレームをマニフェストファイルに保存して、ジャーナルファイルを削除します。
+
+        Args:
+            frame_ids: 今回出力の対象にしたフレーム。指定した場合は、それ以外のフレームの出力ファイルを削除して、マニフェストからも削除します。
+                `sampling_step`などを変えて実行した場合に、前回だけ出力したフレームのファイルが残らないようにします。
+        """
+        with self._lock:
+            frame_id_set = set(frame_ids) if frame_ids is not None else None
+            stale_frame_ids = [] if frame_id_set is None else [e for e in self.manifest.frames if e not in frame_id_set]
+            for frame_id in stale_frame_ids:
+                self._remove_frame_outputs(frame_id)
+            if len(stale_frame_ids) > 0:
+                logger.info(f"出力の対象でなくなった{len(stale_frame_ids)}件のフレームのファイルを削除しました。")
+
+            if not self._journal_file.exists() and len(stale_frame_ids) == 0:
+                return
+            self.save()
+            self._journal_file.unlink(missing_ok=True)
+
+
+def add_force_argument(parser: ArgumentParser) -> None:
+    """出力済のフレームをスキップしない`--force`引数を追加します。"""
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="出力済のフレームも変換し直します。指定しない場合は、入力ファイルと変換パラメータが前回から変わっていないフレームをスキップします。",
+    )
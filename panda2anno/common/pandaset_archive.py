@@ -0,0 +1,342 @@
+import calendar
+import io
+import json
+import logging
+import os
+import re
+import threading
+import zipfile
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Optional, Union
+
+import pandas
+from pandaset import DataSet
+from pandaset.sensors import Intrinsics
+from pandaset.sequence import Sequence
+from PIL import Image
+
+from panda2anno.common.frame_reader import SequenceFrameReader
+from panda2anno.common.manifest import InputFileFingerprint
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_CACHE_SIZE_MB_ENV = "PANDA2ANNO_ARCHIVE_CACHE_SIZE_MB"
+"""zipファイルから読み込んだファイルをメモリにキャッシュするサイズの上限[MB]を指定する環境変数"""
+
+DEFAULT_ARCHIVE_CACHE_SIZE_MB = 64
+
+_SEQUENCE_MARKER_PATTERN = re.compile(r"^(?P<sequence_dir>(?:.*/)?(?P<sequence_id>[^/]+))/lidar/poses\.json$")
+"""シーケンスのディレクトリを探すためのパターン。すべてのシーケンスに`lidar/poses.json`が存在する"""
+
+
+def _get_default_cache_size() -> int:
+    return int(float(os.environ.get(ARCHIVE_CACHE_SIZE_MB_ENV, DEFAULT_ARCHIVE_CACHE_SIZE_MB)) * 1024 * 1024)
+
+
+class PandasetArchive:
+    """
+    pandasetの配布用のzipファイルを、展開せずに読み込みます。
+    pandasetの`DataSet`と同じく、`sequences()`でsequence_idの一覧を、`archive[sequence_id]`でシーケンスを取得できます。
+
+    zipファイル内のファイルは、必要になった時に1個ずつランダムアクセスで読み込みます。
+    読み込んだファイル（zipの展開後のバイト列）は、サイズに上限のあるLRUキャッシュに保持します。
+
+    Args:
+        zip_file: pandasetのzipファイル。zipファイル内のディレクトリの構成は、`{sequence_id}/lidar/00.pkl.gz`のように
+            pandasetのディレクトリと同じです。シーケンスのディレクトリより上に、ディレクトリがあっても構いません。
+        cache_size: キャッシュのサイズの上限[byte]。Noneなら環境変数`PANDA2ANNO_ARCHIVE_CACHE_SIZE_MB`の値（デフォルトは64MB）
+    """
+
+    def __init__(self, zip_file: Path, cache_size: Optional[int] = None) -> None:
+        self.zip_file = zip_file
+        self.cache_size = cache_size if cache_size is not None else _get_default_cache_size()
+        self.hit_count = 0
+        self.miss_count = 0
+        self._zip = zipfile.ZipFile(zip_file, mode="r")
+        self._cache: OrderedDict[str, bytes] = OrderedDict()
+        self._cache_bytes = 0
+        self._lock = threading.Lock()
+        self._sequences = self._load_sequences()
+        logger.debug(f"'{zip_file}'に{len(self._sequences)}件のシーケンスが含まれています。")
+
+    def _load_sequences(self) -> dict[str, "ArchiveSequence"]:
+        names = self._zip.namelist()
+        sequence_dirs: dict[str, str] = {}
+        for name in names:
+            match = _SEQUENCE_MARKER_PATTERN.match(name)
+            if match is not None:
+                sequence_dirs[f"{match.group('sequence_dir')}/"] = match.group("sequence_id")
+
+        sequence_member_names: dict[str, list[str]] = {sequence_id: [] for sequence_id in sequence_dirs.values()}
+        for name in names:
+            if name.endswith("/"):
+                continue
+            # 先頭から1階層ずつ、シーケンスのディレクトリかどうかを判定する
+            position = name.find("/")
+            while position >= 0:
+                sequence_id = sequence_dirs.get(name[: position + 1])
+                if sequence_id is not None:
+                    sequence_member_names[sequence_id].append(name)
+                    break
+                position = name.find("/", position + 1)
+
+        return {
+            sequence_id: ArchiveSequence(self, sequence_dir.rstrip("/"), sequence_member_names[sequence_id])
+            for sequence_dir, sequence_id in sorted(sequence_dirs.items(), key=lambda e: e[1])
+        }
+
+    def sequences(self) -> list[str]:
+        """sequence_idの一覧を取得します。"""
+        return list(self._sequences.keys())
+
+    def __getitem__(self, sequence_id: str) -> "ArchiveSequence":
+        return self._sequences[sequence_id]
+
+    def unload(self, sequence_id: str) -> None:
+        """pandasetの`DataSet.unload`と同じインターフェース。シーケンスのデータは保持しないので、何もしません。"""
+
+    def get_path(self, name: str) -> Path:
+        """zipファイル内のファイルを表すパスを取得します。ファイルシステム上には存在しないパスです。"""
+        return self.zip_file / name
+
+    def get_name(self, path: Path) -> str:
+        """`get_path`で取得したパスから、zipファイル内の名前を取得します。"""
+        return path.relative_to(self.zip_file).as_posix()
+
+    def get_fingerprint(self, name: str) -> InputFileFingerprint:
+        """zipファイル内のファイルのサイズと更新日時を取得します。ファイルの内容は読み込みません。"""
+        info = self._zip.getinfo(name)
+        mtime = calendar.timegm((*info.date_time, 0, 0, 0))
+        return InputFileFingerprint(size=info.file_size, mtime_ns=mtime * 1_000_000_000)
+
+    def read_bytes(self, name: str) -> bytes:
+        """
+        zipファイル内のファイルを読み込みます。キャッシュにあれば、zipファイルを読み込みません。
+        複数のスレッドから呼び出せます。
+        """
+        with self._lock:
+            data = self._cache.get(name)
+            if data is not None:
+                self._cache.move_to_end(name)
+                self.hit_count += 1
+                return data
+            self.miss_count += 1
+
+        # zipの展開はロックの外で行い、他のスレッドの読み込みを待たせない
+        data = self._zip.read(name)
+
+        with self._lock:
+            if len(data) <= self.cache_size and name not in self._cache:
+                self._cache[name] = data
+                self._cache_bytes += len(data)
+                while self._cache_bytes > self.cache_size:
+                    _, evicted_data = self._cache.popitem(last=False)
+                    self._cache_bytes -= len(evicted_data)
+        return data
+
+    def read_json(self, name: str) -> Any:
+        return json.loads(self.read_bytes(name))
+
+    def close(self) -> None:
+        self._zip.close()
+        with self._lock:
+            self._cache.clear()
+            self._cache_bytes = 0
+
+
+class ArchiveSequence:
+    """
+    zipファイル内の1個のシーケンス。ファイルの一覧だけを保持し、ファイルは`ArchiveSequenceFrameReader`で読み込みます。
+
+    Args:
+        archive: zipファイル
+        directory: zipファイル内のシーケンスのディレクトリ
+        member_names: シーケンスのディレクトリに含まれるファイルの名前
+    """
+
+    def __init__(self, archive: PandasetArchive, directory: str, member_names: list[str]) -> None:
+        self.archive = archive
+        self.directory = directory
+        self._member_names = set(member_names)
+        self.lidar_files = self._list_files("lidar", ".pkl.gz")
+        self.camera_files = {
+            camera_name: self._list_files(f"camera/{camera_name}", ".jpg")
+            for camera_name in sorted(
+                {e.split("/")[1] for e in self._get_relative_names() if e.startswith("camera/") and e.count("/") == 2}
+            )
+        }
+        self.cuboid_files = self._list_files("annotations/cuboids", ".pkl.gz")
+        self.semseg_files = self._list_files("annotations/semseg", ".pkl.gz")
+
+    def _get_relative_names(self) -> list[str]:
+        return [e[len(self.directory) + 1 :] for e in self._member_names]
+
+    def _list_files(self, sensor_dir: str, extension: str) -> list[str]:
+        # pandasetの`sorted(glob.glob(...))`と同じ順番にする
+        prefix = f"{self.directory}/{sensor_dir}/"
+        return sorted(
+            e
+            for e in self._member_names
+            if e.startswith(prefix) and e.endswith(extension) and "/" not in e[len(prefix) :]
+        )
+
+    def get_member_name(self, relative_name: str) -> str:
+        """シーケンスのディレクトリからの相対パスから、zipファイル内の名前を取得します。"""
+        return f"{self.directory}/{relative_name}"
+
+    def has_member(self, relative_name: str) -> bool:
+        return self.get_member_name(relative_name) in self._member_names
+
+
+class ArchiveSequenceFrameReader(SequenceFrameReader):
+    """
+    zipファイル内のシーケンスから、フレーム単位でデータを読み込みます。`SequenceFrameReader`と同じインターフェースです。
+
+    ファイルのパスは`{zipファイル}/{zipファイル内の名前}`で表します。ファイルシステム上には存在しないので、
+    ファイルの情報は`get_input_fingerprint`で、カメラ画像のコピーは`copy_camera_image`で取得してください。
+    フレームキャッシュは利用せず、`PandasetArchive`のキャッシュを利用します。
+    """
+
+    has_camera_image_files = False
+    # PandasetArchiveのキャッシュから読み込むので、先読みしない
+    supports_prefetch = False
+
+    def __init__(self, sequence: ArchiveSequence) -> None:
+        super().__init__(sequence, frame_cache=None)
+        self.archive_sequence = sequence
+        self.archive = sequence.archive
+        # pandasetのSequenceではないので、フレームキャッシュは利用しない
+        self.frame_cache = None
+
+    def _read_pickle(self, path: Path) -> pandas.DataFrame:
+        with io.BytesIO(self.archive.read_bytes(self.archive.get_name(path))) as f:
+            return pandas.read_pickle(f, compression="gzip")
+
+    def _read_json(self, relative_name: str) -> Any:
+        return self.archive.read_json(self.archive_sequence.get_member_name(relative_name))
+
+    def _get_path(self, relative_name: str) -> Path:
+        return self.archive.get_path(self.archive_sequence.get_member_name(relative_name))
+
+    def get_input_fingerprint(self, path: Path) -> InputFileFingerprint:
+        return self.archive.get_fingerprint(self.archive.get_name(path))
+
+    def get_sequence_dir(self) -> Path:
+        return self.archive.get_path(self.archive_sequence.directory)
+
+    def get_frame_count(self) -> int:
+        return len(self.archive_sequence.lidar_files)
+
+    def get_lidar_poses(self) -> list[dict[str, Any]]:
+        if self._lidar_poses is None:
+            self._lidar_poses = list(self._read_json("lidar/poses.json"))
+        return self._lidar_poses
+
+    def get_lidar_poses_file_path(self) -> Path:
+        return self._get_path("lidar/poses.json")
+
+    def get_lidar_timestamps(self) -> list[float]:
+        if self._lidar_timestamps is None:
+            self._lidar_timestamps = list(self._read_json("lidar/timestamps.json"))
+        return self._lidar_timestamps
+
+    def get_lidar_timestamps_file_path(self) -> Path:
+        return self._get_path("lidar/timestamps.json")
+
+    def get_lidar_file_path(self, index: int) -> Path:
+        return self.archive.get_path(self.archive_sequence.lidar_files[index])
+
+    def read_lidar(self, index: int) -> pandas.DataFrame:
+        return self._read_pickle(self.get_lidar_file_path(index))
+
+    def get_camera_names(self) -> list[str]:
+        return list(self.archive_sequence.camera_files.keys())
+
+    def get_camera_poses(self, camera_name: str) -> list[dict[str, Any]]:
+        if camera_name not in self._camera_poses:
+            self._camera_poses[camera_name] = list(self._read_json(f"camera/{camera_name}/poses.json"))
+        return self._camera_poses[camera_name]
+
+    def get_camera_poses_file_path(self, camera_name: str) -> Path:
+        return self._get_path(f"camera/{camera_name}/poses.json")
+
+    def get_camera_timestamps(self, camera_name: str) -> list[float]:
+        return list(self._read_json(f"camera/{camera_name}/timestamps.json"))
+
+    def get_camera_timestamps_file_path(self, camera_name: str) -> Path:
+        return self._get_path(f"camera/{camera_name}/timestamps.json")
+
+    def get_camera_intrinsics_file_path(self, camera_name: str) -> Path:
+        return self._get_path(f"camera/{camera_name}/intrinsics.json")
+
+    def get_camera_intrinsics(self, camera_name: str) -> Intrinsics:
+        if camera_name not in self._camera_intrinsics:
+            intrinsics = self._read_json(f"camera/{camera_name}/intrinsics.json")
+            self._camera_intrinsics[camera_name] = Intrinsics(
+                fx=intrinsics["fx"], fy=intrinsics["fy"], cx=intrinsics["cx"], cy=intrinsics["cy"]
+            )
+        return self._camera_intrinsics[camera_name]
+
+    def get_camera_image_path(self, camera_name: str, index: int) -> Path:
+        return self.archive.get_path(self.archive_sequence.camera_files[camera_name][index])
+
+    def read_camera_image_bytes(self, camera_name: str, index: int) -> bytes:
+        return self.archive.read_bytes(self.archive.get_name(self.get_camera_image_path(camera_name, index)))
+
+    def read_camera_image(self, camera_name: str, index: int) -> Image.Image:
+        return Image.open(io.BytesIO(self.read_camera_image_bytes(camera_name, index)))
+
+    def copy_camera_image(self, camera_name: str, index: int, output_file: Path, *, hardlink: bool = False) -> None:
+        # zipファイル内のファイルにはハードリンクを作成できないので、常に書き込む
+        output_file.unlink(missing_ok=True)
+        output_file.write_bytes(self.read_camera_image_bytes(camera_name, index))
+
+    def has_cuboids(self) -> bool:
+        return len(self.archive_sequence.cuboid_files) > 0
+
+    def get_cuboids_frame_count(self) -> int:
+        return len(self.archive_sequence.cuboid_files)
+
+    def get_cuboids_file_path(self, index: int) -> Path:
+        return self.archive.get_path(self.archive_sequence.cuboid_files[index])
+
+    def read_cuboids(self, index: int) -> pandas.DataFrame:
+        return self._read_pickle(self.get_cuboids_file_path(index))
+
+    def has_semseg(self) -> bool:
+        return len(self.archive_sequence.semseg_files) > 0
+
+    def get_semseg_frame_count(self) -> int:
+        return len(self.archive_sequence.semseg_files)
+
+    def get_semseg_classes_file_path(self) -> Path:
+        return self._get_path("annotations/semseg/classes.json")
+
+    def get_semseg_classes(self) -> dict[str, str]:
+        if self._semseg_classes is None:
+            self._semseg_classes = dict(self._read_json("annotations/semseg/classes.json"))
+        return self._semseg_classes
+
+    def get_semseg_file_path(self, index: int) -> Path:
+        return self.archive.get_path(self.archive_sequence.semseg_files[index])
+
+    def read_semseg(self, index: int) -> pandas.DataFrame:
+        return self._read_pickle(self.get_semseg_file_path(index))
+
+
+def open_dataset(input_dir: Path) -> Union[DataSet, PandasetArchive]:
+    """
+    pandasetを開きます。`input_dir`がzipファイルなら展開せずに読み込む`PandasetArchive`を、
+    ディレクトリならpandasetの`DataSet`を返します。
+    """
+    if input_dir.is_file() and zipfile.is_zipfile(input_dir):
+        return PandasetArchive(input_dir)
+    return DataSet(str(input_dir))
+
+
+def create_frame_reader(sequence: Union[Sequence, ArchiveSequence]) -> SequenceFrameReader:
+    """シーケンスから、フレーム単位でデータを読み込むreaderを生成します。"""
+    if isinstance(sequence, ArchiveSequence):
+        return ArchiveSequenceFrameReader(sequence)
+    return SequenceFrameReader(sequence)
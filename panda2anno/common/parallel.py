@@ -0,0 +1,151 @@
+import logging
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Callable, Optional, Union
+
+from pandaset import DataSet
+
+from panda2anno.common.pandaset_archive import PandasetArchive, open_dataset
+from panda2anno.common.utils import set_default_logger
+
+logger = logging.getLogger(__name__)
+
+ProcessSequenceFunc = Callable[..., None]
+"""
+1個のシーケンスを処理する関数。`func(sequence, output_dir=..., sequence_id=...)`の形式で呼び出す。
+`output_dir`は、`process_sequences`の`output_dir_per_sequence`がTrueなら`{出力先ディレクトリ}/{sequence_id}`、
+Falseなら出力先ディレクトリ。
+プロセスプールで実行する場合はpickle化できる必要があるので、モジュールのトップレベルの関数か、インスタンスメソッドを指定すること。
+"""
+
+# ワーカプロセスごとに生成するDataSet
+_worker_dataset: Optional[Union[DataSet, PandasetArchive]] = None
+
+
+def _initialize_worker(input_dir: Path) -> None:
+    global _worker_dataset
+    set_default_logger()
+    _worker_dataset = open_dataset(input_dir)
+
+
+def _process_sequence(
+    dataset: Union[DataSet, PandasetArchive],
+    func: ProcessSequenceFunc,
+    output_dir: Path,
+    sequence_id: str,
+    process_name: str,
+) -> bool:
+    """
+    1個のシーケンスを処理します。例外が発生しても、他のシーケンスの処理を継続できるように例外は送出しません。
+
+    Returns:
+        処理に成功したらTrue
+    """
+    try:
+        sequence = dataset[sequence_id]
+    except KeyError:
+        logger.warning(f"{sequence_id=}は存在しません。")
+        return False
+
+    logger.info(f"{sequence_id=}の{process_name}を開始します。")
+    try:
+        func(sequence, output_dir=output_dir, sequence_id=sequence_id)
+        return True
+    except Exception:
+        logger.warning(f"{sequence_id=}の{process_name}に失敗しました。", exc_info=True)
+        return False
+    finally:
+        dataset.unload(sequence_id)
+
+
+def _process_sequence_in_worker(
+    func: ProcessSequenceFunc, output_dir: Path, sequence_id: str, process_name: str
+) -> bool:
+    assert _worker_dataset is not None
+    return _process_sequence(_worker_dataset, func, output_dir, sequence_id, process_name)
+
+
+def process_sequences(
+    func: ProcessSequenceFunc,
+    *,
+    input_dir: Path,
+    output_dir: Path,
+    sequence_id_list: list[str],
+    process_name: str,
+    workers: int = 1,
+    output_dir_per_sequence: bool = True,
+) -> list[str]:
+    """
+    シーケンスごとに`func`を実行します。
+    1個のシーケンスの処理に失敗しても、他のシーケンスの処理は継続します。
+
+    Args:
+        func: 1個のシーケンスを処理する関数
+        input_dir: pandasetのディレクトリ
+        output_dir: 出力先ディレクトリ。デフォルトでは、シーケンスごとに`output_dir / sequence_id`が`func`に渡されます。
+        sequence_id_list: 処理対象のsequence_id
+        process_name: ログに出力する処理の名前
+        workers: 並列に処理するプロセス数。2以上ならプロセスプールを使い、各ワーカプロセスが自身のDataSetを生成します。
+            `input_dir`がzipファイルの場合は、展開せずに`PandasetArchive`で読み込みます。
+        output_dir_per_sequence: Falseなら、`output_dir / sequence_id`ではなく`output_dir`をそのまま`func`に渡します。
+            出力対象ごとのディレクトリの下にシーケンスのディレクトリを作成する場合など、`func`が出力先を決める場合に指定します。
+
+    Returns:
+        処理に失敗したsequence_idのlist
+    """
+
+    def get_output_dir(sequence_id: str) -> Path:
+        return output_dir / sequence_id if output_dir_per_sequence else output_dir
+
+    failed_sequence_id_list: list[str] = []
+    if workers <= 1:
+        dataset = open_dataset(input_dir)
+        for sequence_id in sequence_id_list:
+            if not _process_sequence(dataset, func, get_output_dir(sequence_id), sequence_id, process_name):
+                failed_sequence_id_list.append(sequence_id)
+
+    else:
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=_initialize_worker, initargs=(input_dir,)
+        ) as executor:
+            future_to_sequence_id = {
+                executor.submit(
+                    _process_sequence_in_worker, func, get_output_dir(sequence_id), sequence_id, process_name
+                ): sequence_id
+                for sequence_id in sequence_id_list
+            }
+            for future in as_completed(future_to_sequence_id):
+                sequence_id = future_to_sequence_id[future]
+                try:
+                    result = future.result()
+                except Exception:
+                    # ワーカプロセスが異常終了した場合など
+                    logger.warning(f"{sequence_id=}の{process_name}に失敗しました。", exc_info=True)
+                    result = False
+                if not result:
+                    failed_sequence_id_list.append(sequence_id)
+
+        # 出力を直列実行時と揃える
+        failed_sequence_id_set = set(failed_sequence_id_list)
+        failed_sequence_id_list = [e for e in sequence_id_list if e in failed_sequence_id_set]
+
+    if len(failed_sequence_id_list) > 0:
+        logger.warning(
+            f"{len(sequence_id_list)}件中{len(failed_sequence_id_list)}件のシーケンスの{process_name}に失敗しました。"
+            f" :: {failed_sequence_id_list}"
+        )
+    else:
+        logger.info(f"{len(sequence_id_list)}件のシーケンスの{process_name}が完了しました。")
+    return failed_sequence_id_list
+
+
+def add_workers_argument(parser: ArgumentParser) -> None:
+    """シーケンス単位の並列数を指定する`--workers`引数を追加します。"""
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        required=False,
+        help="並列に処理するプロセス数。2以上を指定すると、シーケンス単位でプロセスプールを使って変換します。",
+    )
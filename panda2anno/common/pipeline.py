@@ -0,0 +1,304 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterable, Optional
+
+from dataclasses_json import DataClassJsonMixin
+
+logger = logging.getLogger(__name__)
+
+_END = object()
+"""キューの終端を表す値"""
+
+_POLL_INTERVAL = 0.1
+"""他のステージで例外が発生したかを確認する間隔[秒]"""
+
+
+@dataclass
+class PipelineStage:
+    """
+    パイプラインの1個のステージ。
+
+    Args:
+        name: ステージの名前
+        func: 前のステージの要素を受け取って、次のステージに渡す要素を返す関数。Noneを返した場合は次のステージに渡しません。
+        workers: 並列に実行するスレッド数、またはプロセス数
+        use_process: Trueならプロセスプールで`func`を実行します。`func`と要素はpickle化できる必要があります。
+    """
+
+    name: str
+    func: Callable[[Any], Any]
+    workers: int = 1
+    use_process: bool = False
+
+
+@dataclass
+class StageReport(DataClassJsonMixin):
+    """
+    1個のステージの稼働状況
+
+    Args:
+        name: ステージの名前
+        workers: 並列数
+        item_count: 処理した要素の数
+        elapsed_seconds: パイプライン全体の実行時間[秒]
+        busy_seconds: `func`の実行時間の合計[秒]
+        input_wait_seconds: 前のステージの要素を待った時間の合計[秒]
+        output_wait_seconds: 次のステージのキューに空きができるのを待った時間の合計[秒]
+    """
+
+    name: str
+    workers: int
+    item_count: int = 0
+    elapsed_seconds: float = 0.0
+    busy_seconds: float = 0.0
+    input_wait_seconds: float = 0.0
+    output_wait_seconds: float = 0.0
+
+    @property
+    def utilization(self) -> float:
+        """稼働率。`func`を実行していた時間の、実行時間×並列数に対する割合"""
+        if self.elapsed_seconds <= 0 or self.workers <= 0:
+            return 0.0
+        return self.busy_seconds / (self.elapsed_seconds * self.workers)
+
+
+@dataclass
+class _StageState:
+    stage: PipelineStage
+    input_queue: queue.Queue
+    report: StageReport
+    executor: Optional[Executor] = None
+    running_workers: int = 0
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+class _PipelineAborted(Exception):
+    """他のステージで例外が発生したので、処理を中断する"""
+
+
+class Pipeline:
+    """
+    複数のステージを、サイズに上限のあるキューでつないで並行に実行します。
+
+    各ステージは`workers`個のスレッド（`use_process`がTrueならプロセス）で要素を処理して、次のステージのキューに渡します。
+    キューが満杯になると前のステージは待つので、処理中の要素の数は`queue_size`とステージの並列数で決まる数に収まります。
+    要素の処理順序は保証しません。
+
+    Args:
+        stages: ステージのlist
+        queue_size: ステージ間のキューのサイズの上限
+    """
+
+    def __init__(self, stages: list[PipelineStage], queue_size: int = 4) -> None:
+        if len(stages) == 0:
+            raise ValueError("ステージを1個以上指定してください。")
+        for stage in stages:
+            if stage.workers < 1:
+                raise ValueError(f"ステージ'{stage.name}'のworkersには1以上を指定してください。 :: {stage.workers=}")
+        if queue_size < 1:
+            raise ValueError(f"queue_sizeには1以上を指定してください。 :: {queue_size=}")
+        self.stages = stages
+        self.queue_size = queue_size
+
+    def run(self, items: Iterable[Any]) -> list[StageReport]:
+        """
+        `items`の各要素を、すべてのステージで処理します。
+        いずれかのステージで例外が発生した場合は、すべてのステージを中断して、その例外を送出します。
+
+        Returns:
+            ステージごとの稼働状況
+        """
+        states = [
+            _StageState(
+                stage=stage,
+                input_queue=queue.Queue(maxsize=self.queue_size),
+                report=StageReport(name=stage.name, workers=stage.workers),
+                running_workers=stage.workers,
+            )
+            for stage in self.stages
+        ]
+        abort_event = threading.Event()
+        errors: list[BaseException] = []
+
+        def put(q: queue.Queue, item: Any) -> None:
+            while True:
+                if abort_event.is_set():
+                    raise _PipelineAborted()
+                try:
+                    q.put(item, timeout=_POLL_INTERVAL)
+                    return
+                except queue.Full:
+                    continue
+
+        def get(q: queue.Queue) -> Any:
+            while True:
+                if abort_event.is_set():
+                    raise _PipelineAborted()
+                try:
+                    return q.get(timeout=_POLL_INTERVAL)
+                except queue.Empty:
+                    continue
+
+        def fail(error: BaseException) -> None:
+            if not isinstance(error, _PipelineAborted):
+                errors.append(error)
+            abort_event.set()
+
+        def feed() -> None:
+            try:
+                first_state = states[0]
+                for item in items:
+                    put(first_state.input_queue, item)
+                for _ in range(first_state.stage.workers):
+                    put(first_state.input_queue, _END)
+            except BaseException as e:
+                fail(e)
+
+        def work(stage_index: int) -> None:
+            state = states[stage_index]
+            next_state = states[stage_index + 1] if stage_index + 1 < len(states) else None
+            busy_seconds = input_wait_seconds = output_wait_seconds = 0.0
+            item_count = 0
+            try:
+                while True:
+                    started = time.perf_counter()
+                    item = get(state.input_queue)
+                    input_wait_seconds += time.perf_counter() - started
+                    if item is _END:
+                        break
+
+                    started = time.perf_counter()
+                    if state.executor is not None:
+                        result = state.executor.submit(state.stage.func, item).result()
+                    else:
+                        result = state.stage.func(item)
+                    busy_seconds += time.perf_counter() - started
+                    item_count += 1
+
+                    if next_state is not None and result is not None:
+                        started = time.perf_counter()
+                        put(next_state.input_queue, result)
+                        output_wait_seconds += time.perf_counter() - started
+
+                with state.lock:
+                    state.running_workers -= 1
+                    is_last_worker = state.running_workers == 0
+                # 最後に終わったスレッドが、次のステージに終端を伝える
+                if is_last_worker and next_state is not None:
+                    for _ in range(next_state.stage.workers):
+                        put(next_state.input_queue, _END)
+            except BaseException as e:
+                fail(e)
+            finally:
+                with state.lock:
+                    state.report.item_count += item_count
+                    state.report.busy_seconds += busy_seconds
+                    state.report.input_wait_seconds += input_wait_seconds
+                    state.report.output_wait_seconds += output_wait_seconds
+
+        started = time.perf_counter()
+        try:
+            for state in states:
+                if state.stage.use_process:
+                    state.executor = ProcessPoolExecutor(max_workers=state.stage.workers)
+
+            threads = [threading.Thread(target=feed, name="pipeline-feed", daemon=True)]
+            for stage_index, state in enumerate(states):
+                threads.extend(
+                    threading.Thread(
+                        target=work, args=(stage_index,), name=f"pipeline-{state.stage.name}-{i}", daemon=True
+                    )
+                    for i in range(state.stage.workers)
+                )
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            for state in states:
+                if state.executor is not None:
+                    state.executor.shutdown(cancel_futures=True)
+
+        elapsed_seconds = time.perf_counter() - started
+        reports = [state.report for state in states]
+        for report in reports:
+            report.elapsed_seconds = elapsed_seconds
+
+        if len(errors) > 0:
+            raise errors[0]
+        return reports
+
+
+def format_stage_reports(reports: list[StageReport]) -> str:
+    """ステージごとの稼働状況を、ログに出力する文字列に変換します。稼働率が最も高いステージをボトルネックとして示します。"""
+    if len(reports) == 0:
+        return ""
+    bottleneck = max(reports, key=lambda e: e.utilization)
+    lines = []
+    for report in reports:
+        mark = " <- ボトルネック" if report is bottleneck else ""
+        lines.append(
+            f"{report.name}: workers={report.workers}, 件数={report.item_count}, 稼働率={report.utilization:.1%}, "
+            f"処理={report.busy_seconds:.2f}s, 入力待ち={report.input_wait_seconds:.2f}s, "
+            f"出力待ち={report.output_wait_seconds:.2f}s{mark}"
+        )
+    return "\n".join(lines)
+
+
+@dataclass
+class PipelineConfig(DataClassJsonMixin):
+    """
+    パイプラインの設定
+
+    Args:
+        stage_workers: keyがステージの名前、valueが並列数。指定しないステージの並列数は1です。
+        process_stages: プロセスプールで実行するステージの名前。指定しないステージはスレッドで実行します。
+        queue_size: ステージ間のキューのサイズの上限
+    """
+
+    stage_workers: dict[str, int] = field(default_factory=dict)
+    process_stages: list[str] = field(default_factory=list)
+    queue_size: int = 4
+
+    def validate(self, stage_names: list[str], process_stage_names: list[str]) -> None:
+        """
+        Args:
+            stage_names: パイプラインのステージの名前
+            process_stage_names: プロセスプールで実行できるステージの名前
+        """
+        unknown_stage_names = (set(self.stage_workers) | set(self.process_stages)) - set(stage_names)
+        if len(unknown_stage_names) > 0:
+            raise ValueError(
+                f"{sorted(unknown_stage_names)}は存在しないステージです。{stage_names}のいずれかを指定してください。"
+            )
+        invalid_process_stages = set(self.process_stages) - set(process_stage_names)
+        if len(invalid_process_stages) > 0:
+            raise ValueError(
+                f"{sorted(invalid_process_stages)}はプロセスプールで実行できません。"
+                f"{process_stage_names}のいずれかを指定してください。"
+            )
+
+    def create_stage(self, name: str, func: Callable[[Any], Any]) -> PipelineStage:
+        return PipelineStage(
+            name=name,
+            func=func,
+            workers=self.stage_workers.get(name, 1),
+            use_process=name in self.process_stages,
+        )
+
+
+def parse_stage_workers(values: list[str]) -> dict[str, int]:
+    """
+    `load=2 write=4`のような`{ステージ名}={並列数}`形式の文字列のlistを、dictに変換します。
+    """
+    result = {}
+    for value in values:
+        name, sep, workers = value.partition("=")
+        if sep == "" or not workers.isdigit():
+            raise ValueError(f"'{value}'は`{{ステージ名}}={{並列数}}`の形式ではありません。")
+        result[name] = int(workers)
+    return result
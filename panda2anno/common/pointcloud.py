@@ -0,0 +1,242 @@
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+import numpy
+import pandas
+from dataclasses_json import DataClassJsonMixin
+
+from panda2anno.common.pose import Pose
+
+_TRANSFORM_CHUNK_SIZE = 1 << 16
+"""座標変換をfloat64で計算するときに、1回で計算する点の数"""
+
+
+def transform_and_pack_points(
+    xyz: numpy.ndarray, intensity: numpy.ndarray, pose: Pose, out: Optional[numpy.ndarray] = None
+) -> numpy.ndarray:
+    """
+    点群を座標変換して、KITTIのvelodyne bin fileと同じ(N,4)のfloat32の配列に格納します。
+
+    `pose * xyz`で変換してから`numpy.hstack`で強度を結合する方法に比べて、同次座標の配列や結合用の配列を生成しないので、
+    点群のコピーが少なくなります。
+    回転と並進は`pose * xyz`と同じくfloat64で計算して、float32には最後に1回だけ変換します。
+    float64の一時配列が大きくならないように、`_TRANSFORM_CHUNK_SIZE`個の点ずつ計算します。
+
+    Args:
+        xyz: (N,3)の点群
+        intensity: (N,)の反射強度
+        pose: 点群に適用する変換
+        out: 出力先の(N,4)のfloat32の配列。Noneなら新しく確保します。
+
+    Returns:
+        (N,4)のfloat32の配列。各行は`[x, y, z, intensity]`
+    """
+    if out is None:
+        out = numpy.empty((len(xyz), 4), dtype=numpy.float32)
+    assert out.shape == (len(xyz), 4) and out.dtype == numpy.float32
+
+    for start in range(0, len(xyz), _TRANSFORM_CHUNK_SIZE):
+        end = start + _TRANSFORM_CHUNK_SIZE
+        out[start:end, :3] = pose * numpy.asarray(xyz[start:end], dtype=numpy.float64)
+    out[:, 3] = intensity
+    return out
+
+
+_VOXEL_KEY_BITS = 21
+"""ボクセルのインデックスを1個のint64に詰めるときの、1軸あたりのビット数"""
+
+
+def voxel_downsample(points: numpy.ndarray, voxel_size: float) -> numpy.ndarray:
+    """
+    点群をボクセルグリッドでダウンサンプリングします。
+    各ボクセルに含まれる点のうち、元の並び順で最初の点を残します。
+
+    ボクセルのインデックス(x,y,z)を1個のint64のキーに詰めて、`numpy.unique`で重複を除きます。
+    1軸あたり`2**21`個のボクセルを表現できるので、`voxel_size=0.05`なら約±52kmの範囲を扱えます。範囲外の点は端のボクセルにまとめられます。
+
+    Args:
+        points: (N,3)以上の点群。先頭の3列をx,y,zとみなします。
+        voxel_size: ボクセルの1辺の長さ[m]
+
+    Returns:
+        残す点のインデックス（昇順）
+    """
+    if len(points) == 0:
+        return numpy.arange(0)
+
+    offset = 1 << (_VOXEL_KEY_BITS - 1)
+    voxel_index = numpy.floor(points[:, :3] / voxel_size).astype(numpy.int64)
+    voxel_index += offset
+    numpy.clip(voxel_index, 0, (1 << _VOXEL_KEY_BITS) - 1, out=voxel_index)
+
+    keys = voxel_index[:, 0] << (2 * _VOXEL_KEY_BITS)
+    keys |= voxel_index[:, 1] << _VOXEL_KEY_BITS
+    keys |= voxel_index[:, 2]
+
+    _, first_index = numpy.unique(keys, return_index=True)
+    first_index.sort()
+    return first_index
+
+
+@dataclass(frozen=True)
+class PointCloudFilter(DataClassJsonMixin):
+    """
+    KITTIのvelodyne bin fileに出力する点群を絞り込む条件。
+    範囲や高さの条件は、LiDAR座標系に変換した後の座標に適用します。
+
+    Notes:
+        点を削除すると点のインデックスが変わるので、semantic segmentationのアノテーションと組み合わせる場合は使用しないでください。
+
+    Args:
+        sensor_id: 出力するLiDARのID（`d`列の値）。0はPandar64（360°）、1はPandarGT（前方）。Noneならすべて出力します。
+        min_range: LiDARからの水平距離の最小値[m]
+        max_range: LiDARからの水平距離の最大値[m]
+        min_z: 高さの最小値[m]
+        max_z: 高さの最大値[m]
+        crop_box: この直方体`(x_min, y_min, z_min, x_max, y_max, z_max)`の内側の点だけを出力します。
+        voxel_size: ボクセルの1辺の長さ[m]。指定すると、ボクセルごとに1点に間引きます。
+    """
+
+    sensor_id: Optional[int] = None
+    min_range: Optional[float] = None
+    max_range: Optional[float] = None
+    min_z: Optional[float] = None
+    max_z: Optional[float] = None
+    crop_box: Optional[tuple[float, float, float, float, float, float]] = None
+    voxel_size: Optional[float] = None
+
+    def get_sensor_mask(self, sensor_ids: numpy.ndarray) -> Optional[numpy.ndarray]:
+        """
+        `sensor_id`に一致する点のマスクを取得します。条件がなければNoneを返します。
+        """
+        if self.sensor_id is None:
+            return None
+        return sensor_ids == self.sensor_id
+
+    def get_region_mask(self, points: numpy.ndarray) -> Optional[numpy.ndarray]:
+        """
+        範囲、高さ、直方体の条件をすべて満たす点のマスクを取得します。条件がなければNoneを返します。
+
+        Args:
+            points: LiDAR座標系の(N,3)以上の点群
+        """
+        mask: Optional[numpy.ndarray] = None
+
+        def update(condition: numpy.ndarray) -> None:
+            nonlocal mask
+            if mask is None:
+                mask = condition
+            else:
+                mask &= condition
+
+        x = points[:, 0]
+        y = points[:, 1]
+        z = points[:, 2]
+        if self.min_range is not None or self.max_range is not None:
+            squared_range = x * x + y * y
+            if self.min_range is not None:
+                update(squared_range >= self.min_range**2)
+            if self.max_range is not None:
+                update(squared_range <= self.max_range**2)
+        if self.min_z is not None:
+            update(z >= self.min_z)
+        if self.max_z is not None:
+            update(z <= self.max_z)
+        if self.crop_box is not None:
+            x_min, y_min, z_min, x_max, y_max, z_max = self.crop_box
+            update((x >= x_min) & (x <= x_max) & (y >= y_min) & (y <= y_max) & (z >= z_min) & (z <= z_max))
+        return mask
+
+    def apply(self, points: numpy.ndarray) -> numpy.ndarray:
+        """
+        LiDAR座標系の点群に、範囲、高さ、直方体、ボクセルの条件を適用します。`sensor_id`の条件は適用しません。
+        """
+        mask = self.get_region_mask(points)
+        if mask is not None:
+            points = points[mask]
+        if self.voxel_size is not None:
+            points = points[voxel_downsample(points, self.voxel_size)]
+        return points
+
+
+def transform_kitti_velodyne_points(
+    lidar_data: pandas.DataFrame,
+    pose: Pose,
+    point_cloud_filter: Optional[PointCloudFilter] = None,
+) -> tuple[numpy.ndarray, int]:
+    """
+    pandasetの点群（x,y,z,iの列を持つDataFrame）を座標変換して、KITTIのvelodyne bin fileと同じ(N,4)のfloat32の配列にします。
+
+    Args:
+        lidar_data: pandasetの点群
+        pose: 点群に適用する変換
+        point_cloud_filter: 出力する点群を絞り込む条件
+
+    Returns:
+        tuple((N,4)のfloat32の配列, 入力した点の数)
+    """
+    xyz = lidar_data[["x", "y", "z"]].to_numpy(dtype=numpy.float64)
+    sensor_ids = lidar_data["d"].to_numpy() if point_cloud_filter is not None else None
+    points = transform_kitti_velodyne_arrays(xyz, lidar_data["i"].to_numpy(), sensor_ids, pose, point_cloud_filter)
+    return points, len(xyz)
+
+
+def transform_kitti_velodyne_arrays(
+    xyz: numpy.ndarray,
+    intensity: numpy.ndarray,
+    sensor_ids: Optional[numpy.ndarray],
+    pose: Pose,
+    point_cloud_filter: Optional[PointCloudFilter] = None,
+) -> numpy.ndarray:
+    """
+    `transform_kitti_velodyne_points`と同じ変換を、点群の列ごとの配列に対して行います。
+    引数の配列は変更せず、戻り値は引数の配列とメモリを共有しないので、共有メモリ上の配列を渡せます。
+
+    Args:
+        xyz: (N,3)の点群
+        intensity: (N,)の反射強度
+        sensor_ids: (N,)のLiDARのID。`point_cloud_filter`の`sensor_id`を指定する場合は必要です。
+
+    Returns:
+        (N,4)のfloat32の配列
+    """
+    if point_cloud_filter is not None and point_cloud_filter.sensor_id is not None:
+        if sensor_ids is None:
+            raise ValueError("sensor_idで絞り込むには、sensor_idsを指定してください。")
+        # 座標変換する点を減らすため、LiDARの絞り込みは先に行う
+        sensor_mask = point_cloud_filter.get_sensor_mask(sensor_ids)
+        if sensor_mask is not None:
+            xyz = xyz[sensor_mask]
+            intensity = intensity[sensor_mask]
+
+    points = transform_and_pack_points(xyz, intensity, pose)
+    if point_cloud_filter is not None:
+        points = point_cloud_filter.apply(points)
+    return points
+
+
+def write_kitti_velodyne_points(
+    lidar_data: pandas.DataFrame,
+    pose: Pose,
+    output_file: Path,
+    point_cloud_filter: Optional[PointCloudFilter] = None,
+) -> tuple[int, int]:
+    """
+    pandasetの点群（x,y,z,iの列を持つDataFrame）を座標変換して、KITTIのvelodyne bin fileに出力します。
+
+    Args:
+        lidar_data: pandasetの点群
+        pose: 点群に適用する変換
+        output_file: 出力先
+        point_cloud_filter: 出力する点群を絞り込む条件
+
+    Returns:
+        tuple(入力した点の数, 出力した点の数)
+    """
+    points, input_point_count = transform_kitti_velodyne_points(lidar_data, pose, point_cloud_filter)
+
+    output_file.parent.mkdir(exist_ok=True, parents=True)
+    # (N,4)のC連続な配列なので、そのままファイルに書き出せば(1,M)に変換したのと同じバイト列になる
+    points.tofile(str(output_file))
+    return input_point_count, len(points)
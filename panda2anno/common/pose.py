@@ -1,6 +1,68 @@
+from typing import Any, Optional, Sequence, Union, overload
+
 import numpy
 from pyquaternion import Quaternion
 
+_UNIT_TOLERANCE = 1e-14
+"""pyquaternionが単位クォータニオンとみなす誤差"""
+
+
+def _normalize_quaternions(wxyz: numpy.ndarray) -> numpy.ndarray:
+    """
+    (...,4)のクォータニオンを正規化します。pyquaternionと同じく、すでに単位クォータニオンとみなせるものは変更しません。
+    """
+    sum_of_squares = numpy.sum(wxyz * wxyz, axis=-1, keepdims=True)
+    is_unit = numpy.abs(1.0 - sum_of_squares) < _UNIT_TOLERANCE
+    return numpy.where(is_unit | (sum_of_squares == 0), wxyz, wxyz / numpy.sqrt(sum_of_squares))
+
+
+def _multiply_quaternions(q1: numpy.ndarray, q2: numpy.ndarray) -> numpy.ndarray:
+    """(...,4)のクォータニオンの積（ハミルトン積）を計算します。"""
+    w1, x1, y1, z1 = numpy.moveaxis(q1, -1, 0)
+    w2, x2, y2, z2 = numpy.moveaxis(q2, -1, 0)
+    return numpy.stack(
+        [
+            w1 * w2 - x1 * x2 - y1 * y2 - z1 * z2,
+            w1 * x2 + x1 * w2 + y1 * z2 - z1 * y2,
+            w1 * y2 - x1 * z2 + y1 * w2 + z1 * x2,
+            w1 * z2 + x1 * y2 - y1 * x2 + z1 * w2,
+        ],
+        axis=-1,
+    )
+
+
+def _quaternions_to_rotation_matrices(wxyz: numpy.ndarray) -> numpy.ndarray:
+    """(...,4)の単位クォータニオンを、(...,3,3)の回転行列に変換します。"""
+    w, x, y, z = numpy.moveaxis(wxyz, -1, 0)
+    return numpy.stack(
+        [
+            numpy.stack([1 - 2 * (y * y + z * z), 2 * (x * y - w * z), 2 * (x * z + w * y)], axis=-1),
+            numpy.stack([2 * (x * y + w * z), 1 - 2 * (x * x + z * z), 2 * (y * z - w * x)], axis=-1),
+            numpy.stack([2 * (x * z - w * y), 2 * (y * z + w * x), 1 - 2 * (x * x + y * y)], axis=-1),
+        ],
+        axis=-2,
+    )
+
+
+def _rotate_vectors(rotation_matrices: numpy.ndarray, vectors: numpy.ndarray) -> numpy.ndarray:
+    """
+    (...,3,3)の回転行列で、(...,3)のベクトルを回転します。
+    `Pose`と`PoseArray`で計算結果が完全に一致するように、`matmul`ではなく要素ごとの積と和で計算します。
+    """
+    return (
+        rotation_matrices[..., 0] * vectors[..., 0:1]
+        + rotation_matrices[..., 1] * vectors[..., 1:2]
+        + rotation_matrices[..., 2] * vectors[..., 2:3]
+    )
+
+
+def _quaternions_to_yaw(wxyz: numpy.ndarray) -> numpy.ndarray:
+    """
+    (...,4)の単位クォータニオンから、z軸周りの回転角度（`Quaternion.yaw_pitch_roll`のyaw）を計算します。
+    """
+    w, x, y, z = numpy.moveaxis(wxyz, -1, 0)
+    return numpy.arctan2(2 * (w * z - x * y), 1 - 2 * (y * y + z * z))
+
 
 class Pose:
     """
@@ -8,8 +70,21 @@ class Pose:
     and provides common transformations that are commonly seen in geometric problems.
 
     https://github.com/TRI-ML/dgp/blob/6ff13df792ac210a7b4e3c2f11c57079ac9c884a/dgp/utils/pose.py を流用しました。
+
+    イミュータブルなクラスです。回転行列、逆変換、yawは初回アクセス時に計算してキャッシュします。
+    `matrix`と`rotation_matrix`は、キャッシュのコピーを返すので、変更しても元のPoseには影響しません。
+    計算はnumpyで行い、pyquaternionの`Quaternion`は`quat`にアクセスしたときだけ生成します。
     """
 
+    __slots__ = ("_wxyz", "_tvec", "_quat", "_rotation_matrix", "_matrix", "_inverse", "_yaw")
+    _wxyz: numpy.ndarray
+    _tvec: numpy.ndarray
+    _quat: Optional[Quaternion]
+    _rotation_matrix: Optional[numpy.ndarray]
+    _matrix: Optional[numpy.ndarray]
+    _inverse: Optional["Pose"]
+    _yaw: Optional[float]
+
     def __init__(self, wxyz=numpy.float64([1, 0, 0, 0]), tvec=numpy.float64([0, 0, 0])):
         """Initialize a Pose with Quaternion and 3D Position
 
@@ -21,8 +96,23 @@ class Pose:
         tvec: numpy.float64, (default: numpy.float64([0,0,0]))
             Translation (xyz)
         """
-        self.quat = Quaternion(wxyz)
-        self.tvec = tvec
+        if isinstance(wxyz, Quaternion):
+            wxyz = wxyz.q
+        wxyz = _normalize_quaternions(numpy.array(wxyz, dtype=numpy.float64).reshape(4))
+        tvec = numpy.array(tvec, dtype=numpy.float64).reshape(3)
+        wxyz.flags.writeable = False
+        tvec.flags.writeable = False
+
+        object.__setattr__(self, "_wxyz", wxyz)
+        object.__setattr__(self, "_tvec", tvec)
+        for name in ["_quat", "_rotation_matrix", "_matrix", "_inverse", "_yaw"]:
+            object.__setattr__(self, name, None)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"'{self.__class__.__name__}' object is immutable")
+
+    def __reduce__(self):
+        return (self.__class__, (self._wxyz, self._tvec))
 
     def __repr__(self):
         formatter = {"float_kind": lambda x: "%.2f" % x}
@@ -45,15 +135,16 @@ class Pose:
         result: Pose or np.ndarray
             Transformed pose or point cloud
         """
-        if isinstance(other, Pose):
+        if isinstance(other, PoseArray):
+            return PoseArray.from_poses([self]) * other
+        elif isinstance(other, Pose):
             assert isinstance(other, self.__class__)
-            t = self.quat.rotate(other.tvec) + self.tvec
-            q = self.quat * other.quat
+            t = _rotate_vectors(self._get_rotation_matrix(), other.tvec) + self.tvec
+            q = _multiply_quaternions(self._wxyz, other._wxyz)
             return self.__class__(q, t)
         else:
             assert other.shape[-1] == 3, "Point cloud is not 3-dimensional"
-            X = numpy.hstack([other, numpy.ones((len(other), 1))]).T
-            return (numpy.dot(self.matrix, X).T)[:, :3]
+            return other @ self._get_rotation_matrix().T + self.tvec
 
     def inverse(self):
         """Returns a new Pose that corresponds to the
@@ -64,11 +155,55 @@ class Pose:
         result: Pose
             Inverted pose
         """
-        qinv = self.quat.inverse
-        return self.__class__(qinv, qinv.rotate(-self.tvec))
+        inverse = self._inverse
+        if inverse is None:
+            # 単位クォータニオンなので、逆数は共役と等しい
+            qinv = self._wxyz * numpy.array([1.0, -1.0, -1.0, -1.0])
+            inverse = self.__class__(qinv, -_rotate_vectors(self._get_rotation_matrix().T, self.tvec))
+            object.__setattr__(self, "_inverse", inverse)
+        return inverse
+
+    @property
+    def wxyz(self) -> numpy.ndarray:
+        """Return the rotation component of the pose as a numpy.ndarray (wxyz)."""
+        return self._wxyz
+
+    @property
+    def tvec(self) -> numpy.ndarray:
+        """Return the translation component of the pose as a numpy.ndarray."""
+        return self._tvec
+
+    @property
+    def quat(self) -> Quaternion:
+        """Return the rotation component of the pose as a Quaternion object."""
+        quat = self._quat
+        if quat is None:
+            quat = Quaternion(self._wxyz.copy())
+            object.__setattr__(self, "_quat", quat)
+        return quat
+
+    def _get_rotation_matrix(self) -> numpy.ndarray:
+        """キャッシュした読み取り専用の回転行列を返します。"""
+        result = self._rotation_matrix
+        if result is None:
+            result = _quaternions_to_rotation_matrices(self._wxyz)
+            result.flags.writeable = False
+            object.__setattr__(self, "_rotation_matrix", result)
+        return result
+
+    def _get_matrix(self) -> numpy.ndarray:
+        """キャッシュした読み取り専用の同次変換行列を返します。"""
+        result = self._matrix
+        if result is None:
+            result = numpy.eye(4)
+            result[:3, :3] = self._get_rotation_matrix()
+            result[:3, 3] = self.tvec
+            result.flags.writeable = False
+            object.__setattr__(self, "_matrix", result)
+        return result
 
     @property
-    def matrix(self):
+    def matrix(self) -> numpy.ndarray:
         """Returns a 4x4 homogeneous matrix of the form [R t; 0 1]
 
         Returns
@@ -76,12 +211,10 @@ class Pose:
         result: numpy.ndarray
             4x4 homogeneous matrix
         """
-        result = self.quat.transformation_matrix
-        result[:3, 3] = self.tvec
-        return result
+        return self._get_matrix().copy()
 
     @property
-    def rotation_matrix(self):
+    def rotation_matrix(self) -> numpy.ndarray:
         """Returns the 3x3 rotation matrix (R)
 
         Returns
@@ -89,8 +222,16 @@ class Pose:
         result: numpy.ndarray
             3x3 rotation matrix
         """
-        result = self.quat.transformation_matrix
-        return result[:3, :3]
+        return self._get_rotation_matrix().copy()
+
+    @property
+    def yaw(self) -> float:
+        """z軸周りの回転角度[rad]。`pose.rotation.yaw_pitch_roll[0]`と同じ値です。"""
+        yaw = self._yaw
+        if yaw is None:
+            yaw = float(_quaternions_to_yaw(self._wxyz))
+            object.__setattr__(self, "_yaw", yaw)
+        return yaw
 
     @property
     def rotation(self):
@@ -132,7 +273,8 @@ class Pose:
         )
 
     def __eq__(self, other):
-        return self.quat == other.quat and (self.tvec == other.tvec).all()
+        # `Quaternion.__eq__`と同じ許容誤差で比較する
+        return numpy.allclose(self._wxyz, other._wxyz, rtol=1e-13, atol=1e-14) and (self.tvec == other.tvec).all()
 
     @classmethod
     def from_pandaset_pose(cls, pandaset_pose: dict[str, dict[str, float]]) -> "Pose":
@@ -163,12 +305,133 @@ class Pose:
         }
 
         heading = {
-            "w": self.quat[0],
-            "x": self.quat[1],
-            "y": self.quat[2],
-            "z": self.quat[3],
+            "w": self._wxyz[0],
+            "x": self._wxyz[1],
+            "y": self._wxyz[2],
+            "z": self._wxyz[3],
         }
         return {
             "position": position,
             "heading": heading,
         }
+
+
+class PoseArray:
+    """
+    N個のPoseをまとめて扱うクラス。
+    合成、逆変換、行列への変換、yawの計算、点群の変換をN個まとめて行います。
+
+    Args:
+        wxyz: (N,4)のクォータニオン
+        tvec: (N,3)の並進
+    """
+
+    def __init__(self, wxyz: numpy.ndarray, tvec: numpy.ndarray):
+        wxyz = numpy.asarray(wxyz, dtype=numpy.float64).reshape(-1, 4)
+        tvec = numpy.asarray(tvec, dtype=numpy.float64).reshape(-1, 3)
+        assert len(wxyz) == len(tvec), "The number of quaternions and translations are different"
+        self.wxyz = _normalize_quaternions(wxyz)
+        self.tvec = tvec
+
+    def __repr__(self):
+        return f"PoseArray(len={len(self)})"
+
+    def __len__(self) -> int:
+        return len(self.wxyz)
+
+    @overload
+    def __getitem__(self, item: Union[int, numpy.integer]) -> Pose: ...
+
+    @overload
+    def __getitem__(self, item: Union[slice, list[int], numpy.ndarray]) -> "PoseArray": ...
+
+    def __getitem__(self, item: Any) -> Union[Pose, "PoseArray"]:
+        """
+        整数を指定した場合はPoseを、スライスやインデックスの配列を指定した場合はPoseArrayを返します。
+        """
+        if isinstance(item, (int, numpy.integer)):
+            return Pose(wxyz=self.wxyz[item], tvec=self.tvec[item])
+        return self.__class__(self.wxyz[item], self.tvec[item])
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def __mul__(self, other: Union[Pose, "PoseArray"]) -> "PoseArray":
+        """
+        各Poseを合成します。`Pose * Pose`と同じ計算です。
+        一方の長さが1の場合は、もう一方のすべてのPoseと合成します。
+        """
+        if isinstance(other, Pose):
+            other = self.from_poses([other])
+        assert isinstance(other, PoseArray)
+        tvec = _rotate_vectors(self.rotation_matrices, other.tvec) + self.tvec
+        wxyz = _multiply_quaternions(self.wxyz, other.wxyz)
+        return self.__class__(wxyz, tvec)
+
+    def __rmul__(self, other: Pose) -> "PoseArray":
+        return self.from_poses([other]) * self
+
+    def inverse(self) -> "PoseArray":
+        """各Poseの逆変換を返します。"""
+        wxyz_inv = self.wxyz * numpy.array([1.0, -1.0, -1.0, -1.0])
+        tvec = -_rotate_vectors(numpy.swapaxes(self.rotation_matrices, -1, -2), self.tvec)
+        return self.__class__(wxyz_inv, tvec)
+
+    @property
+    def rotation_matrices(self) -> numpy.ndarray:
+        """(N,3,3)の回転行列"""
+        return _quaternions_to_rotation_matrices(self.wxyz)
+
+    @property
+    def matrices(self) -> numpy.ndarray:
+        """(N,4,4)の同次変換行列"""
+        result = numpy.zeros((len(self), 4, 4))
+        result[:, :3, :3] = self.rotation_matrices
+        result[:, :3, 3] = self.tvec
+        result[:, 3, 3] = 1.0
+        return result
+
+    @property
+    def yaw(self) -> numpy.ndarray:
+        """(N,)のz軸周りの回転角度[rad]。`pose.rotation.yaw_pitch_roll[0]`と同じ値です。"""
+        return _quaternions_to_yaw(self.wxyz)
+
+    def transform_points(self, points: numpy.ndarray) -> numpy.ndarray:
+        """
+        点を変換します。
+
+        Args:
+            points: (N,3)または(N,M,3)の点。i番目の点（点群）にi番目のPoseを適用します。
+
+        Returns:
+            pointsと同じshapeの変換後の点
+        """
+        assert points.shape[0] == len(self) and points.shape[-1] == 3
+        rotation_matrices = self.rotation_matrices
+        tvec = self.tvec
+        if points.ndim == 3:
+            tvec = tvec[:, numpy.newaxis, :]
+            return numpy.einsum("nij,nmj->nmi", rotation_matrices, points) + tvec
+        return numpy.einsum("nij,nj->ni", rotation_matrices, points) + tvec
+
+    @classmethod
+    def from_poses(cls, poses: Sequence[Pose]) -> "PoseArray":
+        return cls(
+            wxyz=numpy.array([pose.wxyz for pose in poses]).reshape(-1, 4),
+            tvec=numpy.array([pose.tvec for pose in poses]).reshape(-1, 3),
+        )
+
+    @classmethod
+    def from_pandaset_poses(cls, pandaset_poses: Sequence[dict[str, dict[str, float]]]) -> "PoseArray":
+        """pandasetのposeのlist（`poses.json`の内容）から生成します。"""
+        wxyz = numpy.array(
+            [
+                [pose["heading"]["w"], pose["heading"]["x"], pose["heading"]["y"], pose["heading"]["z"]]
+                for pose in pandaset_poses
+            ]
+        ).reshape(-1, 4)
+        tvec = numpy.array(
+            [[pose["position"]["x"], pose["position"]["y"], pose["position"]["z"]] for pose in pandaset_poses]
+        ).reshape(-1, 3)
+        return cls(wxyz=wxyz, tvec=tvec)
@@ -0,0 +1,279 @@
+import logging
+import time
+from argparse import ArgumentParser, Namespace
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Iterator, Optional, Protocol
+
+from dataclasses_json import DataClassJsonMixin
+
+from panda2anno.common.frame_reader import SequenceFrameReader
+
+logger = logging.getLogger(__name__)
+
+
+def read_file_bytes(path: Path) -> bytes:
+    return path.read_bytes()
+
+
+def get_file_size(path: Path) -> int:
+    """ファイルのサイズ。存在しないファイルは0を返して、読み込む時にエラーにします。"""
+    try:
+        return path.stat().st_size
+    except OSError:
+        return 0
+
+
+@dataclass
+class PrefetchStats(DataClassJsonMixin):
+    """
+    先読みの結果
+
+    Args:
+        hit_count: 先読みが終わっていたので、待たずに取得できたファイルの数
+        stall_count: 先読み中だったので、読み込みが終わるのを待ったファイルの数
+        miss_count: 先読みしていなかったので、その場で読み込んだファイルの数
+        stall_seconds: 先読み中のファイルの読み込みを待った時間の合計[秒]
+        dropped_count: 先読みしたが、利用されずに破棄したファイルの数
+    """
+
+    hit_count: int = 0
+    stall_count: int = 0
+    miss_count: int = 0
+    stall_seconds: float = 0.0
+    dropped_count: int = 0
+
+
+class FilePrefetcher:
+    """
+    フレームごとの入力ファイルを、バックグラウンドのスレッドで先読みします。
+
+    `frames`の順番にフレームを処理する前提で、処理中のフレームと、その後の`max_frames`個のフレームのファイルを読み込んでおきます。
+    あるフレームのファイルをすべて取得するか、後のフレームのファイルを取得すると、そのフレームの処理は終わったとみなして先読みを進めます。
+    先読み中または先読みが終わって、まだ取得されていないファイルの合計サイズが`max_bytes`以上の場合は、
+    処理中のフレームより後のフレームを先読みしません。サイズは読み込みを開始する時に`get_size`で取得するので、
+    読み込み中のファイルも上限に含まれます。
+
+    `read_bytes`は1個のスレッドから呼び出してください。
+
+    Args:
+        frames: 処理する順番に並べた、フレームごとの入力ファイルのlist
+        max_frames: 処理中のフレームより後に先読みするフレームの数
+        max_bytes: 先読みして、まだ取得されていないファイルの合計サイズの上限[byte]
+        workers: ファイルを読み込むスレッドの数
+        read_file: ファイルを読み込む関数
+        get_size: ファイルのサイズ[byte]を取得する関数
+    """
+
+    def __init__(
+        self,
+        frames: list[list[Path]],
+        *,
+        max_frames: int = 2,
+        max_bytes: int = 256 * 1024 * 1024,
+        workers: int = 4,
+        read_file: Callable[[Path], bytes] = read_file_bytes,
+        get_size: Callable[[Path], int] = get_file_size,
+    ) -> None:
+        if max_frames < 1:
+            raise ValueError(f"max_framesには1以上を指定してください。 :: {max_frames=}")
+        if workers < 1:
+            raise ValueError(f"workersには1以上を指定してください。 :: {workers=}")
+        self.frames = frames
+        self.max_frames = max_frames
+        self.max_bytes = max_bytes
+        self.read_file = read_file
+        self.get_size = get_size
+        self.stats = PrefetchStats()
+
+        self._frame_positions: dict[Path, int] = {}
+        for position, frame_files in enumerate(frames):
+            for path in frame_files:
+                self._frame_positions.setdefault(path, position)
+
+        # 先読み中または先読みが終わって、まだ取得されていないファイル
+        self._futures: dict[Path, Future[bytes]] = {}
+        self._file_sizes: dict[Path, int] = {}
+        # `_futures`のファイルの合計サイズ
+        self._prefetched_bytes = 0
+        self._remaining_files = [set(e) for e in frames]
+        self._current_position = 0
+        self._next_position = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+        self._schedule()
+
+    def is_target(self, path: Path) -> bool:
+        """先読みの対象のファイルかどうか"""
+        return path in self._frame_positions
+
+    def _schedule(self) -> None:
+        while (
+            self._next_position < len(self.frames) and self._next_position - self._current_position <= self.max_frames
+        ):
+            # 処理中のフレームは、サイズの上限に関わらず読み込む
+            if self._next_position > self._current_position and self._prefetched_bytes >= self.max_bytes:
+                break
+            for path in self.frames[self._next_position]:
+                if path not in self._futures:
+                    size = self.get_size(path)
+                    self._file_sizes[path] = size
+                    self._prefetched_bytes += size
+                    self._futures[path] = self._executor.submit(self.read_file, path)
+            self._next_position += 1
+
+    def _pop_future(self, path: Path) -> Optional[Future[bytes]]:
+        future = self._futures.pop(path, None)
+        if future is not None:
+            self._prefetched_bytes -= self._file_sizes.pop(path)
+        return future
+
+    def _advance(self, position: int) -> None:
+        """`position`より前のフレームの処理は終わったとみなして、取得されなかったファイルを破棄します。"""
+        for skipped_position in range(self._current_position, min(position, self._next_position)):
+            for path in self._remaining_files[skipped_position]:
+                future = self._pop_future(path)
+                if future is not None:
+                    future.cancel()
+                    self.stats.dropped_count += 1
+            self._remaining_files[skipped_position].clear()
+        self._current_position = max(self._current_position, position)
+
+    def read_bytes(self, path: Path) -> bytes:
+        """
+        ファイルの内容を取得します。先読みが終わっていなければ、読み込みが終わるのを待ちます。
+        先読みの対象でないファイルや、先読みしていないファイルは、その場で読み込みます。
+        """
+        position = self._frame_positions.get(path)
+        if position is not None and position > self._current_position:
+            self._advance(position)
+            self._schedule()
+
+        future = self._pop_future(path)
+        if future is None:
+            self.stats.miss_count += 1
+            data = self.read_file(path)
+        elif future.done():
+            self.stats.hit_count += 1
+            data = future.result()
+        else:
+            started = time.perf_counter()
+            data = future.result()
+            self.stats.stall_count += 1
+            self.stats.stall_seconds += time.perf_counter() - started
+
+        if position is not None:
+            self._remaining_files[position].discard(path)
+            if position == self._current_position and len(self._remaining_files[position]) == 0:
+                self._advance(position + 1)
+            self._schedule()
+        return data
+
+    def close(self) -> None:
+        """先読みを中止します。読み込み中のファイルは、読み込みが終わるのを待ちます。"""
+        for future in self._futures.values():
+            future.cancel()
+        self.stats.dropped_count += len(self._futures)
+        self._futures.clear()
+        self._file_sizes.clear()
+        self._prefetched_bytes = 0
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+
+@dataclass
+class PrefetchConfig(DataClassJsonMixin):
+    """
+    先読みの設定
+
+    Args:
+        frames: 処理中のフレームより後に先読みするフレームの数
+        max_mb: 先読みしたファイルの合計サイズの上限[MB]
+        workers: ファイルを読み込むスレッドの数
+    """
+
+    frames: int = 2
+    max_mb: float = 256
+    workers: int = 4
+
+
+class PrefetchTarget(Protocol):
+    def get_prefetch_files(self, index: int) -> list[Path]: ...
+
+
+@contextmanager
+def prefetch_frames(
+    reader: SequenceFrameReader,
+    frame_index_list: list[int],
+    targets: list[PrefetchTarget],
+    config: Optional[PrefetchConfig],
+) -> Iterator[Optional[FilePrefetcher]]:
+    """
+    `with`文の中で、`reader`がフレームのファイルを先読みしたものから読み込むようにします。
+    先読みするファイルは`targets`の`get_prefetch_files`で決まるので、`sampling_step`で出力しないフレームや、
+    出力済でスキップするフレームのファイルは読み込みません。
+    フレームキャッシュに保存されているファイルは、元ファイルを読み込まないので先読みしません。
+
+    Args:
+        frame_index_list: 処理する順番に並べたフレームの番号
+        targets: フレームごとに読み込むファイルを返すオブジェクト
+        config: 先読みの設定。Noneなら先読みしません。
+    """
+    if config is None or not reader.supports_prefetch:
+        yield None
+        return
+
+    frames = []
+    for index in frame_index_list:
+        frame_files = [
+            path
+            for path in dict.fromkeys(path for target in targets for path in target.get_prefetch_files(index))
+            if not reader.is_frame_cached(path)
+        ]
+        if len(frame_files) > 0:
+            frames.append(frame_files)
+
+    prefetcher = FilePrefetcher(
+        frames, max_frames=config.frames, max_bytes=int(config.max_mb * 1024 * 1024), workers=config.workers
+    )
+    reader.prefetcher = prefetcher
+    try:
+        yield prefetcher
+    finally:
+        reader.prefetcher = None
+        prefetcher.close()
+        stats = prefetcher.stats
+        logger.info(
+            f"先読みの結果 :: ヒット={stats.hit_count}, 待ち={stats.stall_count}({stats.stall_seconds:.2f}s), "
+            f"ミス={stats.miss_count}, 破棄={stats.dropped_count}"
+        )
+
+
+def add_prefetch_arguments(parser: ArgumentParser, *, exclusive_options: Optional[list[str]] = None) -> None:
+    """
+    先読みの引数（`--prefetch_frames`、`--prefetch_max_mb`）を追加します。
+
+    Args:
+        exclusive_options: `--prefetch_frames`と同時に指定できない引数。ヘルプに出力します。
+    """
+    help_message = (
+        "1フレームずつ出力する間に、後の何フレーム分の入力ファイルをバックグラウンドで先読みするか。"
+        "NFSなどの読み込みが遅いストレージで指定します。0なら先読みしません。"
+    )
+    if exclusive_options is not None and len(exclusive_options) > 0:
+        help_message += "、".join(f"`{e}`" for e in exclusive_options) + "とは同時に指定できません。"
+    parser.add_argument("--prefetch_frames", type=int, default=0, required=False, help=help_message)
+    parser.add_argument(
+        "--prefetch_max_mb",
+        type=float,
+        default=256,
+        required=False,
+        help="`--prefetch_frames`を指定した場合の、先読みしたファイルの合計サイズの上限[MB]。",
+    )
+
+
+def create_prefetch_config_from_args(args: Namespace) -> Optional[PrefetchConfig]:
+    """`add_prefetch_arguments`で追加した引数から、先読みの設定を生成します。先読みしない場合はNoneを返します。"""
+    if args.prefetch_frames <= 0:
+        return None
+    return PrefetchConfig(frames=args.prefetch_frames, max_mb=args.prefetch_max_mb)
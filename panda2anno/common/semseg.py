@@ -0,0 +1,94 @@
+import json
+from pathlib import Path
+from typing import Iterator, Optional
+
+import numpy
+from annofab_3dpc.annotation import SegmentData
+
+from panda2anno.common.utils import is_file_content_equal
+
+
+def group_point_indices_by_class(
+    class_ids: numpy.ndarray, point_indices: Optional[numpy.ndarray] = None
+) -> list[tuple[int, numpy.ndarray]]:
+    """
+    semantic segmentationの点を、クラスごとに分けます。
+
+    クラスごとにマスクを作って全点を走査する方法と異なり、1回の安定ソートですべてのクラスの点を分けます。
+    クラスの順番は、`pandas.Series.unique()`と同じく最初に出現した順です。
+    各クラスの点のインデックスは、元の並び順です。
+
+    Args:
+        class_ids: (N,)の各点のクラスID
+        point_indices: (N,)の各点のインデックス。Noneなら`0..N-1`とみなします。
+
+    Returns:
+        (クラスID, そのクラスの点のインデックスの配列)のlist
+    """
+    class_ids = numpy.asarray(class_ids)
+    if len(class_ids) == 0:
+        return []
+
+    order = numpy.argsort(class_ids, kind="stable")
+    sorted_class_ids = class_ids[order]
+    # クラスIDが変わる位置で区切る
+    group_starts = numpy.flatnonzero(numpy.concatenate([[True], sorted_class_ids[1:] != sorted_class_ids[:-1]]))
+    group_ends = numpy.append(group_starts[1:], len(order))
+
+    # 安定ソートなので、各グループの先頭がそのクラスの最初の出現位置になる
+    group_order = numpy.argsort(order[group_starts], kind="stable")
+
+    if point_indices is not None:
+        order = numpy.asarray(point_indices)[order]
+
+    return [(sorted_class_ids[group_starts[i]].item(), order[group_starts[i] : group_ends[i]]) for i in group_order]
+
+
+_SEGMENT_CHUNK_SIZE = 65536
+"""セグメントファイルを出力するときに、1回で文字列に変換する点の数"""
+
+
+def iter_segment_json_chunks(point_indices: numpy.ndarray) -> Iterator[str]:
+    """
+    Annofabのセグメントファイルの内容を、一定数の点ごとに分割して生成します。
+    連結すると`SegmentData(list(point_indices)).to_json()`と同じ文字列になります。
+
+    dataclasses_jsonとjsonモジュールを経由せずに、点のインデックスを一定数ずつ文字列に変換するので、
+    点の数が多くてもメモリ使用量は増えません。
+
+    Args:
+        point_indices: セグメントに含まれる点のインデックス（整数の配列）
+    """
+    point_indices = numpy.asarray(point_indices)
+    assert point_indices.ndim == 1 and numpy.issubdtype(point_indices.dtype, numpy.integer)
+
+    yield '{"points": ['
+    for start in range(0, len(point_indices), _SEGMENT_CHUNK_SIZE):
+        if start > 0:
+            yield ", "
+        yield ", ".join(map(str, point_indices[start : start + _SEGMENT_CHUNK_SIZE].tolist()))
+    yield f'], "kind": {json.dumps(SegmentData.kind)}, "version": {json.dumps(SegmentData.version)}}}'
+
+
+def write_segment_file(point_indices: numpy.ndarray, output_file: Path, *, skip_if_unchanged: bool = False) -> bool:
+    """
+    Annofabのセグメントファイルを出力します。
+    `SegmentData(list(point_indices)).to_json()`と同じバイト列を出力します。
+
+    Args:
+        point_indices: セグメントに含まれる点のインデックス（整数の配列）
+        output_file: 出力先
+        skip_if_unchanged: Trueなら、出力先のファイルの内容が同じ場合は書き込みません。
+
+    Returns:
+        ファイルを書き込んだらTrue
+    """
+    if skip_if_unchanged and is_file_content_equal(
+        output_file, (chunk.encode("utf-8") for chunk in iter_segment_json_chunks(point_indices))
+    ):
+        return False
+
+    with output_file.open("w", encoding="utf-8") as f:
+        for chunk in iter_segment_json_chunks(point_indices):
+            f.write(chunk)
+    return True
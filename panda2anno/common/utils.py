@@ -1,7 +1,11 @@
+import errno
 import json
 import logging
 import math
-from typing import Any, List, Optional
+import os
+import shutil
+from pathlib import Path
+from typing import Any, Iterable, List, Optional
 
 logger = logging.getLogger(__name__)
 
@@ -177,3 +181,89 @@ def get_json_from_args(target: Optional[str] = None) -> Any:
             return json.load(f)
     else:
         return json.loads(target)
+
+
+# Linuxの`ioctl(FICLONE)`のリクエストコード。btrfsやXFSなどで、reflink（copy-on-write）でファイルを複製できる
+_FICLONE = 0x40049409
+
+
+def _try_reflink(src_fd: int, dst_fd: int) -> bool:
+    try:
+        import fcntl  # pylint: disable=import-outside-toplevel
+    except ImportError:
+        # Windows
+        return False
+
+    try:
+        fcntl.ioctl(dst_fd, _FICLONE, src_fd)
+        return True
+    except OSError:
+        return False
+
+
+def _try_copy_file_range(src_fd: int, dst_fd: int) -> bool:
+    copy_file_range = getattr(os, "copy_file_range", None)
+    if copy_file_range is None:
+        return False
+
+    size = os.fstat(src_fd).st_size
+    copied = 0
+    try:
+        while copied < size:
+            length = copy_file_range(src_fd, dst_fd, size - copied)
+            if length == 0:
+                break
+            copied += length
+    except OSError as e:
+        if copied == 0 and e.errno in {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP}:
+            return False
+        raise
+    return copied == size
+
+
+def copy_file(src: Path, dst: Path, *, hardlink: bool = False) -> None:
+    """
+    ファイルをバイト単位でコピーします。
+    reflink、`copy_file_range`の順に試し、どちらも使えなければ`shutil.copyfile`でコピーします。
+
+    Args:
+        src: コピー元のファイル
+        dst: コピー先のファイル。すでに存在する場合は置き換えます。
+        hardlink: Trueならハードリンクを作成します。ハードリンクを作成できない場合（ファイルシステムが異なる場合など）はコピーします。
+    """
+    # 前回ハードリンクで出力したファイルに書き込むと、コピー元のファイルも書き換わってしまうので、先に削除する
+    dst.unlink(missing_ok=True)
+
+    if hardlink:
+        try:
+            os.link(src, dst)
+            return
+        except OSError:
+            logger.debug(f"'{src}'のハードリンクを作成できなかったので、コピーします。", exc_info=True)
+
+    with src.open("rb") as f_src, dst.open("wb") as f_dst:
+        if _try_reflink(f_src.fileno(), f_dst.fileno()):
+            return
+        if _try_copy_file_range(f_src.fileno(), f_dst.fileno()):
+            return
+        f_src.seek(0)
+        f_dst.seek(0)
+        f_dst.truncate()
+        shutil.copyfileobj(f_src, f_dst)
+
+
+def is_file_content_equal(path: Path, chunks: Iterable[bytes]) -> bool:
+    """
+    ファイルの内容が、`chunks`を連結したバイト列と一致するかどうかを判定します。
+    ファイル全体を読み込まずに、`chunks`の要素ごとに比較します。ファイルが存在しなければFalseを返します。
+    """
+    try:
+        f = path.open("rb")
+    except FileNotFoundError:
+        return False
+
+    with f:
+        for chunk in chunks:
+            if f.read(len(chunk)) != chunk:
+                return False
+        return f.read(1) == b""
@@ -0,0 +1,242 @@
+import logging
+from argparse import ArgumentDefaultsHelpFormatter, ArgumentParser
+from pathlib import Path
+from typing import Optional, Protocol
+
+from pandaset.sequence import Sequence
+
+from panda2anno.common.frame_reader import SequenceFrameReader
+from panda2anno.common.frame_sampler import FrameSampler, add_frame_sampler_arguments, create_frame_sampler_from_args
+from panda2anno.common.manifest import add_force_argument
+from panda2anno.common.pandaset_archive import create_frame_reader, open_dataset
+from panda2anno.common.parallel import add_workers_argument, process_sequences
+from panda2anno.common.pose import PoseArray
+from panda2anno.common.prefetch import (
+    PrefetchConfig,
+    add_prefetch_arguments,
+    create_prefetch_config_from_args,
+    prefetch_frames,
+)
+from panda2anno.common.utils import set_default_logger
+from panda2anno.convert_cuboid_to_annofab_annotation import Cuboid2Annofab
+from panda2anno.convert_data_to_kitti import IMAGE_OUTPUT_MODES, Pandaset2Kitti
+from panda2anno.convert_semseg_to_annofab_annotation import Semseg2Annofab
+
+logger = logging.getLogger(__name__)
+
+TARGETS = ["kitti", "cuboid", "semseg"]
+"""
+出力対象。出力先ディレクトリの直下に、それぞれ次のディレクトリを作成します。
+* kitti: `kitti/{sequence_id}`。`convert_data_to_kitti`と同じ出力
+* cuboid: `cuboids/{sequence_id}`。`convert_cuboid_to_annofab_annotation`と同じ出力
+* semseg: `semseg/{sequence_id}`。`convert_semseg_to_annofab_annotation`と同じ出力
+"""
+
+
+class SequenceWriter(Protocol):
+    def get_prefetch_files(self, index: int) -> list[Path]: ...
+
+    def write_frame(self, index: int) -> None: ...
+
+    def finish(self) -> None: ...
+
+
+class PandasetConverter:
+    """
+    1回の実行で、拡張KITTI形式、cuboidのアノテーション、semantic segmentationのアノテーションを出力します。
+
+    シーケンスごとにposeとフレーム数を1回だけ読み込み、フレームごとに各出力を書き込みます。
+    点群、cuboid、semantic segmentationのファイルは、それぞれ1フレームにつき1回だけ読み込みます。
+
+    Args:
+        pandaset2kitti: 拡張KITTI形式の変換の設定。Noneなら出力しません。
+        cuboid2annofab: cuboidの変換の設定。Noneなら出力しません。
+        semseg2annofab: semantic segmentationの変換の設定。Noneなら出力しません。
+        prefetch_config: 指定した場合は、各出力が読み込む後のフレームのファイルを、まとめてバックグラウンドで先読みします。
+    """
+
+    def __init__(
+        self,
+        pandaset2kitti: Optional[Pandaset2Kitti] = None,
+        cuboid2annofab: Optional[Cuboid2Annofab] = None,
+        semseg2annofab: Optional[Semseg2Annofab] = None,
+        prefetch_config: Optional[PrefetchConfig] = None,
+    ) -> None:
+        # 各出力のフレームが一致するように、フレームを選ぶ条件は全出力で共有する
+        frame_samplers = {e.frame_sampler for e in [pandaset2kitti, cuboid2annofab, semseg2annofab] if e is not None}
+        if len(frame_samplers) > 1:
+            raise ValueError(f"各変換のframe_samplerが異なります。 :: {frame_samplers}")
+        self.frame_sampler = frame_samplers.pop() if len(frame_samplers) > 0 else FrameSampler()
+        self.pandaset2kitti = pandaset2kitti
+        self.cuboid2annofab = cuboid2annofab
+        self.semseg2annofab = semseg2annofab
+        self.prefetch_config = prefetch_config
+
+    def create_sequence_writers(
+        self, reader: SequenceFrameReader, root_dir: Path, sequence_id: str
+    ) -> list[SequenceWriter]:
+        # LiDARのposeは全出力で共有する
+        lidar_pose_array = PoseArray.from_pandaset_poses(reader.get_lidar_poses())
+
+        result: list[SequenceWriter] = []
+        if self.pandaset2kitti is not None:
+            result.append(
+                self.pandaset2kitti.create_scene_writer(
+                    reader, root_dir / "kitti" / sequence_id, sequence_id, lidar_pose_array=lidar_pose_array
+                )
+            )
+
+        if self.cuboid2annofab is not None:
+            if reader.has_cuboids():
+                result.append(
+                    self.cuboid2annofab.create_sequence_writer(
+                        reader, root_dir / "cuboids" / sequence_id, sequence_id, lidar_pose_array=lidar_pose_array
+                    )
+                )
+            else:
+                logger.warning(f"{sequence_id=} :: cuboidのアノテーションが存在しないので、cuboidは出力しません。")
+
+        if self.semseg2annofab is not None:
+            if reader.has_semseg():
+                result.append(
+                    self.semseg2annofab.create_sequence_writer(reader, root_dir / "semseg" / sequence_id, sequence_id)
+                )
+            else:
+                logger.warning(
+                    f"{sequence_id=} :: semantic segmentationのアノテーションが存在しないので、"
+                    "semantic segmentationは出力しません。"
+                )
+        return result
+
+    def write_sequence(self, sequence: Sequence, output_dir: Path, sequence_id: str) -> None:
+        """
+        1個のシーケンスを変換します。
+
+        Args:
+            output_dir: 出力先ディレクトリ。出力対象ごとのディレクトリを、このディレクトリの直下に作成します。
+        """
+        reader = create_frame_reader(sequence)
+        sequence_writers = self.create_sequence_writers(reader, output_dir, sequence_id)
+
+        frame_index_list = self.frame_sampler.select_frames(reader)
+        with prefetch_frames(reader, frame_index_list, list(sequence_writers), self.prefetch_config):
+            for index in frame_index_list:
+                for sequence_writer in sequence_writers:
+                    sequence_writer.write_frame(index)
+
+        for sequence_writer in sequence_writers:
+            sequence_writer.finish()
+
+
+def parse_args():
+    parser = ArgumentParser(
+        description="PandaSetを、拡張KITTI形式、cuboidのアノテーション、semantic segmentationのアノテーションに1回の実行で変換します。"
+        "各フレームのファイルは1回だけ読み込みます。",
+        formatter_class=ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("-i", "--input_dir", type=Path, required=True, help="pandasetのディレクトリ")
+    parser.add_argument(
+        "-o",
+        "--output_dir",
+        type=Path,
+        required=True,
+        help="出力先ディレクトリ。直下に`kitti`、`cuboids`、`semseg`ディレクトリを作成します。",
+    )
+
+    parser.add_argument("--sequence_id", type=str, nargs="+", required=False, help="出力対象のsequence id")
+    parser.add_argument(
+        "--target", type=str, nargs="+", choices=TARGETS, default=TARGETS, required=False, help="出力対象"
+    )
+    parser.add_argument(
+        "--camera_name",
+        type=str,
+        nargs="*",
+        required=False,
+        help="出力対象のcamera name。指定しない場合はすべてのカメラを出力します。"
+        "値を指定せずに`--camera_name`だけを指定すると、カメラのファイルを読み込まずに点群だけを出力します。",
+    )
+    parser.add_argument(
+        "--no_images",
+        action="store_true",
+        help="カメラ画像を出力しません。キャリブレーションファイルと`scene.meta`の`camera_view_setting`は出力します。",
+    )
+    add_frame_sampler_arguments(parser)
+    parser.add_argument(
+        "--image_output_mode",
+        type=str,
+        choices=IMAGE_OUTPUT_MODES,
+        default="copy",
+        required=False,
+        help="カメラ画像の出力方法。copy: 元のJPEGファイルをそのままコピーします。"
+        "hardlink: 元のJPEGファイルへのハードリンクを作成します。"
+        "reencode: 画像をデコードしてJPEGに再エンコードします。",
+    )
+    add_force_argument(parser)
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="semantic segmentationについて、前回の出力先ディレクトリと比較して、内容が変わったセグメントファイルだけを書き込み、"
+        "不要になったセグメントファイルを削除します。"
+        "ファイルが変わったフレームのinput_data_idは、semantic segmentationのシーケンスの出力先ディレクトリの"
+        "`changed_input_data_id.txt`に追記します。",
+    )
+    add_workers_argument(parser)
+    add_prefetch_arguments(parser)
+
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    set_default_logger()
+
+    output_dir: Path = args.output_dir
+    output_dir.mkdir(exist_ok=True, parents=True)
+
+    input_dir: Path = args.input_dir
+    targets: list[str] = args.target
+    logger.info(f"{input_dir} を変換して、{output_dir}に出力します。 :: {targets=}")
+
+    # KITTI、cuboid、semsegで同じフレームを出力する
+    frame_sampler = create_frame_sampler_from_args(args)
+    main_obj = PandasetConverter(
+        pandaset2kitti=(
+            Pandaset2Kitti(
+                camera_name_list=args.camera_name,
+                frame_sampler=frame_sampler,
+                image_output_mode=args.image_output_mode,
+                force=args.force,
+                no_images=args.no_images,
+            )
+            if "kitti" in targets
+            else None
+        ),
+        cuboid2annofab=(Cuboid2Annofab(frame_sampler=frame_sampler, force=args.force) if "cuboid" in targets else None),
+        semseg2annofab=(
+            Semseg2Annofab(frame_sampler=frame_sampler, force=args.force, incremental=args.incremental)
+            if "semseg" in targets
+            else None
+        ),
+        prefetch_config=create_prefetch_config_from_args(args),
+    )
+
+    dataset = open_dataset(input_dir)
+
+    if args.sequence_id is None:
+        sequence_id_list = dataset.sequences()
+    else:
+        sequence_id_list = args.sequence_id
+
+    process_sequences(
+        main_obj.write_sequence,
+        input_dir=input_dir,
+        output_dir=output_dir,
+        sequence_id_list=sequence_id_list,
+        process_name="変換",
+        workers=args.workers,
+        output_dir_per_sequence=False,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,106 +1,238 @@
-import json
 import logging
 import math
 from argparse import ArgumentDefaultsHelpFormatter, ArgumentParser
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Any
+from typing import Any, Hashable, Iterator, Mapping, Optional
 
 import numpy
 import pandas
-from annofab_3dpc.annotation import (
-    CuboidAnnotationDetailDataV2,
-    CuboidDirection,
-    CuboidShapeV2,
-    EulerAnglesZXY,
-    Location,
-    Size,
-    Vector3,
-)
-from pandaset import DataSet
 from pandaset.sequence import Sequence
-from pyquaternion import Quaternion
 
-from panda2anno.common.annofab import get_input_data_id_from_pandaset
-from panda2anno.common.pose import Pose
+from panda2anno.common.annofab import (
+    encode_annotation_detail,
+    encode_cuboid_data,
+    get_input_data_id_from_pandaset,
+    iter_annotation_file_chunks,
+    write_annotation_file,
+)
+from panda2anno.common.annotation_archive import (
+    DATASET_ARCHIVE_FILENAME,
+    OUTPUT_FORMATS,
+    ZIP_COMPRESSIONS,
+    ZIP_SCOPES,
+    AnnotationArchive,
+)
+from panda2anno.common.frame_reader import SequenceFrameReader
+from panda2anno.common.frame_sampler import FrameSampler, add_frame_sampler_arguments, create_frame_sampler_from_args
+from panda2anno.common.manifest import ManifestRecorder, add_force_argument
+from panda2anno.common.pandaset_archive import create_frame_reader, open_dataset
+from panda2anno.common.parallel import add_workers_argument, process_sequences
+from panda2anno.common.pose import Pose, PoseArray
+from panda2anno.common.prefetch import (
+    PrefetchConfig,
+    add_prefetch_arguments,
+    create_prefetch_config_from_args,
+    prefetch_frames,
+)
 from panda2anno.common.utils import set_default_logger
 
 logger = logging.getLogger(__name__)
 
+ATTRIBUTE_COLUMNS = [
+    "attributes.object_motion",
+    "attributes.rider_status",
+    "attributes.pedestrian_behavior",
+    "attributes.pedestrian_age",
+]
+"""Annofabの属性に変換するcuboidの列"""
+
+
+def _get_value_or_empty(value: Any) -> str:
+    if value is None:
+        return ""
+    elif isinstance(value, float) and numpy.isnan(value):
+        return ""
+    return str(value)
+
 
 class Cuboid2Annofab:
-    def __init__(self, sampling_step: int = 1) -> None:
-        self.sampling_step = sampling_step
+    def __init__(
+        self,
+        sampling_step: int = 1,
+        force: bool = False,
+        output_format: str = "directory",
+        zip_compression: str = "deflate",
+        prefetch_config: Optional[PrefetchConfig] = None,
+        frame_sampler: Optional[FrameSampler] = None,
+    ) -> None:
+        """
+        Args:
+            force: Trueなら、出力済のフレームも変換し直します。Falseなら、入力ファイルと変換パラメータが前回から変わっていないフレームはスキップします。
+            output_format: `OUTPUT_FORMATS`のいずれか。zipなら、シーケンスごとに`{sequence_id}.zip`を出力します。
+                `open_dataset_archive`の中で変換した場合は、すべてのシーケンスを1個のzipファイルに出力します。
+            zip_compression: zipファイルのエントリの圧縮方式。`ZIP_COMPRESSIONS`のいずれか。
+            prefetch_config: 指定した場合は、後のフレームのcuboidのファイルをバックグラウンドで先読みします。
+            frame_sampler: 変換するフレームを選ぶ条件。指定した場合は`sampling_step`を指定できません。
+        """
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"{output_format=}は不正な値です。{OUTPUT_FORMATS}のいずれかを指定してください。")
+        if zip_compression not in ZIP_COMPRESSIONS:
+            raise ValueError(
+                f"{zip_compression=}は不正な値です。{list(ZIP_COMPRESSIONS)}のいずれかを指定してください。"
+            )
+        if frame_sampler is not None and sampling_step != 1:
+            raise ValueError("sampling_stepとframe_samplerは同時に指定できません。")
+        self.frame_sampler = frame_sampler if frame_sampler is not None else FrameSampler(sampling_step=sampling_step)
+        self.force = force
+        self.output_format = output_format
+        self.zip_compression = zip_compression
+        self.prefetch_config = prefetch_config
+        self.dataset_archive: Optional[AnnotationArchive] = None
+
+    @classmethod
+    def _get_attributes(cls, cuboid: Mapping[Hashable, Any]) -> dict[str, str]:
+        attributes = {column.split(".", 1)[1]: _get_value_or_empty(cuboid[column]) for column in ATTRIBUTE_COLUMNS}
+        attributes["tracking_id"] = cuboid["uuid"]  # uuidはトラッキングに利用できるので、設定する
+        return attributes
 
     @classmethod
-    def get_direction(cls, euler_angle: EulerAnglesZXY) -> CuboidDirection:
-        q = Quaternion(euler_angle.to_quaternion())
-        rotation_matrix = q.rotation_matrix
-        before_front = numpy.array([1, 0, 0]).T
-        before_up = numpy.array([0, 0, 1]).T
-        front = (rotation_matrix @ before_front).flatten()
-        up = (rotation_matrix @ before_up).flatten()
-        return CuboidDirection(front=Vector3(front[0], front[1], front[2]), up=Vector3(up[0], up[1], up[2]))
-
-    def get_annotation_detail(self, cuboid: dict[str, Any], lidar_pose: Pose) -> dict[str, Any]:
-        """1個のcuboidに対応するAnnofabのアノテーションを取得します。"""
-
-        # lidar座標系のpositionを取得する
-        position_in_lidar_coordinate = lidar_pose.inverse() * numpy.array(
-            [[cuboid["position.x"], cuboid["position.y"], cuboid["position.z"]]]
+    def get_directions(cls, yaws: numpy.ndarray) -> tuple[numpy.ndarray, numpy.ndarray]:
+        """
+        z軸周りの回転角度から、cuboidの向き（front, up）をまとめて計算します。
+        `EulerAnglesZXY.to_quaternion`で求めたクォータニオンから、pyquaternionの`rotation_matrix`で計算した場合と同じ値になるように、
+        計算順序を合わせています。
+
+        Args:
+            yaws: (N,)のz軸周りの回転角度[rad]
+
+        Returns:
+            tuple[(N,3)のfront, (N,3)のup]
+        """
+        half_roll = yaws * 0.5
+        sin_roll = numpy.sin(half_roll)
+        cos_roll = numpy.cos(half_roll)
+        # x軸、y軸周りの回転角度は0
+        sin_zero = numpy.sin(0.0)
+        cos_zero = numpy.cos(0.0)
+
+        qx = (cos_zero * sin_zero * cos_roll) + (sin_zero * cos_zero * sin_roll)
+        qy = (sin_zero * cos_zero * cos_roll) - (cos_zero * sin_zero * sin_roll)
+        qz = (cos_zero * cos_zero * sin_roll) - (sin_zero * sin_zero * cos_roll)
+        qw = (cos_zero * cos_zero * cos_roll) + (sin_zero * sin_zero * sin_roll)
+
+        # `Quaternion.rotation_matrix`と同じく、左右からの積の行列の積で回転行列を求める。
+        # cos^2 + sin^2は単位クォータニオンの許容誤差に収まるので、正規化はしない
+        q_matrix = numpy.stack(
+            [
+                numpy.stack([qw, -qx, -qy, -qz], axis=-1),
+                numpy.stack([qx, qw, -qz, qy], axis=-1),
+                numpy.stack([qy, qz, qw, -qx], axis=-1),
+                numpy.stack([qz, -qy, qx, qw], axis=-1),
+            ],
+            axis=-2,
         )
+        q_bar_matrix = numpy.stack(
+            [
+                numpy.stack([qw, -qx, -qy, -qz], axis=-1),
+                numpy.stack([qx, qw, qz, -qy], axis=-1),
+                numpy.stack([qy, -qz, qw, qx], axis=-1),
+                numpy.stack([qz, qy, -qx, qw], axis=-1),
+            ],
+            axis=-2,
+        )
+        rotation_matrices = numpy.matmul(q_matrix, numpy.swapaxes(q_bar_matrix, -1, -2))[:, 1:, 1:]
+
+        front = rotation_matrices @ numpy.array([1, 0, 0]).T
+        up = rotation_matrices @ numpy.array([0, 0, 1]).T
+        return front, up
+
+    def get_cuboid_shape_values(self, cuboid_data: pandas.DataFrame, lidar_pose: Pose) -> numpy.ndarray:
+        """
+        1フレーム分のcuboidの大きさ、lidar座標系の位置、向きを、フレーム内のcuboidについてまとめて計算します。
+
+        Returns:
+            (N,13)の配列。列は`CUBOID_SHAPE_COLUMNS`
+        """
+        inverse_lidar_pose = lidar_pose.inverse()
+
+        # `Pose * 点群`を1点ずつ計算した場合と同じ値になるように、(N,1,3)の配列として変換する
+        positions = cuboid_data[["position.x", "position.y", "position.z"]].to_numpy(dtype=numpy.float64)
+        rotation_matrix = inverse_lidar_pose.rotation_matrix
+        positions_in_lidar_coordinate = (positions[:, numpy.newaxis, :] @ rotation_matrix.T)[:, 0, :]
+        positions_in_lidar_coordinate += inverse_lidar_pose.tvec
 
-        # X軸に対するZ軸の回転角度
-        tmp_yaw, _, _ = lidar_pose.inverse().rotation.yaw_pitch_roll
         # pandasetのyawはY軸に対するyawなので、math.pi/2を加える
-        yaw = tmp_yaw + cuboid["yaw"] + math.pi / 2
-
-        rotation = EulerAnglesZXY(0, 0, yaw)
-        cuboid_data = CuboidAnnotationDetailDataV2(
-            CuboidShapeV2(
-                dimensions=Size(
-                    width=cuboid["dimensions.x"],
-                    height=cuboid["dimensions.z"],
-                    depth=cuboid["dimensions.y"],
-                ),
-                location=Location(
-                    position_in_lidar_coordinate[0][0],
-                    position_in_lidar_coordinate[0][1],
-                    position_in_lidar_coordinate[0][2],
-                ),
-                #
-                rotation=rotation,
-                direction=self.get_direction(rotation),
-            )
+        yaws = inverse_lidar_pose.yaw + cuboid_data["yaw"].to_numpy(dtype=numpy.float64) + math.pi / 2
+        fronts, ups = self.get_directions(yaws)
+
+        dimensions = cuboid_data[["dimensions.x", "dimensions.y", "dimensions.z"]].to_numpy(dtype=numpy.float64)
+        return numpy.column_stack(
+            [
+                # width, height, depth
+                dimensions[:, [0, 2, 1]],
+                positions_in_lidar_coordinate,
+                yaws,
+                fronts,
+                ups,
+            ]
         )
 
-        def get_value_or_empty(value: Any) -> str:
-            if value is None:
-                return ""
-            elif isinstance(value, float) and numpy.isnan(value):
-                return ""
-            return str(value)
-
-        attributes = {
-            "object_motion": get_value_or_empty(cuboid["attributes.object_motion"]),
-            "rider_status": get_value_or_empty(cuboid["attributes.rider_status"]),
-            "pedestrian_behavior": get_value_or_empty(cuboid["attributes.pedestrian_behavior"]),
-            "pedestrian_age": get_value_or_empty(cuboid["attributes.pedestrian_age"]),
-            "tracking_id": cuboid["uuid"],  # uuidはトラッキングに利用できるので、設定する
-        }
-        result = {
-            "annotation_id": cuboid["uuid"],
-            "label": cuboid["label"],
-            "attributes": attributes,
-            "data": cuboid_data.dump(),
-        }
-        return result
+    def get_encoded_annotation_details(self, cuboid_data: pandas.DataFrame, lidar_pose: Pose) -> list[str]:
+        """
+        1フレーム分のcuboidに対応するAnnofabのアノテーションを、`json.dumps`と同じ形式の文字列で取得します。
+        位置や向きはフレーム内のcuboidについてまとめて計算し、dictを経由せずにテンプレートに値を埋め込むので、`data`を2回エンコードしません。
+        """
+        if len(cuboid_data) == 0:
+            return []
+
+        encoded_data_list = encode_cuboid_data(self.get_cuboid_shape_values(cuboid_data, lidar_pose))
+        cuboid_list = cuboid_data[["uuid", "label", *ATTRIBUTE_COLUMNS]].to_dict("records")
+        return [
+            encode_annotation_detail(
+                cuboid["uuid"], cuboid["label"], encoded_data, attributes=self._get_attributes(cuboid)
+            )
+            for cuboid, encoded_data in zip(cuboid_list, encoded_data_list)
+        ]
 
     def write_cuboid_annotation_json(self, cuboid_data: pandas.DataFrame, lidar_pose: Pose, output_file: Path):
-        cuboid_list = cuboid_data.to_dict("records")
-        annotation_details = [self.get_annotation_detail(cuboid, lidar_pose) for cuboid in cuboid_list]
+        write_annotation_file(output_file, self.get_encoded_annotation_details(cuboid_data, lidar_pose))
+
+    def create_sequence_writer(
+        self,
+        reader: SequenceFrameReader,
+        output_dir: Path,
+        sequence_id: str,
+        *,
+        lidar_pose_array: Optional[PoseArray] = None,
+        archive: Optional[AnnotationArchive] = None,
+    ) -> "CuboidSequenceWriter":
+        """
+        1個のシーケンスのcuboidをAnnofabのアノテーションに変換するwriterを生成します。
+
+        Args:
+            lidar_pose_array: 全フレームのLiDARのpose。Noneなら`reader`から読み込みます。
+            archive: 指定した場合は、`output_dir`ではなくzipファイルに出力します。
+        """
+        return CuboidSequenceWriter(
+            self, reader, output_dir, sequence_id, lidar_pose_array=lidar_pose_array, archive=archive
+        )
 
-        with output_file.open(mode="w") as f:
-            json.dump({"details": annotation_details}, f)
+    @contextmanager
+    def open_dataset_archive(self, output_dir: Path) -> Iterator[AnnotationArchive]:
+        """
+        `with`文の中で変換したすべてのシーケンスを、`{output_dir}/annotation.zip`に出力します。
+        シーケンスは同じプロセスで変換してください。
+        `with`文の中で例外が発生した場合は、zipファイルを出力しません。
+        """
+        if self.output_format != "zip":
+            raise ValueError("output_formatがzipの場合のみ、1個のzipファイルに出力できます。")
+        with AnnotationArchive(output_dir / DATASET_ARCHIVE_FILENAME, compression=self.zip_compression) as archive:
+            self.dataset_archive = archive
+            try:
+                yield archive
+            finally:
+                self.dataset_archive = None
 
     def write_cuboid_annotations(
         self,
@@ -108,22 +240,128 @@ class Cuboid2Annofab:
         output_dir: Path,
         sequence_id: str,
     ):
-        output_dir.mkdir(exist_ok=True, parents=True)
-        sequence.load_lidar()
+        reader = create_frame_reader(sequence)
+        if self.output_format == "zip" and self.dataset_archive is None:
+            with AnnotationArchive(
+                output_dir.parent / f"{sequence_id}.zip", compression=self.zip_compression
+            ) as archive:
+                self._write_sequence(reader, output_dir, sequence_id, archive)
+        else:
+            self._write_sequence(reader, output_dir, sequence_id, self.dataset_archive)
+
+    def _write_sequence(
+        self,
+        reader: SequenceFrameReader,
+        output_dir: Path,
+        sequence_id: str,
+        archive: Optional[AnnotationArchive],
+    ) -> None:
+        sequence_writer = self.create_sequence_writer(reader, output_dir, sequence_id, archive=archive)
+        with prefetch_frames(reader, sequence_writer.frame_index_list, [sequence_writer], self.prefetch_config):
+            for index in sequence_writer.frame_index_list:
+                sequence_writer.write_frame(index)
+        sequence_writer.finish()
+
+
+class CuboidSequenceWriter:
+    """
+    1個のシーケンスのcuboidを、Annofabのアノテーションに変換して出力します。
+    出力対象のフレームごとに`write_frame`を呼び出し、最後に`finish`を呼び出してください。
+
+    Args:
+        converter: 変換の設定
+        reader: シーケンスのreader
+        output_dir: シーケンスの出力先ディレクトリ
+        sequence_id: sequence_id
+        lidar_pose_array: 全フレームのLiDARのpose。Noneなら`reader`から読み込みます。
+        archive: 指定した場合は、`output_dir`ではなくzipファイルの`{sequence_id}/{input_data_id}.json`に出力します。
+            zipファイルは毎回作り直すので、出力済のフレームのスキップは行いません。
+    """
+
+    def __init__(
+        self,
+        converter: Cuboid2Annofab,
+        reader: SequenceFrameReader,
+        output_dir: Path,
+        sequence_id: str,
+        *,
+        lidar_pose_array: Optional[PoseArray] = None,
+        archive: Optional[AnnotationArchive] = None,
+    ) -> None:
+        self.converter = converter
+        self.reader = reader
+        self.output_dir = output_dir
+        self.sequence_id = sequence_id
+        self.archive = archive
+
+        self.frame_index_list = converter.frame_sampler.select_frames(reader)
+        self.lidar_pose_array = (
+            lidar_pose_array
+            if lidar_pose_array is not None
+            else PoseArray.from_pandaset_poses(reader.get_lidar_poses())
+        )
 
-        range_obj = range(0, len(sequence.lidar.data), self.sampling_step)
+        self.manifest: Optional[ManifestRecorder] = None
+        if archive is None:
+            output_dir.mkdir(exist_ok=True, parents=True)
+            self.manifest = ManifestRecorder(
+                output_dir,
+                reader.get_sequence_dir(),
+                parameters=converter.frame_sampler.to_dict(),
+                force=converter.force,
+                get_input_fingerprint=reader.get_input_fingerprint,
+            )
 
-        sequence.load_cuboids()
+    def _get_input_files(self, index: int) -> list[Path]:
+        return [self.reader.get_cuboids_file_path(index), self.reader.get_lidar_poses_file_path()]
+
+    def get_prefetch_files(self, index: int) -> list[Path]:
+        """`write_frame`でフレームごとに読み込むファイルを返します。出力済のフレームなら空のlistを返します。"""
+        if self.manifest is not None and self.manifest.is_frame_up_to_date(
+            get_input_data_id_from_pandaset(self.sequence_id, index),
+            self._get_input_files(index),
+            parameters={},
+            count_skipped=False,
+        ):
+            return []
+        return [self.reader.get_cuboids_file_path(index)]
+
+    def write_frame(self, index: int) -> None:
+        """1フレームのcuboidを出力します。出力済のフレームはスキップします。"""
+        input_data_id = get_input_data_id_from_pandaset(self.sequence_id, index)
+        if self.archive is not None:
+            encoded_details = self.converter.get_encoded_annotation_details(
+                self.reader.read_cuboids(index), lidar_pose=self.lidar_pose_array[index]
+            )
+            self.archive.write_chunks(
+                f"{self.sequence_id}/{input_data_id}.json", iter_annotation_file_chunks(encoded_details)
+            )
+            return
+
+        assert self.manifest is not None
+        input_files = self._get_input_files(index)
+        if self.manifest.is_frame_up_to_date(input_data_id, input_files, parameters={}):
+            return
 
-        for index in range_obj:
-            filename = f"{get_input_data_id_from_pandaset(sequence_id, index)}.json"
+        output_file = self.output_dir / f"{input_data_id}.json"
+        cuboid_data = self.reader.read_cuboids(index)
 
-            cuboid_data = sequence.cuboids.data[index]
+        self.converter.write_cuboid_annotation_json(
+            cuboid_data, lidar_pose=self.lidar_pose_array[index], output_file=output_file
+        )
+        self.manifest.record_frame(input_data_id, input_files, [output_file], parameters={})
 
-            dict_lidar_pose = sequence.lidar.poses[index]
-            self.write_cuboid_annotation_json(
-                cuboid_data, lidar_pose=Pose.from_pandaset_pose(dict_lidar_pose), output_file=output_dir / filename
+    def finish(self) -> None:
+        if self.manifest is not None:
+            # 前回だけ出力したフレームのファイルは、インポートされないように削除する
+            self.manifest.compact(
+                frame_ids=[get_input_data_id_from_pandaset(self.sequence_id, index) for index in self.frame_index_list]
             )
+            if self.manifest.skipped_frame_count > 0:
+                logger.info(
+                    f"sequence_id='{self.sequence_id}' :: {len(self.frame_index_list)}件中"
+                    f"{self.manifest.skipped_frame_count}件のフレームは出力済なので、スキップしました。"
+                )
 
 
 def parse_args():
@@ -135,7 +373,37 @@ def parse_args():
     parser.add_argument("-o", "--output_dir", type=Path, required=True, help="出力先ディレクトリ")
 
     parser.add_argument("--sequence_id", type=str, nargs="+", required=False, help="出力対象のsequence id")
-    parser.add_argument("--sampling_step", type=int, default=1, required=False, help="指定した値ごとにフレームを出力します。")
+    add_frame_sampler_arguments(parser)
+    add_force_argument(parser)
+    add_workers_argument(parser)
+    parser.add_argument(
+        "--output_format",
+        type=str,
+        choices=OUTPUT_FORMATS,
+        default="directory",
+        required=False,
+        help="出力形式。zip: 一時ファイルを作成せずに、アノテーションをzipファイルに直接書き込みます。"
+        "`--force`を指定しなくても全フレームを出力します。",
+    )
+    parser.add_argument(
+        "--zip_compression",
+        type=str,
+        choices=list(ZIP_COMPRESSIONS),
+        default="deflate",
+        required=False,
+        help="zipファイルのエントリの圧縮方式。stored: 圧縮しません。deflate: deflateで圧縮します。",
+    )
+    parser.add_argument(
+        "--zip_scope",
+        type=str,
+        choices=ZIP_SCOPES,
+        default="sequence",
+        required=False,
+        help="zipファイルの単位。sequence: シーケンスごとに`{sequence_id}.zip`を出力します。"
+        "dataset: すべてのシーケンスを`annotation.zip`に出力します。変換に失敗したシーケンスがある場合は出力しません。"
+        "datasetの場合は`--workers`に2以上を指定できません。",
+    )
+    add_prefetch_arguments(parser)
 
     return parser.parse_args()
 
@@ -150,24 +418,44 @@ def main() -> None:
     input_dir: Path = args.input_dir
     logger.info(f"{input_dir} をKITTIに変換して、{output_dir}にAnnofabのアノテーションを出力します。")
 
-    main_obj = Cuboid2Annofab(sampling_step=args.sampling_step)
+    main_obj = Cuboid2Annofab(
+        frame_sampler=create_frame_sampler_from_args(args),
+        force=args.force,
+        output_format=args.output_format,
+        zip_compression=args.zip_compression,
+        prefetch_config=create_prefetch_config_from_args(args),
+    )
 
-    dataset = DataSet(str(input_dir))
+    dataset = open_dataset(input_dir)
 
     if args.sequence_id is None:
         sequence_id_list = dataset.sequences()
     else:
         sequence_id_list = args.sequence_id
 
-    for sequence_id in sequence_id_list:
-        sequence = dataset[sequence_id]
-        logger.info(f"{sequence_id=}のcuboidをAnnofabのアノテーションに変換します。")
-        try:
-            main_obj.write_cuboid_annotations(sequence, output_dir=output_dir / sequence_id, sequence_id=sequence_id)
-        except Exception:
-            logger.warning(f"{sequence_id=}のcuboidをAnnofabのアノテーションへの変換に失敗しました。", exc_info=True)
-        finally:
-            dataset.unload(sequence_id)
+    def process() -> list[str]:
+        return process_sequences(
+            main_obj.write_cuboid_annotations,
+            input_dir=input_dir,
+            output_dir=output_dir,
+            sequence_id_list=sequence_id_list,
+            process_name="cuboidのAnnofabのアノテーションへの変換",
+            workers=args.workers,
+        )
+
+    if args.output_format == "zip" and args.zip_scope == "dataset":
+        if args.workers > 1:
+            raise ValueError("`--zip_scope dataset`の場合は、`--workers`に2以上を指定できません。")
+        with main_obj.open_dataset_archive(output_dir):
+            failed_sequence_id_list = process()
+            if len(failed_sequence_id_list) > 0:
+                # 失敗したシーケンスの途中までのエントリを含むzipファイルは、インポートできないので出力しない
+                raise RuntimeError(
+                    f"{len(failed_sequence_id_list)}件のシーケンスの変換に失敗したので、"
+                    f"'{output_dir / DATASET_ARCHIVE_FILENAME}'を出力しませんでした。 :: {failed_sequence_id_list}"
+                )
+    else:
+        process()
 
 
 if __name__ == "__main__":
@@ -1,29 +1,128 @@
+import io
+import itertools
 import logging
 import math
 from argparse import ArgumentDefaultsHelpFormatter, ArgumentParser
+from dataclasses import dataclass, field
+from functools import partial
 from pathlib import Path
-from typing import Optional
+from typing import Iterator, Optional
 
 import numpy
 import pandas
-from pandaset import DataSet
 from pandaset.sensors import Intrinsics
 from pandaset.sequence import Sequence
+from PIL import Image
 from pyquaternion import Quaternion
 
 from panda2anno.common.annofab import get_input_data_id_from_pandaset
 from panda2anno.common.camera import get_camera_matrix_from_intrinsics
+from panda2anno.common.frame_parallel import SharedArrays, map_frames
+from panda2anno.common.frame_reader import SequenceFrameReader
+from panda2anno.common.frame_sampler import FrameSampler, add_frame_sampler_arguments, create_frame_sampler_from_args
 from panda2anno.common.kitti import XYZ, CameraViewSettings, KittiImageSeries, KittiVelodyneSeries
 from panda2anno.common.kitti import Scene as KittiScene
-from panda2anno.common.pose import Pose
-from panda2anno.common.utils import set_default_logger
+from panda2anno.common.manifest import ManifestRecorder, add_force_argument
+from panda2anno.common.pandaset_archive import create_frame_reader, open_dataset
+from panda2anno.common.parallel import add_workers_argument, process_sequences
+from panda2anno.common.pipeline import (
+    Pipeline,
+    PipelineConfig,
+    StageReport,
+    format_stage_reports,
+    parse_stage_workers,
+)
+from panda2anno.common.pointcloud import (
+    PointCloudFilter,
+    transform_kitti_velodyne_arrays,
+    transform_kitti_velodyne_points,
+    write_kitti_velodyne_points,
+)
+from panda2anno.common.pose import Pose, PoseArray
+from panda2anno.common.prefetch import (
+    PrefetchConfig,
+    add_prefetch_arguments,
+    create_prefetch_config_from_args,
+    prefetch_frames,
+)
+from panda2anno.common.utils import copy_file, set_default_logger
 
 logger = logging.getLogger(__name__)
 
+IMAGE_OUTPUT_MODES = ["copy", "hardlink", "reencode"]
+"""
+カメラ画像の出力方法。
+* copy: 元のJPEGファイルをバイト単位でコピーする
+* hardlink: 元のJPEGファイルへのハードリンクを作成する。作成できない場合はコピーする
+* reencode: Pillowでデコードして、JPEGに再エンコードする
+"""
+
+KITTI_PIPELINE_STAGES = ["load", "transform", "serialize", "write"]
+"""
+`--pipeline`を指定した場合の、1フレームを出力する処理のステージ。
+* load: 点群を読み込む
+* transform: 点群をLiDAR座標系に変換して、絞り込む
+* serialize: 点群、キャリブレーション、（reencodeの場合は）カメラ画像をバイト列に変換する
+* write: ファイルに書き込む
+"""
+
+KITTI_PIPELINE_PROCESS_STAGES = ["transform", "serialize"]
+"""プロセスプールで実行できるステージ"""
+
 
 class Pandaset2Kitti:
-    def __init__(self, sampling_step: int = 1, camera_name_list: Optional[list[str]] = None) -> None:
-        self.sampling_step = sampling_step
+    IMAGE_FILE_EXTENSION = "jpg"
+
+    def __init__(
+        self,
+        sampling_step: int = 1,
+        camera_name_list: Optional[list[str]] = None,
+        image_output_mode: str = "copy",
+        force: bool = False,
+        point_cloud_filter: Optional[PointCloudFilter] = None,
+        pipeline_config: Optional[PipelineConfig] = None,
+        frame_workers: int = 1,
+        no_images: bool = False,
+        prefetch_config: Optional[PrefetchConfig] = None,
+        frame_sampler: Optional[FrameSampler] = None,
+    ) -> None:
+        """
+        Args:
+            camera_name_list: 出力対象のカメラ。Noneならすべてのカメラ、空のlistなら点群だけを出力します。
+                指定しなかったカメラのファイルは読み込みません。
+            no_images: Trueなら、カメラ画像を出力しません。キャリブレーションファイルと`scene.meta`の`camera_view_setting`は、
+                カメラのposeと内部パラメータから出力します。カメラ画像のファイルは読み込みません。
+                `scene.meta`のカメラのseriesには、`image_dir`を出力しません。
+            point_cloud_filter: velodyne bin fileに出力する点群を絞り込む条件。Noneならすべての点を出力します。
+            force: Trueなら、出力済のフレームも変換し直します。Falseなら、入力ファイルと変換パラメータが前回から変わっていないフレームはスキップします。
+            pipeline_config: 指定した場合、シーケンス内のフレームを`KITTI_PIPELINE_STAGES`のステージに分けて並行に出力します。
+                Noneなら1フレームずつ順番に出力します。
+            frame_workers: 2以上なら、シーケンス内のフレームをプロセスプールで並列に出力します。
+                点群は共有メモリ経由でワーカプロセスに渡します。`pipeline_config`とは同時に指定できません。
+            prefetch_config: 指定した場合は、1フレームずつ順番に出力する間に、後のフレームの点群とカメラ画像をバックグラウンドで先読みします。
+                `pipeline_config`、`frame_workers`とは同時に指定できません。
+            frame_sampler: 変換するフレームを選ぶ条件。指定した場合は`sampling_step`を指定できません。
+        """
+        if frame_workers < 1:
+            raise ValueError(f"frame_workersには1以上を指定してください。 :: {frame_workers=}")
+        if frame_workers > 1 and pipeline_config is not None:
+            raise ValueError("frame_workersとpipeline_configは同時に指定できません。")
+        if prefetch_config is not None and (frame_workers > 1 or pipeline_config is not None):
+            raise ValueError("prefetch_configは、frame_workersやpipeline_configと同時に指定できません。")
+        if frame_sampler is not None and sampling_step != 1:
+            raise ValueError("sampling_stepとframe_samplerは同時に指定できません。")
+        self.prefetch_config = prefetch_config
+        self.frame_workers = frame_workers
+        self.no_images = no_images
+        self.frame_sampler = frame_sampler if frame_sampler is not None else FrameSampler(sampling_step=sampling_step)
+        self.force = force
+        self.point_cloud_filter = point_cloud_filter
+        if pipeline_config is not None:
+            pipeline_config.validate(KITTI_PIPELINE_STAGES, KITTI_PIPELINE_PROCESS_STAGES)
+        self.pipeline_config = pipeline_config
+        if image_output_mode not in IMAGE_OUTPUT_MODES:
+            raise ValueError(f"{image_output_mode=}は不正な値です。{IMAGE_OUTPUT_MODES}のいずれかを指定してください。")
+        self.image_output_mode = image_output_mode
         if camera_name_list is None:
             # Annofabで表示する補助画像の順番が自然になるようにする
             self.camera_name_list = [
@@ -38,7 +137,13 @@ class Pandaset2Kitti:
             self.camera_name_list = camera_name_list
 
     @classmethod
-    def write_velodyne_bin_file(cls, lidar_data: pandas.DataFrame, lidar_pose: Pose, output_file: Path) -> None:
+    def write_velodyne_bin_file(
+        cls,
+        lidar_data: pandas.DataFrame,
+        lidar_pose: Pose,
+        output_file: Path,
+        point_cloud_filter: Optional[PointCloudFilter] = None,
+    ) -> tuple[int, int]:
         """
         LiDARの点群データを、KITTIのvelodyne bin fileに出力する。
 
@@ -46,23 +151,29 @@ class Pandaset2Kitti:
         https://github.com/yanii/kitti-pcl/blob/3b4ebfd49912702781b7c5b1cf88a00a8974d944/KITTI_README.TXT#L51-L67
         変換方法
         (N,3) -> (N,4) -> (1,M)
+        座標変換と強度の結合は、1個の(N,4)のfloat32の配列に直接書き込みます。
 
+        Returns:
+            tuple(入力した点の数, 出力した点の数)
         """
         # グローバル座標系からlidar座標系に変換する
         # そうしないと、自車の中心が原点でなくなる
-        original_data = lidar_data[["x", "y", "z"]].values
-        converted_data = lidar_pose.inverse() * original_data
-
-        data = numpy.hstack(
-            (
-                converted_data,
-                lidar_data[["i"]].values,
-            )
+        return write_kitti_velodyne_points(
+            lidar_data, pose=lidar_pose.inverse(), output_file=output_file, point_cloud_filter=point_cloud_filter
         )
-        # 1次元の配列に変換する
-        flatten_data = data.flatten().astype(numpy.float32)
-        output_file.parent.mkdir(exist_ok=True, parents=True)
-        flatten_data.tofile(str(output_file))
+
+    def write_image_file(self, reader: SequenceFrameReader, camera_name: str, index: int, output_file: Path) -> None:
+        """
+        カメラ画像を出力する。
+        `image_output_mode`が"reencode"でなければ、デコードせずに元のJPEGファイルをそのまま出力する。
+        """
+        if self.image_output_mode == "reencode":
+            # 前回ハードリンクで出力したファイルに書き込むと、元のJPEGファイルも書き換わってしまうので、先に削除する
+            output_file.unlink(missing_ok=True)
+            with reader.read_camera_image(camera_name, index) as pillow_image_obj:
+                pillow_image_obj.save(str(output_file))
+        else:
+            reader.copy_camera_image(camera_name, index, output_file, hardlink=self.image_output_mode == "hardlink")
 
     @classmethod
     def write_calibration_file(
@@ -82,19 +193,64 @@ class Pandaset2Kitti:
             output_file: 出力先
 
         """
+        # lidar座標系→world座標系→camera座標系に変換する。行列サイズは3x4
+        Tr_velo_to_cam = (camera_pose.inverse() * lidar_pose).matrix[:3, :]
+        cls.write_calibration_file_from_matrix(Tr_velo_to_cam, camera_intrinsics, output_file)
+
+    @classmethod
+    def get_velo_to_cam_matrices(cls, camera_poses: PoseArray, lidar_poses: PoseArray) -> numpy.ndarray:
+        """
+        lidar座標系からcamera座標系への変換行列を、まとめて計算する。
+
+        Args:
+            camera_poses: World座標系に対するCameraのpose
+            lidar_poses: World座標系に対するLiDar Sensorのpose
+
+        Returns:
+            (N,3,4)の変換行列
+        """
+        return (camera_poses.inverse() * lidar_poses).matrices[:, :3, :]
+
+    @classmethod
+    def write_calibration_file_from_matrix(
+        cls,
+        velo_to_cam_matrix: numpy.ndarray,
+        camera_intrinsics: Intrinsics,
+        output_file: Path,
+    ) -> None:
+        """
+        KITTIのcalibration ファイルを生成する。
+
+        Args:
+            velo_to_cam_matrix: lidar座標系からcamera座標系への3x4の変換行列
+            camera_intrinsics: カメラの内部パラメータ
+            output_file: 出力先
+        """
+        output_file.parent.mkdir(exist_ok=True, parents=True)
+        with output_file.open(mode="w") as f:
+            f.write(cls.get_calibration_text(velo_to_cam_matrix, camera_intrinsics))
+
+    @classmethod
+    def get_calibration_text(cls, velo_to_cam_matrix: numpy.ndarray, camera_intrinsics: Intrinsics) -> str:
+        """
+        KITTIのcalibration ファイルの内容を生成する。
+
+        Args:
+            velo_to_cam_matrix: lidar座標系からcamera座標系への3x4の変換行列
+            camera_intrinsics: カメラの内部パラメータ
+        """
         P2 = numpy.zeros((3, 4))
         P2[:3, :3] = get_camera_matrix_from_intrinsics(camera_intrinsics)
 
         R0_rect = numpy.eye(3)
 
-        # lidar座標系→world座標系→camera座標系に変換する。行列サイズは3x4
-        Tr_velo_to_cam = (camera_pose.inverse() * lidar_pose).matrix[:3, :]
+        Tr_velo_to_cam = velo_to_cam_matrix
 
-        output_file.parent.mkdir(exist_ok=True, parents=True)
-        with output_file.open(mode="w") as f:
-            f.write(f"P2: {' '.join([str(elem) for elem in P2.flatten()])}\n")
-            f.write(f"R0_rect: {' '.join([str(elem) for elem in R0_rect.flatten()])}\n")
-            f.write(f"Tr_velo_to_cam: {' '.join([str(elem) for elem in Tr_velo_to_cam.flatten()])}\n")
+        return (
+            f"P2: {' '.join([str(elem) for elem in P2.flatten()])}\n"
+            f"R0_rect: {' '.join([str(elem) for elem in R0_rect.flatten()])}\n"
+            f"Tr_velo_to_cam: {' '.join([str(elem) for elem in Tr_velo_to_cam.flatten()])}\n"
+        )
 
     @classmethod
     def write_scene_meta_file(
@@ -104,7 +260,6 @@ class Pandaset2Kitti:
         kitti_images: list[KittiImageSeries],
         output_file: Path,
     ):
-
         """
         scene.meta ファイルを生成します。
 
@@ -126,113 +281,572 @@ class Pandaset2Kitti:
         Returns:
             CameraViewSettings
         """
-        fov_x = 2 * math.atan(camera_intrinsics.cx / camera_intrinsics.fx)
+        return cls.get_camera_view_settings(lidar_pose, PoseArray.from_poses([camera_pose]), [camera_intrinsics])[0]
 
+    @classmethod
+    def get_camera_view_settings(
+        cls,
+        lidar_pose: Pose,
+        camera_poses: PoseArray,
+        camera_intrinsics_list: list[Intrinsics],
+    ) -> list[CameraViewSettings]:
+        """
+        3dpc-editorに視野角を表示するために必要な情報を、複数のカメラについてまとめて生成。
+
+        Args:
+            lidar_pose: World座標系に対するLiDar Sensorのpose
+            camera_poses: World座標系に対する各カメラのpose
+            camera_intrinsics_list: 各カメラの内部パラメータ
+
+        Returns:
+            カメラごとのCameraViewSettings
+        """
         # z軸を中心にした回転角度[ラジアン]を取得する。0のときはX軸方向を指す
 
         # x軸を中心に-90度回転して、カメラ座標系のZ軸の向きをLiDar座標系のz軸の向きを合わせる
         tmp_quaterion = Pose(wxyz=Quaternion(axis=[1, 0, 0], angle=-math.pi / 2).q)
         # lidar座標系からカメラ座標系（Z軸が上方向）へのyawを取得する
-        tmp_PC_CS = tmp_quaterion * camera_pose.inverse() * lidar_pose
-        yaw, _, _ = tmp_PC_CS.rotation.yaw_pitch_roll
+        tmp_PC_CS = tmp_quaterion * camera_poses.inverse() * lidar_pose
 
         # 3dpc editorはx軸を進行方向としているが、LiDarはy軸が進行方向になっているので、90度回転させる
         # yawの回転軸が逆になっている。。。？
-        direction = -yaw + math.pi / 2
-
-        lidar_to_camera_pose = lidar_pose.inverse() * camera_pose
-        return CameraViewSettings(
-            fov=fov_x,
-            direction=direction,
-            position=XYZ(
-                lidar_to_camera_pose.translation[0],
-                lidar_to_camera_pose.translation[1],
-                lidar_to_camera_pose.translation[2],
-            ),
-        )
+        directions = -tmp_PC_CS.yaw + math.pi / 2
+
+        lidar_to_camera_poses = lidar_pose.inverse() * camera_poses
+
+        result = []
+        for camera_intrinsics, direction, translation in zip(
+            camera_intrinsics_list, directions, lidar_to_camera_poses.tvec
+        ):
+            fov_x = 2 * math.atan(camera_intrinsics.cx / camera_intrinsics.fx)
+            result.append(
+                CameraViewSettings(
+                    fov=fov_x,
+                    direction=float(direction),
+                    position=XYZ(translation[0], translation[1], translation[2]),
+                )
+            )
+        return result
 
-    def write_kitti_scene(
+    @classmethod
+    def get_kitti_frame_input_files(
+        cls, reader: SequenceFrameReader, index: int, camera_name_list: list[str], *, include_images: bool = True
+    ) -> list[Path]:
+        """
+        1フレームを出力するのに必要な入力ファイルを取得します。
+
+        Args:
+            include_images: Falseなら、カメラ画像を含めません。
+        """
+        result = [reader.get_lidar_file_path(index), reader.get_lidar_poses_file_path()]
+        for camera_name in camera_name_list:
+            if include_images:
+                result.append(reader.get_camera_image_path(camera_name, index))
+            result.extend(
+                [
+                    reader.get_camera_poses_file_path(camera_name),
+                    reader.get_camera_intrinsics_file_path(camera_name),
+                ]
+            )
+        return result
+
+    def write_kitti_frame(
         self,
-        sequence: Sequence,
+        reader: SequenceFrameReader,
+        index: int,
+        camera_name_list: list[str],
+        *,
         output_dir: Path,
-        sequence_id: str,
-    ):
-        sequence.load_lidar()
+        input_data_id: str,
+        lidar_pose: Pose,
+        velo_to_cam_matrices: dict[str, numpy.ndarray],
+    ) -> list[Path]:
+        """
+        1フレーム分の点群、カメラ画像、キャリブレーションファイルを出力します。
 
-        range_obj = range(0, len(sequence.lidar.data), self.sampling_step)
+        Args:
+            lidar_pose: World座標系に対するLiDar Sensorのpose
+            velo_to_cam_matrices: keyがカメラ名、valueがlidar座標系からcamera座標系への3x4の変換行列
 
+        Returns:
+            出力したファイルのlist
+        """
         # 点群データの出力
-        velodyne_dir = output_dir / "velodyne"
-        velodyne_dir.mkdir(exist_ok=True, parents=True)
-
-        for index in range_obj:
-            filename = f"{get_input_data_id_from_pandaset(sequence_id, index)}.bin"
-            lidar_data = sequence.lidar.data[index]
-            dict_lidar_pose = sequence.lidar.poses[index]
-            self.write_velodyne_bin_file(
-                lidar_data, lidar_pose=Pose.from_pandaset_pose(dict_lidar_pose), output_file=velodyne_dir / filename
+        velodyne_file = output_dir / "velodyne" / f"{input_data_id}.bin"
+        lidar_data = reader.read_lidar(index)
+        input_point_count, output_point_count = self.write_velodyne_bin_file(
+            lidar_data, lidar_pose=lidar_pose, output_file=velodyne_file, point_cloud_filter=self.point_cloud_filter
+        )
+        if self.point_cloud_filter is not None:
+            logger.debug(
+                f"{input_data_id} :: 点数 {input_point_count} -> {output_point_count} "
+                f"({output_point_count / max(input_point_count, 1):.1%})"
             )
+        # 次のフレームを読み込む前に解放する
+        del lidar_data
+        output_files = [velodyne_file]
 
         # カメラ画像とキャリブレーションファイルの出力
-        sequence.load_camera()
-        kitti_images = []
-
-        FILE_EXTENSION = "jpg"
+        for camera_name in camera_name_list:
+            calibration_file = output_dir / f"calib-{camera_name}" / f"{input_data_id}.txt"
+            self.write_calibration_file_from_matrix(
+                velo_to_cam_matrices[camera_name],
+                camera_intrinsics=reader.get_camera_intrinsics(camera_name),
+                output_file=calibration_file,
+            )
 
-        for camera_name in self.camera_name_list:
-            if camera_name not in sequence.camera:
-                logger.warning(f"{camera_name=}の情報は存在しません。")
+            output_files.append(calibration_file)
+            if self.no_images:
                 continue
 
-            camera_obj = sequence.camera[camera_name]
+            image_file = output_dir / f"image-{camera_name}" / f"{input_data_id}.{self.IMAGE_FILE_EXTENSION}"
+            self.write_image_file(reader, camera_name, index, output_file=image_file)
+            output_files.append(image_file)
 
-            calibration_dir = output_dir / f"calib-{camera_name}"
-            calibration_dir.mkdir(exist_ok=True, parents=True)
-            image_dir = output_dir / f"image-{camera_name}"
-            image_dir.mkdir(exist_ok=True, parents=True)
-
-            for index in range_obj:
-                pillow_image_obj = camera_obj.data[index]
-                dict_camera_pose = camera_obj.poses[index]
-                dict_lidar_pose = sequence.lidar.poses[index]
-                calibration_filename = f"{get_input_data_id_from_pandaset(sequence_id, index)}.txt"
-                self.write_calibration_file(
-                    camera_pose=Pose.from_pandaset_pose(dict_camera_pose),
-                    lidar_pose=Pose.from_pandaset_pose(dict_lidar_pose),
-                    camera_intrinsics=camera_obj.intrinsics,
-                    output_file=calibration_dir / calibration_filename,
-                )
+        return output_files
+
+    def create_scene_writer(
+        self,
+        reader: SequenceFrameReader,
+        output_dir: Path,
+        sequence_id: str,
+        *,
+        lidar_pose_array: Optional[PoseArray] = None,
+    ) -> "KittiSceneWriter":
+        """
+        1個のシーケンスを拡張KITTI形式で出力するwriterを生成します。
+
+        Args:
+            lidar_pose_array: 全フレームのLiDARのpose。Noneなら`reader`から読み込みます。
+        """
+        return KittiSceneWriter(self, reader, output_dir, sequence_id, lidar_pose_array=lidar_pose_array)
 
-                image_filename = f"{get_input_data_id_from_pandaset(sequence_id, index)}.{FILE_EXTENSION}"
-                pillow_image_obj.save(str(image_dir / image_filename))
+    def write_kitti_scene(
+        self,
+        sequence: Sequence,
+        output_dir: Path,
+        sequence_id: str,
+    ):
+        """
+        1個のシーケンスを拡張KITTI形式で出力します。
+
+        メモリ使用量を抑えるため、シーケンス全体を読み込まずに、出力対象のフレームを1フレームずつ読み込んで出力します。
+        出力済のフレームは、出力先ディレクトリのマニフェストファイルを参照してスキップします。
+        """
+        reader = create_frame_reader(sequence)
+        if (
+            (self.pipeline_config is not None or self.frame_workers > 1)
+            and not self.no_images
+            and not reader.has_camera_image_files
+        ):
+            # パイプラインとワーカプロセスには、カメラ画像をパスで渡している
+            raise ValueError(
+                "zipファイルからカメラ画像を出力する場合は、パイプラインとフレーム単位の並列処理は利用できません。"
+            )
+
+        scene_writer = self.create_scene_writer(reader, output_dir, sequence_id)
+        if self.pipeline_config is not None:
+            stage_reports = scene_writer.write_frames_with_pipeline(self.pipeline_config)
+            logger.info(f"{sequence_id=} :: パイプラインの各ステージの稼働状況\n{format_stage_reports(stage_reports)}")
+        elif self.frame_workers > 1:
+            scene_writer.write_frames_in_processes(self.frame_workers)
+        else:
+            with prefetch_frames(reader, scene_writer.frame_index_list, [scene_writer], self.prefetch_config):
+                for index in scene_writer.frame_index_list:
+                    scene_writer.write_frame(index)
+        scene_writer.finish()
+
+
+class KittiSceneWriter:
+    """
+    1個のシーケンスを拡張KITTI形式で出力します。
+    出力対象のフレームごとに`write_frame`を呼び出し、最後に`finish`を呼び出してください。
+
+    Args:
+        converter: 変換の設定
+        reader: シーケンスのreader
+        output_dir: シーケンスの出力先ディレクトリ
+        sequence_id: sequence_id
+        lidar_pose_array: 全フレームのLiDARのpose。Noneなら`reader`から読み込みます。
+    """
+
+    def __init__(
+        self,
+        converter: Pandaset2Kitti,
+        reader: SequenceFrameReader,
+        output_dir: Path,
+        sequence_id: str,
+        *,
+        lidar_pose_array: Optional[PoseArray] = None,
+    ) -> None:
+        self.converter = converter
+        self.reader = reader
+        self.output_dir = output_dir
+        self.sequence_id = sequence_id
+
+        self.frame_index_list = converter.frame_sampler.select_frames(reader)
+        lidar_poses = reader.get_lidar_poses()
+        if lidar_pose_array is None:
+            lidar_pose_array = PoseArray.from_pandaset_poses(lidar_poses)
+
+        self.velodyne_dir = output_dir / "velodyne"
+        self.velodyne_dir.mkdir(exist_ok=True, parents=True)
+
+        # poseの計算はフレームごとではなく、出力対象の全フレームについてまとめて行う
+        self.lidar_pose_array = lidar_pose_array[self.frame_index_list]
+        self._array_indices = {index: array_index for array_index, index in enumerate(self.frame_index_list)}
+
+        existing_camera_names = reader.get_camera_names()
+        camera_name_list = []
+        velo_to_cam_matrices: dict[str, numpy.ndarray] = {}
+        for camera_name in converter.camera_name_list:
+            if camera_name not in existing_camera_names:
+                logger.warning(f"{camera_name=}の情報は存在しません。")
+                continue
 
-            # 先頭のカメラposeを取得する
-            camera_view_setting = self.get_camera_view_setting(
-                lidar_pose=Pose.from_pandaset_pose(sequence.lidar.poses[0]),
-                camera_pose=Pose.from_pandaset_pose(camera_obj.poses[0]),
-                camera_intrinsics=camera_obj.intrinsics,
+            camera_name_list.append(camera_name)
+            camera_pose_array = PoseArray.from_pandaset_poses(reader.get_camera_poses(camera_name))
+            velo_to_cam_matrices[camera_name] = converter.get_velo_to_cam_matrices(
+                camera_pose_array[self.frame_index_list], self.lidar_pose_array
             )
-            kitti_images.append(
+        self.camera_name_list = camera_name_list
+        self.velo_to_cam_matrices = velo_to_cam_matrices
+
+        # 先頭のカメラposeを取得する
+        camera_view_settings = converter.get_camera_view_settings(
+            lidar_pose=Pose.from_pandaset_pose(lidar_poses[0]),
+            camera_poses=PoseArray.from_pandaset_poses(
+                [reader.get_camera_poses(camera_name)[0] for camera_name in camera_name_list]
+            ),
+            camera_intrinsics_list=[reader.get_camera_intrinsics(camera_name) for camera_name in camera_name_list],
+        )
+        self.kitti_images = []
+        for camera_name, camera_view_setting in zip(camera_name_list, camera_view_settings):
+            calibration_dir = output_dir / f"calib-{camera_name}"
+            calibration_dir.mkdir(exist_ok=True, parents=True)
+            image_dirname: Optional[str] = None
+            if not converter.no_images:
+                image_dir = output_dir / f"image-{camera_name}"
+                image_dir.mkdir(exist_ok=True, parents=True)
+                image_dirname = image_dir.name
+            self.kitti_images.append(
                 KittiImageSeries(
-                    image_dir=image_dir.name,
+                    image_dir=image_dirname,
                     calib_dir=calibration_dir.name,
                     display_name=camera_name,
-                    file_extension=FILE_EXTENSION,
+                    file_extension=converter.IMAGE_FILE_EXTENSION,
                     camera_view_setting=camera_view_setting,
                 )
             )
 
-        # 拡張KITTI形式用のメタファイルを出力
-        id_list = [get_input_data_id_from_pandaset(sequence_id, index) for index in range_obj]
+        point_cloud_filter = converter.point_cloud_filter
+        self.frame_parameters = {
+            "camera_name_list": camera_name_list,
+            # カメラ画像を出力しない場合は、出力方法に関わらず同じ出力になる
+            "image_output_mode": converter.image_output_mode if not converter.no_images else None,
+            "point_cloud_filter": point_cloud_filter.to_dict() if point_cloud_filter is not None else None,
+        }
+
+        self.manifest = ManifestRecorder(
+            output_dir,
+            reader.get_sequence_dir(),
+            parameters={**converter.frame_sampler.to_dict(), **self.frame_parameters},
+            force=converter.force,
+            get_input_fingerprint=reader.get_input_fingerprint,
+        )
 
-        self.write_scene_meta_file(
+    def get_prefetch_files(self, index: int) -> list[Path]:
+        """
+        `write_frame`でフレームごとに読み込むファイル（点群とカメラ画像）を返します。出力済のフレームなら空のlistを返します。
+        ハードリンクを作成する場合は、カメラ画像を読み込まないので含めません。
+        """
+        input_files = self.converter.get_kitti_frame_input_files(
+            self.reader, index, self.camera_name_list, include_images=not self.converter.no_images
+        )
+        if self.manifest.is_frame_up_to_date(
+            get_input_data_id_from_pandaset(self.sequence_id, index),
+            input_files,
+            self.frame_parameters,
+            count_skipped=False,
+        ):
+            return []
+
+        result = [self.reader.get_lidar_file_path(index)]
+        if not self.converter.no_images and self.converter.image_output_mode != "hardlink":
+            result.extend(
+                self.reader.get_camera_image_path(camera_name, index) for camera_name in self.camera_name_list
+            )
+        return result
+
+    def write_frame(self, index: int) -> None:
+        """1フレームを出力します。出力済のフレームはスキップします。"""
+        input_data_id = get_input_data_id_from_pandaset(self.sequence_id, index)
+        input_files = self.converter.get_kitti_frame_input_files(
+            self.reader, index, self.camera_name_list, include_images=not self.converter.no_images
+        )
+        if self.manifest.is_frame_up_to_date(input_data_id, input_files, self.frame_parameters):
+            return
+
+        array_index = self._array_indices[index]
+        output_files = self.converter.write_kitti_frame(
+            self.reader,
+            index,
+            self.camera_name_list,
+            output_dir=self.output_dir,
+            input_data_id=input_data_id,
+            lidar_pose=self.lidar_pose_array[array_index],
+            velo_to_cam_matrices={
+                camera_name: matrices[array_index] for camera_name, matrices in self.velo_to_cam_matrices.items()
+            },
+        )
+        self.manifest.record_frame(input_data_id, input_files, output_files, self.frame_parameters)
+
+    def create_frame_task(self, index: int) -> Optional["KittiFrameTask"]:
+        """
+        パイプラインで1フレームを出力するためのタスクを生成します。出力済のフレームならNoneを返します。
+        """
+        input_data_id = get_input_data_id_from_pandaset(self.sequence_id, index)
+        input_files = self.converter.get_kitti_frame_input_files(
+            self.reader, index, self.camera_name_list, include_images=not self.converter.no_images
+        )
+        if self.manifest.is_frame_up_to_date(input_data_id, input_files, self.frame_parameters):
+            return None
+
+        array_index = self._array_indices[index]
+        task = KittiFrameTask(
+            index=index,
+            input_data_id=input_data_id,
+            input_files=input_files,
+            lidar_pose=self.lidar_pose_array[array_index],
+            velodyne_file=self.output_dir / "velodyne" / f"{input_data_id}.bin",
+        )
+        image_file_extension = self.converter.IMAGE_FILE_EXTENSION
+        for camera_name in self.camera_name_list:
+            task.calibrations.append(
+                (
+                    self.output_dir / f"calib-{camera_name}" / f"{input_data_id}.txt",
+                    self.velo_to_cam_matrices[camera_name][array_index],
+                    self.reader.get_camera_intrinsics(camera_name),
+                )
+            )
+            if self.converter.no_images:
+                continue
+            task.images.append(
+                (
+                    self.reader.get_camera_image_path(camera_name, index),
+                    self.output_dir / f"image-{camera_name}" / f"{input_data_id}.{image_file_extension}",
+                )
+            )
+        return task
+
+    def _iter_frame_tasks(self) -> Iterator["KittiFrameTask"]:
+        for index in self.frame_index_list:
+            task = self.create_frame_task(index)
+            if task is not None:
+                yield task
+
+    def load_frame(self, task: "KittiFrameTask") -> "KittiFrameTask":
+        """loadステージ。点群を読み込みます。"""
+        task.lidar_data = self.reader.read_lidar(task.index)
+        return task
+
+    def write_frame_task(self, task: "KittiFrameTask") -> None:
+        """writeステージ。serializeステージで生成したバイト列とカメラ画像をファイルに書き込み、マニフェストに記録します。"""
+        write_kitti_frame_files(task, self.converter.image_output_mode)
+        self.record_frame_task(task)
+
+    def record_frame_task(self, task: "KittiFrameTask") -> None:
+        """出力したフレームをマニフェストに記録します。"""
+        if self.converter.point_cloud_filter is not None:
+            logger.debug(
+                f"{task.input_data_id} :: 点数 {task.input_point_count} -> {task.output_point_count} "
+                f"({task.output_point_count / max(task.input_point_count, 1):.1%})"
+            )
+        self.manifest.record_frame(task.input_data_id, task.input_files, task.get_output_files(), self.frame_parameters)
+
+    def write_frames_with_pipeline(self, pipeline_config: PipelineConfig) -> list[StageReport]:
+        """
+        出力対象のフレームを、load → transform → serialize → writeのステージに分けて並行に出力します。
+        ステージ間のキューのサイズに上限があるので、メモリ上に保持するフレームの数は一定数に収まります。
+
+        Returns:
+            ステージごとの稼働状況
+        """
+        stages = [
+            pipeline_config.create_stage("load", self.load_frame),
+            pipeline_config.create_stage(
+                "transform", partial(transform_kitti_frame, point_cloud_filter=self.converter.point_cloud_filter)
+            ),
+            pipeline_config.create_stage(
+                "serialize", partial(serialize_kitti_frame, image_output_mode=self.converter.image_output_mode)
+            ),
+            pipeline_config.create_stage("write", self.write_frame_task),
+        ]
+        return Pipeline(stages, queue_size=pipeline_config.queue_size).run(self._iter_frame_tasks())
+
+    def load_frame_to_shared_memory(self, task: "KittiFrameTask") -> tuple["KittiFrameTask", SharedArrays]:
+        """点群を読み込んで、ワーカプロセスに渡すために共有メモリに格納します。"""
+        lidar_data = self.reader.read_lidar(task.index)
+        shared_arrays = SharedArrays()
+        try:
+            shared_arrays.put("xyz", lidar_data[["x", "y", "z"]].to_numpy(dtype=numpy.float64))
+            shared_arrays.put("i", lidar_data["i"].to_numpy())
+            if self.converter.point_cloud_filter is not None:
+                shared_arrays.put("d", lidar_data["d"].to_numpy())
+        except BaseException:
+            shared_arrays.release()
+            raise
+        return task, shared_arrays
+
+    def write_frames_in_processes(self, workers: int) -> None:
+        """
+        出力対象のフレームを、プロセスプールで並列に出力します。
+        点群の読み込みとマニフェストへの記録は親プロセスで行い、座標変換とファイルの書き込みはワーカプロセスで行います。
+        """
+        func = partial(
+            write_kitti_frame_from_shared_arrays,
+            point_cloud_filter=self.converter.point_cloud_filter,
+            image_output_mode=self.converter.image_output_mode,
+        )
+        for task, (input_point_count, output_point_count) in map_frames(
+            self.load_frame_to_shared_memory, func, self._iter_frame_tasks(), workers=workers
+        ):
+            task.input_point_count = input_point_count
+            task.output_point_count = output_point_count
+            self.record_frame_task(task)
+
+    def finish(self) -> None:
+        """拡張KITTI形式用のメタファイルを出力します。"""
+        id_list = [get_input_data_id_from_pandaset(self.sequence_id, index) for index in self.frame_index_list]
+
+        # 前回だけ出力したフレームのファイルは、`id_list`に含まれないので削除する
+        self.manifest.compact(frame_ids=id_list)
+        if self.manifest.skipped_frame_count > 0:
+            logger.info(
+                f"sequence_id='{self.sequence_id}' :: {len(self.frame_index_list)}件中"
+                f"{self.manifest.skipped_frame_count}件のフレームは出力済なので、スキップしました。"
+            )
+
+        self.converter.write_scene_meta_file(
             id_list=id_list,
-            velodyne_dirname=velodyne_dir.name,
-            kitti_images=kitti_images,
-            output_file=output_dir / "scene.meta",
+            velodyne_dirname=self.velodyne_dir.name,
+            kitti_images=self.kitti_images,
+            output_file=self.output_dir / "scene.meta",
         )
 
 
+@dataclass
+class KittiFrameTask:
+    """
+    パイプラインで出力する1フレーム分のデータ。
+    transformステージとserializeステージをプロセスプールで実行できるように、pickle化できる値だけを持ちます。
+
+    Args:
+        calibrations: カメラごとの(出力先, lidar座標系からcamera座標系への3x4の変換行列, カメラの内部パラメータ)
+        images: カメラごとの(元のカメラ画像, 出力先)。カメラ画像を出力しない場合は空です。
+        lidar_data: loadステージで読み込んだ点群
+        points: transformステージで変換した(N,4)のfloat32の点群
+        contents: serializeステージで生成した、keyが出力先、valueがファイルの内容のdict
+    """
+
+    index: int
+    input_data_id: str
+    input_files: list[Path]
+    lidar_pose: Pose
+    velodyne_file: Path
+    calibrations: list[tuple[Path, numpy.ndarray, Intrinsics]] = field(default_factory=list)
+    images: list[tuple[Path, Path]] = field(default_factory=list)
+    lidar_data: Optional[pandas.DataFrame] = None
+    points: Optional[numpy.ndarray] = None
+    input_point_count: int = 0
+    output_point_count: int = 0
+    contents: dict[Path, bytes] = field(default_factory=dict)
+
+    def get_output_files(self) -> list[Path]:
+        """`Pandaset2Kitti.write_kitti_frame`と同じ順番で、出力ファイルを返します。"""
+        result = [self.velodyne_file]
+        for (calibration_file, _, _), image in itertools.zip_longest(self.calibrations, self.images):
+            result.append(calibration_file)
+            if image is not None:
+                result.append(image[1])
+        return result
+
+
+def transform_kitti_frame(task: KittiFrameTask, point_cloud_filter: Optional[PointCloudFilter]) -> KittiFrameTask:
+    """transformステージ。グローバル座標系の点群をlidar座標系に変換して、絞り込みます。"""
+    assert task.lidar_data is not None
+    task.points, task.input_point_count = transform_kitti_velodyne_points(
+        task.lidar_data, pose=task.lidar_pose.inverse(), point_cloud_filter=point_cloud_filter
+    )
+    task.output_point_count = len(task.points)
+    # 次のステージに点群のDataFrameを渡さない
+    task.lidar_data = None
+    return task
+
+
+def serialize_kitti_frame(task: KittiFrameTask, image_output_mode: str) -> KittiFrameTask:
+    """
+    serializeステージ。点群とキャリブレーションをファイルの内容に変換します。
+    `image_output_mode`が"reencode"なら、カメラ画像もデコードしてJPEGに再エンコードします。
+    """
+    assert task.points is not None
+    # (N,4)のC連続な配列なので、`tofile`で書き出したのと同じバイト列になる
+    task.contents[task.velodyne_file] = task.points.tobytes()
+    task.points = None
+
+    for calibration_file, velo_to_cam_matrix, camera_intrinsics in task.calibrations:
+        task.contents[calibration_file] = Pandaset2Kitti.get_calibration_text(
+            velo_to_cam_matrix, camera_intrinsics
+        ).encode("utf-8")
+
+    if image_output_mode == "reencode":
+        for image_path, image_file in task.images:
+            with Image.open(image_path) as pillow_image_obj, io.BytesIO() as buffer:
+                pillow_image_obj.save(buffer, format=Image.registered_extensions()[image_file.suffix])
+                task.contents[image_file] = buffer.getvalue()
+    return task
+
+
+def write_kitti_frame_files(task: KittiFrameTask, image_output_mode: str) -> None:
+    """serializeステージで生成したバイト列とカメラ画像を、ファイルに書き込みます。"""
+    for output_file, content in task.contents.items():
+        output_file.parent.mkdir(exist_ok=True, parents=True)
+        # 前回ハードリンクで出力した画像ファイルに書き込むと、元のJPEGファイルも書き換わってしまうので、先に削除する
+        output_file.unlink(missing_ok=True)
+        output_file.write_bytes(content)
+
+    if image_output_mode != "reencode":
+        for image_path, output_file in task.images:
+            copy_file(image_path, output_file, hardlink=image_output_mode == "hardlink")
+
+
+def write_kitti_frame_from_shared_arrays(
+    task: KittiFrameTask,
+    shared_arrays: SharedArrays,
+    point_cloud_filter: Optional[PointCloudFilter],
+    image_output_mode: str,
+) -> tuple[int, int]:
+    """
+    ワーカプロセスで1フレームを出力します。点群は共有メモリから参照します。
+
+    Returns:
+        tuple(入力した点の数, 出力した点の数)
+    """
+    with shared_arrays.open() as arrays:
+        task.input_point_count = len(arrays["xyz"])
+        task.points = transform_kitti_velodyne_arrays(
+            arrays["xyz"],
+            arrays["i"],
+            arrays.get("d"),
+            pose=task.lidar_pose.inverse(),
+            point_cloud_filter=point_cloud_filter,
+        )
+    task.output_point_count = len(task.points)
+    serialize_kitti_frame(task, image_output_mode)
+    write_kitti_frame_files(task, image_output_mode)
+    return task.input_point_count, task.output_point_count
+
+
 def parse_args():
     parser = ArgumentParser(
         description="PandaSetを拡張KITTI形式に変換します。anno3dコマンドでAnnofabに登録することを想定しています。",
@@ -242,8 +856,104 @@ def parse_args():
     parser.add_argument("-o", "--output_dir", type=Path, required=True, help="出力先ディレクトリ")
 
     parser.add_argument("--sequence_id", type=str, nargs="+", required=False, help="出力対象のsequence id")
-    parser.add_argument("--camera_name", type=str, nargs="+", required=False, help="出力対象のcamera name")
-    parser.add_argument("--sampling_step", type=int, default=1, required=False, help="指定した値ごとにフレームを出力します。")
+    parser.add_argument(
+        "--camera_name",
+        type=str,
+        nargs="*",
+        required=False,
+        help="出力対象のcamera name。指定しない場合はすべてのカメラを出力します。"
+        "値を指定せずに`--camera_name`だけを指定すると、カメラのファイルを読み込まずに点群だけを出力します。",
+    )
+    parser.add_argument(
+        "--no_images",
+        action="store_true",
+        help="カメラ画像を出力しません。キャリブレーションファイルと`scene.meta`の`camera_view_setting`は、"
+        "カメラのposeと内部パラメータから出力します。`scene.meta`のカメラのseriesには、`image_dir`を出力しません。",
+    )
+    add_frame_sampler_arguments(parser)
+    parser.add_argument(
+        "--image_output_mode",
+        type=str,
+        choices=IMAGE_OUTPUT_MODES,
+        default="copy",
+        required=False,
+        help="カメラ画像の出力方法。copy: 元のJPEGファイルをそのままコピーします。"
+        "hardlink: 元のJPEGファイルへのハードリンクを作成します。"
+        "reencode: 画像をデコードしてJPEGに再エンコードします。",
+    )
+    parser.add_argument(
+        "--lidar_sensor_id",
+        type=int,
+        choices=[0, 1],
+        required=False,
+        help="出力するLiDARのID。0: Pandar64（360°）、1: PandarGT（前方）。指定しない場合は両方の点を出力します。",
+    )
+    parser.add_argument(
+        "--min_range", type=float, required=False, help="LiDARからの水平距離がこの値[m]未満の点を除外します。"
+    )
+    parser.add_argument(
+        "--max_range", type=float, required=False, help="LiDARからの水平距離がこの値[m]より大きい点を除外します。"
+    )
+    parser.add_argument("--min_z", type=float, required=False, help="LiDAR座標系のzがこの値[m]未満の点を除外します。")
+    parser.add_argument(
+        "--max_z", type=float, required=False, help="LiDAR座標系のzがこの値[m]より大きい点を除外します。"
+    )
+    parser.add_argument(
+        "--crop_box",
+        type=float,
+        nargs=6,
+        metavar=("X_MIN", "Y_MIN", "Z_MIN", "X_MAX", "Y_MAX", "Z_MAX"),
+        required=False,
+        help="LiDAR座標系でこの直方体の内側にある点だけを出力します。",
+    )
+    parser.add_argument(
+        "--voxel_size",
+        type=float,
+        required=False,
+        help="指定したサイズ[m]のボクセルごとに1点に間引きます。"
+        "点の絞り込みや間引きをすると点のインデックスが変わるので、semantic segmentationのアノテーションとは組み合わせられません。",
+    )
+    add_force_argument(parser)
+    add_workers_argument(parser)
+    parser.add_argument(
+        "--pipeline",
+        action="store_true",
+        help=f"シーケンス内のフレームを、{KITTI_PIPELINE_STAGES}のステージに分けて並行に出力します。"
+        "終了時に各ステージの稼働率を出力します。",
+    )
+    parser.add_argument(
+        "--pipeline_stage_workers",
+        type=str,
+        nargs="+",
+        default=[],
+        required=False,
+        help="`--pipeline`を指定した場合の、ステージごとの並列数。`load=2 write=4`のように指定します。指定しないステージの並列数は1です。",
+    )
+    parser.add_argument(
+        "--pipeline_process_stage",
+        type=str,
+        nargs="+",
+        choices=KITTI_PIPELINE_PROCESS_STAGES,
+        default=[],
+        required=False,
+        help="`--pipeline`を指定した場合に、スレッドではなくプロセスプールで実行するステージ。",
+    )
+    parser.add_argument(
+        "--pipeline_queue_size",
+        type=int,
+        default=4,
+        required=False,
+        help="`--pipeline`を指定した場合の、ステージ間のキューのサイズの上限。メモリ上に保持するフレームの数を制限します。",
+    )
+    parser.add_argument(
+        "--frame_workers",
+        type=int,
+        default=1,
+        required=False,
+        help="シーケンス内のフレームを並列に出力するプロセス数。1個の大きいシーケンスを変換する場合に指定します。"
+        "点群は共有メモリ経由でワーカプロセスに渡します。`--pipeline`とは同時に指定できません。",
+    )
+    add_prefetch_arguments(parser, exclusive_options=["--pipeline", "--frame_workers"])
 
     return parser.parse_args()
 
@@ -258,24 +968,51 @@ def main() -> None:
     input_dir: Path = args.input_dir
     logger.info(f"{input_dir} をKITTIに変換して、{output_dir}に出力します。")
 
-    main_obj = Pandaset2Kitti(camera_name_list=args.camera_name, sampling_step=args.sampling_step)
+    point_cloud_filter = PointCloudFilter(
+        sensor_id=args.lidar_sensor_id,
+        min_range=args.min_range,
+        max_range=args.max_range,
+        min_z=args.min_z,
+        max_z=args.max_z,
+        crop_box=tuple(args.crop_box) if args.crop_box is not None else None,
+        voxel_size=args.voxel_size,
+    )
 
-    dataset = DataSet(str(input_dir))
+    main_obj = Pandaset2Kitti(
+        camera_name_list=args.camera_name,
+        frame_sampler=create_frame_sampler_from_args(args),
+        image_output_mode=args.image_output_mode,
+        force=args.force,
+        point_cloud_filter=point_cloud_filter if point_cloud_filter != PointCloudFilter() else None,
+        pipeline_config=(
+            PipelineConfig(
+                stage_workers=parse_stage_workers(args.pipeline_stage_workers),
+                process_stages=args.pipeline_process_stage,
+                queue_size=args.pipeline_queue_size,
+            )
+            if args.pipeline
+            else None
+        ),
+        frame_workers=args.frame_workers,
+        no_images=args.no_images,
+        prefetch_config=create_prefetch_config_from_args(args),
+    )
+
+    dataset = open_dataset(input_dir)
 
     if args.sequence_id is None:
         sequence_id_list = dataset.sequences()
     else:
         sequence_id_list = args.sequence_id
 
-    for sequence_id in sequence_id_list:
-        sequence = dataset[sequence_id]
-        logger.info(f"{sequence_id=}をKITTIに変換します。")
-        try:
-            main_obj.write_kitti_scene(sequence, output_dir=output_dir / sequence_id, sequence_id=sequence_id)
-        except Exception:
-            logger.warning(f"{sequence_id=}のKITTIの変換に失敗しました。", exc_info=True)
-        finally:
-            dataset.unload(sequence_id)
+    process_sequences(
+        main_obj.write_kitti_scene,
+        input_dir=input_dir,
+        output_dir=output_dir,
+        sequence_id_list=sequence_id_list,
+        process_name="KITTIへの変換",
+        workers=args.workers,
+    )
 
 
 if __name__ == "__main__":
@@ -1,53 +1,285 @@
 import json
 import logging
-import uuid
 from argparse import ArgumentDefaultsHelpFormatter, ArgumentParser
+from contextlib import contextmanager
+from dataclasses import dataclass
 from pathlib import Path
+from typing import Iterator, Optional
 
+import numpy
 import pandas
-from annofab_3dpc.annotation import SegmentAnnotationDetailData, SegmentData
-from pandaset import DataSet
 from pandaset.sequence import Sequence
 
-from panda2anno.common.annofab import get_input_data_id_from_pandaset
+from panda2anno.common.annofab import (
+    encode_annotation_detail,
+    get_input_data_id_from_pandaset,
+    get_semseg_annotation_id,
+    iter_annotation_file_chunks,
+    write_annotation_file,
+)
+from panda2anno.common.annotation_archive import (
+    DATASET_ARCHIVE_FILENAME,
+    OUTPUT_FORMATS,
+    ZIP_COMPRESSIONS,
+    ZIP_SCOPES,
+    AnnotationArchive,
+)
+from panda2anno.common.frame_parallel import SharedArrays, map_frames
+from panda2anno.common.frame_reader import SequenceFrameReader
+from panda2anno.common.frame_sampler import FrameSampler, add_frame_sampler_arguments, create_frame_sampler_from_args
+from panda2anno.common.manifest import ManifestRecorder, add_force_argument
+from panda2anno.common.pandaset_archive import create_frame_reader, open_dataset
+from panda2anno.common.parallel import add_workers_argument, process_sequences
+from panda2anno.common.prefetch import (
+    PrefetchConfig,
+    add_prefetch_arguments,
+    create_prefetch_config_from_args,
+    prefetch_frames,
+)
+from panda2anno.common.semseg import group_point_indices_by_class, iter_segment_json_chunks, write_segment_file
 from panda2anno.common.utils import set_default_logger
 
 logger = logging.getLogger(__name__)
 
+CHANGED_INPUT_DATA_FILENAME = "changed_input_data_id.txt"
+"""
+`incremental`が有効な場合に、出力先のファイルが変わったフレームのinput_data_idを1行ずつ記録するファイル。
+シーケンスの出力先ディレクトリに出力します。
+"""
+
 
 class Semseg2Annofab:
-    def __init__(self, sampling_step: int = 1) -> None:
-        self.sampling_step = sampling_step
+    def __init__(
+        self,
+        sampling_step: int = 1,
+        force: bool = False,
+        incremental: bool = False,
+        frame_workers: int = 1,
+        output_format: str = "directory",
+        zip_compression: str = "deflate",
+        prefetch_config: Optional[PrefetchConfig] = None,
+        frame_sampler: Optional[FrameSampler] = None,
+    ) -> None:
+        """
+        Args:
+            force: Trueなら、出力済のフレームも変換し直します。Falseなら、入力ファイルと変換パラメータが前回から変わっていないフレームはスキップします。
+            incremental: Trueなら、変換し直したフレームのうち、内容が変わったファイルだけを書き込み、不要になったセグメントファイルを削除します。
+                ファイルが変わったフレームのinput_data_idは、シーケンスの出力先ディレクトリの`CHANGED_INPUT_DATA_FILENAME`に追記します。
+            frame_workers: 2以上なら、シーケンス内のフレームをプロセスプールで並列に出力します。
+                クラスIDの配列は共有メモリ経由でワーカプロセスに渡します。
+            output_format: `OUTPUT_FORMATS`のいずれか。zipなら、シーケンスごとに`{sequence_id}.zip`を出力します。
+                `open_dataset_archive`の中で変換した場合は、すべてのシーケンスを1個のzipファイルに出力します。
+            zip_compression: zipファイルのエントリの圧縮方式。`ZIP_COMPRESSIONS`のいずれか。
+            prefetch_config: 指定した場合は、後のフレームのsemantic segmentationのファイルをバックグラウンドで先読みします。
+                `frame_workers`とは同時に指定できません。
+            frame_sampler: 変換するフレームを選ぶ条件。指定した場合は`sampling_step`を指定できません。
+        """
+        if frame_workers < 1:
+            raise ValueError(f"frame_workersには1以上を指定してください。 :: {frame_workers=}")
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"{output_format=}は不正な値です。{OUTPUT_FORMATS}のいずれかを指定してください。")
+        if zip_compression not in ZIP_COMPRESSIONS:
+            raise ValueError(
+                f"{zip_compression=}は不正な値です。{list(ZIP_COMPRESSIONS)}のいずれかを指定してください。"
+            )
+        if output_format == "zip" and incremental:
+            raise ValueError("output_formatがzipの場合は、incrementalを指定できません。")
+        if output_format == "zip" and frame_workers > 1:
+            raise ValueError("output_formatがzipの場合は、frame_workersに2以上を指定できません。")
+        if prefetch_config is not None and frame_workers > 1:
+            raise ValueError("prefetch_configとframe_workersは同時に指定できません。")
+        if frame_sampler is not None and sampling_step != 1:
+            raise ValueError("sampling_stepとframe_samplerは同時に指定できません。")
+        self.frame_workers = frame_workers
+        self.frame_sampler = frame_sampler if frame_sampler is not None else FrameSampler(sampling_step=sampling_step)
+        self.force = force
+        self.incremental = incremental
+        self.output_format = output_format
+        self.zip_compression = zip_compression
+        self.prefetch_config = prefetch_config
+        self.dataset_archive: Optional[AnnotationArchive] = None
 
     @classmethod
     def write_semseg_annotation_json(
-        cls, semseg_data: pandas.DataFrame, semseg_classes: dict[str, str], task_dir: Path, input_data_id: str
-    ):
+        cls,
+        semseg_data: pandas.DataFrame,
+        semseg_classes: dict[str, str],
+        task_dir: Path,
+        input_data_id: str,
+        *,
+        incremental: bool = False,
+    ) -> list[Path]:
+        """
+        1フレーム分のアノテーションJSONとセグメントファイルを出力します。
+        annotation_idは(input_data_id, クラスID)から決まるので、同じ入力からは同じファイル名、同じ内容のファイルが出力されます。
+
+        Args:
+            incremental: Trueなら、出力先のファイルと内容が同じファイルは書き込みません。
+                また、出力先ディレクトリにある今回出力しなかったセグメントファイルを削除します。
+
+        Returns:
+            出力したファイルのlist。`incremental`がTrueの場合は、内容が同じで書き込まなかったファイルも含みます。
+        """
+        return cls.write_semseg_annotation_json_from_arrays(
+            semseg_data["class"].to_numpy(),
+            semseg_data.index.to_numpy(),
+            semseg_classes,
+            task_dir,
+            input_data_id,
+            incremental=incremental,
+        )
+
+    @classmethod
+    def write_semseg_annotation_json_from_arrays(
+        cls,
+        class_ids: numpy.ndarray,
+        point_indices: numpy.ndarray,
+        semseg_classes: dict[str, str],
+        task_dir: Path,
+        input_data_id: str,
+        *,
+        incremental: bool = False,
+    ) -> list[Path]:
+        """
+        `write_semseg_annotation_json`と同じファイルを、点ごとのクラスIDと点のインデックスの配列から出力します。
+
+        Args:
+            class_ids: (N,)の点ごとのクラスID
+            point_indices: (N,)の点のインデックス
+        """
+        output_files, _ = cls._write_semseg_annotation_files(
+            class_ids, point_indices, semseg_classes, task_dir, input_data_id, incremental=incremental
+        )
+        return output_files
+
+    @classmethod
+    def _write_semseg_annotation_files(
+        cls,
+        class_ids: numpy.ndarray,
+        point_indices: numpy.ndarray,
+        semseg_classes: dict[str, str],
+        task_dir: Path,
+        input_data_id: str,
+        *,
+        incremental: bool = False,
+    ) -> tuple[list[Path], bool]:
+        """
+        Returns:
+            tuple(出力したファイルのlist, 出力先のファイルを書き込んだか削除したかどうか)
+        """
         input_data_dir = task_dir / input_data_id
         input_data_dir.mkdir(exist_ok=True, parents=True)
 
         annotation_details = []
-        for class_id in semseg_data["class"].unique():
-            df_by_label = semseg_data[semseg_data["class"] == class_id]
-            af_segment = SegmentData(list(df_by_label.index))
-            annotation_id = str(uuid.uuid4())
-
+        output_files = []
+        written_segment_count = 0
+        for annotation_id, class_point_indices, annotation_detail in cls._iter_segments(
+            class_ids, point_indices, semseg_classes, input_data_id
+        ):
             # セグメントファイルを出力
             segment_file = input_data_dir / f"{annotation_id}"
-            with segment_file.open("w") as f:
-                f.write(af_segment.to_json())
-
-            annotation_details.append(
-                {
-                    "annotation_id": annotation_id,
-                    "label": semseg_classes[str(class_id)],
-                    "data": SegmentAnnotationDetailData(data_uri=f"{input_data_id}/{annotation_id}").dump(),
-                }
-            )
+            if write_segment_file(class_point_indices, segment_file, skip_if_unchanged=incremental):
+                written_segment_count += 1
+            output_files.append(segment_file)
+            annotation_details.append(annotation_detail)
 
         input_data_json = task_dir / f"{input_data_id}.json"
-        with input_data_json.open(mode="w") as f:
-            json.dump({"details": annotation_details}, f)
+        is_changed = write_annotation_file(input_data_json, annotation_details, skip_if_unchanged=incremental)
+        is_changed = is_changed or written_segment_count > 0
+        output_files.append(input_data_json)
+
+        if incremental:
+            # 前回出力したが、今回は出力しなかったクラスのセグメントファイルを削除する
+            output_file_set = set(output_files)
+            orphan_segment_files = [e for e in input_data_dir.iterdir() if e not in output_file_set]
+            for orphan_segment_file in orphan_segment_files:
+                orphan_segment_file.unlink()
+            is_changed = is_changed or len(orphan_segment_files) > 0
+
+            logger.debug(
+                f"{input_data_id=} :: {len(output_files) - 1}件中{written_segment_count}件のセグメントファイルを書き込み、"
+                f"{len(orphan_segment_files)}件の不要なセグメントファイルを削除しました。"
+            )
+
+        return output_files, is_changed
+
+    @classmethod
+    def _iter_segments(
+        cls,
+        class_ids: numpy.ndarray,
+        point_indices: numpy.ndarray,
+        semseg_classes: dict[str, str],
+        input_data_id: str,
+    ) -> Iterator[tuple[str, numpy.ndarray, str]]:
+        """
+        クラスごとに、tuple(annotation_id, 点のインデックスの配列, JSON文字列に変換したアノテーション詳細)を返します。
+        """
+        # クラスごとにマスクを作るとクラス数×点数の走査になるので、1回でクラスごとに分ける
+        for class_id, class_point_indices in group_point_indices_by_class(class_ids, point_indices=point_indices):
+            annotation_id = get_semseg_annotation_id(input_data_id, class_id)
+            # `SegmentAnnotationDetailData(data_uri=...).dump()`と同じ構造
+            annotation_detail = encode_annotation_detail(
+                annotation_id,
+                semseg_classes[str(class_id)],
+                json.dumps(f"{input_data_id}/{annotation_id}"),
+            )
+            yield annotation_id, class_point_indices, annotation_detail
+
+    @classmethod
+    def write_semseg_annotation_to_archive(
+        cls,
+        semseg_data: pandas.DataFrame,
+        semseg_classes: dict[str, str],
+        archive: AnnotationArchive,
+        task_id: str,
+        input_data_id: str,
+    ) -> None:
+        """
+        `write_semseg_annotation_json`と同じ内容のアノテーションJSONとセグメントファイルを、zipファイルのエントリとして書き込みます。
+        エントリのパスは、タスクのディレクトリを`task_id`に置き換えたものです。
+        """
+        annotation_details = []
+        for annotation_id, class_point_indices, annotation_detail in cls._iter_segments(
+            semseg_data["class"].to_numpy(), semseg_data.index.to_numpy(), semseg_classes, input_data_id
+        ):
+            archive.write_chunks(
+                f"{task_id}/{input_data_id}/{annotation_id}", iter_segment_json_chunks(class_point_indices)
+            )
+            annotation_details.append(annotation_detail)
+
+        archive.write_chunks(f"{task_id}/{input_data_id}.json", iter_annotation_file_chunks(annotation_details))
+
+    def create_sequence_writer(
+        self,
+        reader: SequenceFrameReader,
+        output_dir: Path,
+        sequence_id: str,
+        *,
+        archive: Optional[AnnotationArchive] = None,
+    ) -> "SemsegSequenceWriter":
+        """
+        1個のシーケンスのsemantic segmentationをAnnofabのアノテーションに変換するwriterを生成します。
+
+        Args:
+            archive: 指定した場合は、`output_dir`ではなくzipファイルに出力します。
+        """
+        return SemsegSequenceWriter(self, reader, output_dir, sequence_id, archive=archive)
+
+    @contextmanager
+    def open_dataset_archive(self, output_dir: Path) -> Iterator[AnnotationArchive]:
+        """
+        `with`文の中で変換したすべてのシーケンスを、`{output_dir}/annotation.zip`に出力します。
+        シーケンスは同じプロセスで変換してください。
+        `with`文の中で例外が発生した場合は、zipファイルを出力しません。
+        """
+        if self.output_format != "zip":
+            raise ValueError("output_formatがzipの場合のみ、1個のzipファイルに出力できます。")
+        with AnnotationArchive(output_dir / DATASET_ARCHIVE_FILENAME, compression=self.zip_compression) as archive:
+            self.dataset_archive = archive
+            try:
+                yield archive
+            finally:
+                self.dataset_archive = None
 
     def write_semseg_annotations(
         self,
@@ -55,22 +287,224 @@ class Semseg2Annofab:
         output_dir: Path,
         sequence_id: str,
     ):
-        output_dir.mkdir(exist_ok=True, parents=True)
-        sequence.load_lidar()
+        reader = create_frame_reader(sequence)
+        if self.output_format == "zip" and self.dataset_archive is None:
+            with AnnotationArchive(
+                output_dir.parent / f"{sequence_id}.zip", compression=self.zip_compression
+            ) as archive:
+                self._write_sequence(reader, output_dir, sequence_id, archive)
+        else:
+            self._write_sequence(reader, output_dir, sequence_id, self.dataset_archive)
+
+    def _write_sequence(
+        self,
+        reader: SequenceFrameReader,
+        output_dir: Path,
+        sequence_id: str,
+        archive: Optional[AnnotationArchive],
+    ) -> None:
+        sequence_writer = self.create_sequence_writer(reader, output_dir, sequence_id, archive=archive)
+        if self.frame_workers > 1:
+            sequence_writer.write_frames_in_processes(self.frame_workers)
+        else:
+            with prefetch_frames(reader, sequence_writer.frame_index_list, [sequence_writer], self.prefetch_config):
+                for index in sequence_writer.frame_index_list:
+                    sequence_writer.write_frame(index)
+        sequence_writer.finish()
 
-        range_obj = range(0, len(sequence.lidar.data), self.sampling_step)
 
-        sequence.load_semseg()
+class SemsegSequenceWriter:
+    """
+    1個のシーケンスのsemantic segmentationを、Annofabのアノテーションに変換して出力します。
+    出力対象のフレームごとに`write_frame`を呼び出し、最後に`finish`を呼び出してください。
 
-        for index in range_obj:
-            input_data_id = get_input_data_id_from_pandaset(sequence_id, index)
+    Args:
+        converter: 変換の設定
+        reader: シーケンスのreader
+        output_dir: シーケンスの出力先ディレクトリ
+        sequence_id: sequence_id
+        archive: 指定した場合は、`output_dir`ではなくzipファイルに出力します。
+            zipファイルは毎回作り直すので、出力済のフレームのスキップは行いません。
 
-            semseg_data = sequence.semseg.data[index]
+    `incremental`が有効な場合は、出力先のファイルが変わったフレームのinput_data_idを`CHANGED_INPUT_DATA_FILENAME`に追記します。
+    変換が途中で失敗しても変わったフレームが漏れないように、ファイルは実行のたびに作り直さず、追記します。
+    記録されたフレームをインポートした後は、ファイルを削除してください。
+    """
 
-            self.write_semseg_annotation_json(
-                semseg_data, semseg_classes=sequence.semseg.classes, task_dir=output_dir, input_data_id=input_data_id
+    def __init__(
+        self,
+        converter: Semseg2Annofab,
+        reader: SequenceFrameReader,
+        output_dir: Path,
+        sequence_id: str,
+        *,
+        archive: Optional[AnnotationArchive] = None,
+    ) -> None:
+        self.converter = converter
+        self.reader = reader
+        self.output_dir = output_dir
+        self.sequence_id = sequence_id
+        self.archive = archive
+        self.frame_index_list = converter.frame_sampler.select_frames(reader)
+
+        self.manifest: Optional[ManifestRecorder] = None
+        if archive is None:
+            output_dir.mkdir(exist_ok=True, parents=True)
+            self.manifest = ManifestRecorder(
+                output_dir,
+                reader.get_sequence_dir(),
+                parameters=converter.frame_sampler.to_dict(),
+                force=converter.force,
+                get_input_fingerprint=reader.get_input_fingerprint,
+            )
+
+    def _get_input_files(self, index: int) -> list[Path]:
+        return [self.reader.get_semseg_file_path(index), self.reader.get_semseg_classes_file_path()]
+
+    def get_prefetch_files(self, index: int) -> list[Path]:
+        """`write_frame`でフレームごとに読み込むファイルを返します。出力済のフレームなら空のlistを返します。"""
+        if self.manifest is not None and self.manifest.is_frame_up_to_date(
+            get_input_data_id_from_pandaset(self.sequence_id, index),
+            self._get_input_files(index),
+            parameters={},
+            count_skipped=False,
+        ):
+            return []
+        return [self.reader.get_semseg_file_path(index)]
+
+    def write_frame(self, index: int) -> None:
+        """1フレームのsemantic segmentationを出力します。出力済のフレームはスキップします。"""
+        input_data_id = get_input_data_id_from_pandaset(self.sequence_id, index)
+        if self.archive is not None:
+            self.converter.write_semseg_annotation_to_archive(
+                self.reader.read_semseg(index),
+                semseg_classes=self.reader.get_semseg_classes(),
+                archive=self.archive,
+                task_id=self.sequence_id,
+                input_data_id=input_data_id,
+            )
+            return
+
+        assert self.manifest is not None
+        input_files = self._get_input_files(index)
+        if self.manifest.is_frame_up_to_date(input_data_id, input_files, parameters={}):
+            return
+
+        semseg_data = self.reader.read_semseg(index)
+
+        output_files, is_changed = self.converter._write_semseg_annotation_files(
+            semseg_data["class"].to_numpy(),
+            semseg_data.index.to_numpy(),
+            self.reader.get_semseg_classes(),
+            self.output_dir,
+            input_data_id,
+            incremental=self.converter.incremental,
+        )
+        self._record_frame(input_data_id, input_files, output_files, is_changed)
+
+    def _record_frame(
+        self, input_data_id: str, input_files: list[Path], output_files: list[Path], is_changed: bool
+    ) -> None:
+        assert self.manifest is not None
+        if self.converter.incremental and is_changed:
+            with (self.output_dir / CHANGED_INPUT_DATA_FILENAME).open("a", encoding="utf-8") as f:
+                f.write(f"{input_data_id}\n")
+        self.manifest.record_frame(input_data_id, input_files, output_files, parameters={})
+
+    def _iter_frame_tasks(self) -> Iterator["SemsegFrameTask"]:
+        assert self.manifest is not None
+        for index in self.frame_index_list:
+            input_data_id = get_input_data_id_from_pandaset(self.sequence_id, index)
+            input_files = self._get_input_files(index)
+            if self.manifest.is_frame_up_to_date(input_data_id, input_files, parameters={}):
+                continue
+            yield SemsegFrameTask(
+                index=index,
+                input_data_id=input_data_id,
+                input_files=input_files,
+                semseg_classes=self.reader.get_semseg_classes(),
+                task_dir=self.output_dir,
+                incremental=self.converter.incremental,
             )
 
+    def load_frame_to_shared_memory(self, task: "SemsegFrameTask") -> tuple["SemsegFrameTask", SharedArrays]:
+        """semantic segmentationを読み込んで、ワーカプロセスに渡すために共有メモリに格納します。"""
+        semseg_data = self.reader.read_semseg(task.index)
+        shared_arrays = SharedArrays()
+        try:
+            shared_arrays.put("class", semseg_data["class"].to_numpy())
+            shared_arrays.put("index", semseg_data.index.to_numpy())
+        except BaseException:
+            shared_arrays.release()
+            raise
+        return task, shared_arrays
+
+    def write_frames_in_processes(self, workers: int) -> None:
+        """
+        出力対象のフレームを、プロセスプールで並列に出力します。
+        semantic segmentationの読み込みとマニフェストへの記録は親プロセスで行い、ファイルの書き込みはワーカプロセスで行います。
+        """
+        for task, (output_files, is_changed) in map_frames(
+            self.load_frame_to_shared_memory,
+            write_semseg_frame_from_shared_arrays,
+            self._iter_frame_tasks(),
+            workers=workers,
+        ):
+            self._record_frame(task.input_data_id, task.input_files, output_files, is_changed)
+
+    def finish(self) -> None:
+        if self.manifest is not None:
+            # 前回だけ出力したフレームのファイルは、インポートされないように削除する
+            self.manifest.compact(
+                frame_ids=[get_input_data_id_from_pandaset(self.sequence_id, index) for index in self.frame_index_list]
+            )
+            if self.manifest.skipped_frame_count > 0:
+                logger.info(
+                    f"sequence_id='{self.sequence_id}' :: {len(self.frame_index_list)}件中"
+                    f"{self.manifest.skipped_frame_count}件のフレームは出力済なので、スキップしました。"
+                )
+        changed_input_data_file = self.output_dir / CHANGED_INPUT_DATA_FILENAME
+        if self.converter.incremental and changed_input_data_file.exists():
+            # 複数回の実行で追記された重複を取り除く
+            input_data_ids = list(dict.fromkeys(changed_input_data_file.read_text(encoding="utf-8").splitlines()))
+            changed_input_data_file.write_text("".join(f"{e}\n" for e in input_data_ids), encoding="utf-8")
+            logger.info(
+                f"sequence_id='{self.sequence_id}' :: 出力先のファイルが変わった{len(input_data_ids)}件のフレームを、"
+                f"'{changed_input_data_file}'に記録しています。"
+            )
+
+
+@dataclass
+class SemsegFrameTask:
+    """ワーカプロセスで出力する1フレーム分の情報。点ごとのクラスIDは共有メモリで渡すので、含みません。"""
+
+    index: int
+    input_data_id: str
+    input_files: list[Path]
+    semseg_classes: dict[str, str]
+    task_dir: Path
+    incremental: bool
+
+
+def write_semseg_frame_from_shared_arrays(
+    task: SemsegFrameTask, shared_arrays: SharedArrays
+) -> tuple[list[Path], bool]:
+    """
+    ワーカプロセスで1フレームのsemantic segmentationを出力します。
+
+    Returns:
+        tuple(出力したファイルのlist, 出力先のファイルを書き込んだか削除したかどうか)
+    """
+    with shared_arrays.open() as arrays:
+        return Semseg2Annofab._write_semseg_annotation_files(
+            arrays["class"],
+            arrays["index"],
+            task.semseg_classes,
+            task.task_dir,
+            task.input_data_id,
+            incremental=task.incremental,
+        )
+
 
 def parse_args():
     parser = ArgumentParser(
@@ -82,7 +516,52 @@ def parse_args():
     parser.add_argument("-o", "--output_dir", type=Path, required=True, help="出力先ディレクトリ")
 
     parser.add_argument("--sequence_id", type=str, nargs="+", required=False, help="出力対象のsequence id")
-    parser.add_argument("--sampling_step", type=int, default=1, required=False, help="指定した値ごとにフレームを出力します。")
+    add_frame_sampler_arguments(parser)
+    add_force_argument(parser)
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="前回の出力先ディレクトリと比較して、内容が変わったセグメントファイルだけを書き込み、不要になったセグメントファイルを削除します。"
+        f"ファイルが変わったフレームのinput_data_idは、シーケンスの出力先ディレクトリの`{CHANGED_INPUT_DATA_FILENAME}`に追記します。"
+        "インポートした後は削除してください。",
+    )
+    add_workers_argument(parser)
+    parser.add_argument(
+        "--frame_workers",
+        type=int,
+        default=1,
+        required=False,
+        help="シーケンス内のフレームを並列に出力するプロセス数。1個の大きいシーケンスを変換する場合に指定します。"
+        "クラスIDの配列は共有メモリ経由でワーカプロセスに渡します。",
+    )
+    parser.add_argument(
+        "--output_format",
+        type=str,
+        choices=OUTPUT_FORMATS,
+        default="directory",
+        required=False,
+        help="出力形式。zip: 一時ファイルを作成せずに、アノテーションをzipファイルに直接書き込みます。"
+        "`--force`を指定しなくても全フレームを出力し、`--incremental`と`--frame_workers`は指定できません。",
+    )
+    parser.add_argument(
+        "--zip_compression",
+        type=str,
+        choices=list(ZIP_COMPRESSIONS),
+        default="deflate",
+        required=False,
+        help="zipファイルのエントリの圧縮方式。stored: 圧縮しません。deflate: deflateで圧縮します。",
+    )
+    parser.add_argument(
+        "--zip_scope",
+        type=str,
+        choices=ZIP_SCOPES,
+        default="sequence",
+        required=False,
+        help="zipファイルの単位。sequence: シーケンスごとに`{sequence_id}.zip`を出力します。"
+        "dataset: すべてのシーケンスを`annotation.zip`に出力します。変換に失敗したシーケンスがある場合は出力しません。"
+        "datasetの場合は`--workers`に2以上を指定できません。",
+    )
+    add_prefetch_arguments(parser, exclusive_options=["--frame_workers"])
 
     return parser.parse_args()
 
@@ -97,24 +576,46 @@ def main() -> None:
     input_dir: Path = args.input_dir
     logger.info(f"{input_dir} のSemantic Segmentationを、Annofabのアノテーションフォーマットに変換します。")
 
-    main_obj = Semseg2Annofab(sampling_step=args.sampling_step)
+    main_obj = Semseg2Annofab(
+        frame_sampler=create_frame_sampler_from_args(args),
+        force=args.force,
+        incremental=args.incremental,
+        frame_workers=args.frame_workers,
+        output_format=args.output_format,
+        zip_compression=args.zip_compression,
+        prefetch_config=create_prefetch_config_from_args(args),
+    )
 
-    dataset = DataSet(str(input_dir))
+    dataset = open_dataset(input_dir)
 
     if args.sequence_id is None:
         sequence_id_list = dataset.sequences()
     else:
         sequence_id_list = args.sequence_id
 
-    for sequence_id in sequence_id_list:
-        sequence = dataset[sequence_id]
-        logger.info(f"{sequence_id=}のsemantic segmentationをAnnofabのアノテーションフォーマットに変換します。")
-        try:
-            main_obj.write_semseg_annotations(sequence, output_dir=output_dir / sequence_id, sequence_id=sequence_id)
-        except Exception:
-            logger.warning(f"{sequence_id=}のsemantic segmentationをAnnofabのアノテーションフォーマットに変換に失敗しました。", exc_info=True)
-        finally:
-            dataset.unload(sequence_id)
+    def process() -> list[str]:
+        return process_sequences(
+            main_obj.write_semseg_annotations,
+            input_dir=input_dir,
+            output_dir=output_dir,
+            sequence_id_list=sequence_id_list,
+            process_name="semantic segmentationのAnnofabのアノテーションフォーマットへの変換",
+            workers=args.workers,
+        )
+
+    if args.output_format == "zip" and args.zip_scope == "dataset":
+        if args.workers > 1:
+            raise ValueError("`--zip_scope dataset`の場合は、`--workers`に2以上を指定できません。")
+        with main_obj.open_dataset_archive(output_dir):
+            failed_sequence_id_list = process()
+            if len(failed_sequence_id_list) > 0:
+                # 失敗したシーケンスの途中までのエントリを含むzipファイルは、インポートできないので出力しない
+                raise RuntimeError(
+                    f"{len(failed_sequence_id_list)}件のシーケンスの変換に失敗したので、"
+                    f"'{output_dir / DATASET_ARCHIVE_FILENAME}'を出力しませんでした。 :: {failed_sequence_id_list}"
+                )
+    else:
+        process()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,104 @@
+import logging
+from argparse import ArgumentDefaultsHelpFormatter, ArgumentParser
+from pathlib import Path
+
+from pandaset import DataSet
+from pandaset.sequence import Sequence
+
+from panda2anno.common.dataset_index import (
+    create_sequence_index,
+    get_default_index_dir,
+    load_sequence_index,
+    save_sequence_index,
+)
+from panda2anno.common.parallel import process_sequences
+from panda2anno.common.utils import set_default_logger
+
+logger = logging.getLogger(__name__)
+
+
+class DatasetIndexCreator:
+    def __init__(self, index_dir: Path, force: bool = False) -> None:
+        """
+        Args:
+            index_dir: インデックスの出力先ディレクトリ
+            force: Trueなら、前回のインデックスを利用せずにすべてのフレームを読み込みます。
+        """
+        self.index_dir = index_dir
+        self.force = force
+
+    def write_sequence_index(self, sequence: Sequence, output_dir: Path, sequence_id: str) -> None:
+        """
+        1個のシーケンスのインデックスを出力します。
+        前回のインデックスがあれば、ファイルが変わっていないフレームは読み込みません。
+        """
+        previous = None if self.force else load_sequence_index(self.index_dir, sequence_id)
+        sequence_index, reused_frame_count = create_sequence_index(sequence, sequence_id, previous=previous)
+        index_file = save_sequence_index(self.index_dir, sequence_index)
+        logger.debug(
+            f"{sequence_id=} :: '{index_file}'を出力しました。"
+            f"{len(sequence_index.frames)}件中{reused_frame_count}件のフレームは、前回のインデックスを利用しました。"
+        )
+
+
+def parse_args():
+    parser = ArgumentParser(
+        description="PandaSetのシーケンスごとに、フレーム数、pose、タイムスタンプ、カメラ、アノテーションの集計結果を格納したインデックスを出力します。"
+        "print_*コマンドは、インデックスがあればpickleファイルを読み込まずに結果を出力します。",
+        formatter_class=ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("-i", "--input_dir", type=Path, required=True, help="pandasetのディレクトリ")
+    parser.add_argument(
+        "--index_dir",
+        type=Path,
+        required=False,
+        help="インデックスの出力先ディレクトリ。指定しない場合は`~/.cache/panda2anno/index`の下の、input_dirごとのディレクトリに出力します。"
+        "環境変数`XDG_CACHE_HOME`が設定されていれば`$XDG_CACHE_HOME/panda2anno/index`の下に出力します。",
+    )
+
+    parser.add_argument("--sequence_id", type=str, nargs="+", required=False, help="出力対象のsequence id")
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="前回のインデックスを利用せずに、すべてのフレームを読み込みます。指定しない場合は、ファイルが変わっていないフレームを読み込みません。",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        required=False,
+        help="並列に処理するプロセス数。2以上を指定すると、シーケンス単位でプロセスプールを使って処理します。",
+    )
+
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    set_default_logger()
+
+    input_dir: Path = args.input_dir
+    index_dir: Path = args.index_dir if args.index_dir is not None else get_default_index_dir(input_dir)
+    logger.info(f"{input_dir} のインデックスを、{index_dir} に出力します。")
+
+    main_obj = DatasetIndexCreator(index_dir, force=args.force)
+
+    dataset = DataSet(str(input_dir))
+
+    if args.sequence_id is None:
+        sequence_id_list = dataset.sequences()
+    else:
+        sequence_id_list = args.sequence_id
+
+    process_sequences(
+        main_obj.write_sequence_index,
+        input_dir=input_dir,
+        output_dir=index_dir,
+        sequence_id_list=sequence_id_list,
+        process_name="インデックスの作成",
+        workers=args.workers,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -2,16 +2,25 @@ import logging
 from argparse import ArgumentDefaultsHelpFormatter, ArgumentParser
 from collections import Counter
 from pathlib import Path
-from typing import Any, Optional
+from typing import Any, Optional, cast
 
+import numpy
 import pandas
 from pandaset import DataSet
 from pandaset.sequence import Sequence
 
+from panda2anno.common.dataset_index import (
+    SequenceIndex,
+    get_default_index_dir,
+    load_up_to_date_sequence_index,
+)
+from panda2anno.common.frame_reader import SequenceFrameReader
 from panda2anno.common.utils import set_default_logger
 
 logger = logging.getLogger(__name__)
 
+ATTRIBUTE_NAMES = ["object_motion", "rider_status", "pedestrian_behavior", "pedestrian_age"]
+
 
 class AttributeCounter:
     object_motion: Counter
@@ -61,33 +70,121 @@ def parse_args():
     parser.add_argument("-i", "--input_dir", type=Path, required=True, help="pandasetのディレクトリ")
     parser.add_argument("-o", "--output", type=Path, required=True, help="出力先")
 
+    parser.add_argument(
+        "--index_dir",
+        type=Path,
+        required=False,
+        help="`panda2anno.create_dataset_index`で作成したインデックスのディレクトリ。"
+        "指定しない場合は`~/.cache/panda2anno/index`の下の、input_dirごとのディレクトリです。インデックスが最新ならpickleファイルを読み込みません。",
+    )
+    parser.add_argument(
+        "--per_frame_output",
+        type=Path,
+        required=False,
+        help="指定した場合、フレームごとの属性の値の個数を出力します。",
+    )
     parser.add_argument("--sequence_id", type=str, nargs="+", required=False, help="出力対象のsequence id")
 
     return parser.parse_args()
 
 
+def read_attribute_values(sequence: Sequence) -> pandas.DataFrame:
+    """
+    全フレームのcuboidの属性の値を読み込みます。
+
+    Returns:
+        1行が1個のcuboidの1個の属性に対応するDataFrame。
+        列は`frame_index`、`attribute`（属性名）、`value`（値）です。`attribute`と`value`はcategory型です。
+    """
+    reader = SequenceFrameReader(sequence)
+
+    frame_index_list: list[numpy.ndarray] = []
+    attribute_code_list: list[numpy.ndarray] = []
+    value_list: list[numpy.ndarray] = []
+    for index in range(reader.get_cuboids_frame_count()):
+        df = reader.read_cuboids(index)
+        for code, name in enumerate(ATTRIBUTE_NAMES):
+            column = f"attributes.{name}"
+            if column not in df.columns:
+                continue
+            value_list.append(df[column].to_numpy(dtype=object))
+            attribute_code_list.append(numpy.full(len(df), code, dtype=numpy.int8))
+            frame_index_list.append(numpy.full(len(df), index))
+
+    if len(value_list) == 0:
+        value_list.append(numpy.array([], dtype=object))
+        attribute_code_list.append(numpy.array([], dtype=numpy.int8))
+        frame_index_list.append(numpy.array([], dtype=int))
+
+    # 属性名と値の種類は少ないので、category型にしてから集計する
+    return pandas.DataFrame(
+        {
+            "frame_index": numpy.concatenate(frame_index_list),
+            "attribute": pandas.Categorical.from_codes(
+                numpy.concatenate(attribute_code_list), categories=pandas.Index(ATTRIBUTE_NAMES)
+            ),
+            "value": pandas.Categorical(numpy.concatenate(value_list)),
+        }
+    )
+
+
+def count_attribute_values(attribute_values: pandas.DataFrame, columns: list[str]) -> pandas.Series:
+    """
+    `read_attribute_values`で読み込んだ属性の値を、`columns`ごとに数えます。欠損値は`nan`として数えます。
+    """
+    counts = attribute_values.value_counts(columns, dropna=False, sort=False)
+    # category型の列は、出現しない組み合わせの個数0も含まれるので除外する
+    return counts[counts > 0]
+
+
 def get_attribute_counter(sequence: Sequence) -> AttributeCounter:
-    sequence.load_cuboids()
-    # 先頭だけ見る
-
-    result = AttributeCounter()
-    for df in sequence.cuboids.data:
-        counter = AttributeCounter(
-            object_motion=Counter(df["attributes.object_motion"])
-            if "attributes.object_motion" in df.columns
-            else Counter(),
-            rider_status=Counter(df["attributes.rider_status"])
-            if "attributes.rider_status" in df.columns
-            else Counter(),
-            pedestrian_behavior=Counter(df["attributes.pedestrian_behavior"])
-            if "attributes.pedestrian_behavior" in df.columns
-            else Counter(),
-            pedestrian_age=Counter(df["attributes.pedestrian_age"])
-            if "attributes.pedestrian_age" in df.columns
-            else Counter(),
-        )
-        result = result + counter
-    return result
+    return get_attribute_counter_from_values(read_attribute_values(sequence))
+
+
+def get_attribute_counter_from_values(attribute_values: pandas.DataFrame) -> AttributeCounter:
+    counts = count_attribute_values(attribute_values, ["attribute", "value"])
+    counters: dict[str, Counter] = {name: Counter() for name in ATTRIBUTE_NAMES}
+    for key, count in counts.items():
+        attribute_name, value = cast(tuple[str, str], key)
+        counters[attribute_name][str(value)] += int(count)
+    return AttributeCounter(**counters)
+
+
+def get_attribute_counter_from_index(sequence_index: SequenceIndex) -> AttributeCounter:
+    counters: dict[str, Counter] = {name: Counter() for name in ATTRIBUTE_NAMES}
+    for frame in sequence_index.frames:
+        for attribute_name in ATTRIBUTE_NAMES:
+            counters[attribute_name].update(frame.cuboid_attribute_counts.get(attribute_name, {}))
+    return AttributeCounter(**counters)
+
+
+def get_frame_df_from_values(attribute_values: pandas.DataFrame) -> pandas.DataFrame:
+    """
+    フレームごとの属性の値の個数を格納したDataFrameを生成します。列は`frame_index`と`{属性名}.{値}`です。
+    """
+    counts = count_attribute_values(attribute_values, ["frame_index", "attribute", "value"])
+    columns = [f"{attribute_name}.{value}" for _, attribute_name, value in counts.index]
+    df = pandas.DataFrame(
+        {"frame_index": counts.index.get_level_values("frame_index"), "column": columns, "count": counts.to_numpy()}
+    )
+    return df.pivot_table(index="frame_index", columns="column", values="count", aggfunc="sum", fill_value=0)
+
+
+def get_frame_df_from_index(sequence_index: SequenceIndex) -> pandas.DataFrame:
+    df = pandas.DataFrame.from_records([frame.get_flat_attribute_counts() for frame in sequence_index.frames])
+    df.index.name = "frame_index"
+    return df.fillna(0).astype(int)
+
+
+def create_frame_df(frame_df_dict: dict[str, pandas.DataFrame]) -> pandas.DataFrame:
+    """
+    シーケンスごとの、フレームごとの属性の値の個数を結合します。列は`sequence_id`、`frame_index`、`{属性名}.{値}`です。
+    """
+    if len(frame_df_dict) == 0:
+        return pandas.DataFrame(columns=["sequence_id", "frame_index"])
+    df = pandas.concat(frame_df_dict, names=["sequence_id", "frame_index"]).fillna(0).astype(int).reset_index()
+    count_columns = sorted(set(df.columns) - {"sequence_id", "frame_index"})
+    return df[["sequence_id", "frame_index"] + count_columns]
 
 
 def get_df_from_sequence_counter(sequence_counter: dict[str, AttributeCounter]) -> pandas.DataFrame:
@@ -105,6 +202,7 @@ def main() -> None:
     set_default_logger()
 
     input_dir: Path = args.input_dir
+    index_dir: Path = args.index_dir if args.index_dir is not None else get_default_index_dir(input_dir)
 
     dataset = DataSet(str(input_dir))
 
@@ -113,12 +211,23 @@ def main() -> None:
     else:
         sequence_id_list = args.sequence_id
 
+    per_frame_output: Optional[Path] = args.per_frame_output
     sequence_counter: dict[str, AttributeCounter] = {}
+    frame_df_dict: dict[str, pandas.DataFrame] = {}
     for sequence_id in sequence_id_list:
         sequence = dataset[sequence_id]
         logger.info(f"{sequence_id=}のcuboidを読み込みます。")
         try:
-            sequence_counter[sequence_id] = get_attribute_counter(sequence)
+            sequence_index = load_up_to_date_sequence_index(index_dir, sequence, sequence_id)
+            if sequence_index is not None:
+                sequence_counter[sequence_id] = get_attribute_counter_from_index(sequence_index)
+                if per_frame_output is not None:
+                    frame_df_dict[sequence_id] = get_frame_df_from_index(sequence_index)
+            else:
+                attribute_values = read_attribute_values(sequence)
+                sequence_counter[sequence_id] = get_attribute_counter_from_values(attribute_values)
+                if per_frame_output is not None:
+                    frame_df_dict[sequence_id] = get_frame_df_from_values(attribute_values)
         except Exception:
             logger.warning(f"{sequence_id=}のcuboidの読み込みに失敗しました。", exc_info=True)
         finally:
@@ -129,6 +238,10 @@ def main() -> None:
     output.parent.mkdir(exist_ok=True, parents=True)
     df.to_csv(str(output), index=False)
 
+    if per_frame_output is not None:
+        per_frame_output.parent.mkdir(exist_ok=True, parents=True)
+        create_frame_df(frame_df_dict).to_csv(str(per_frame_output), index=False)
+
 
 if __name__ == "__main__":
     main()
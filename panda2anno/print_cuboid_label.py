@@ -7,6 +7,8 @@ from pandaset import DataSet
 from pandaset.sequence import Sequence
 
 from panda2anno.common.annofab import get_label_id_from_pandaset
+from panda2anno.common.dataset_index import SequenceIndex, get_default_index_dir, load_up_to_date_sequence_index
+from panda2anno.common.frame_reader import SequenceFrameReader
 from panda2anno.common.utils import set_default_logger
 
 logger = logging.getLogger(__name__)
@@ -20,26 +22,38 @@ def parse_args():
     parser.add_argument("-i", "--input_dir", type=Path, required=True, help="pandasetのディレクトリ")
     parser.add_argument("-o", "--output", type=Path, required=True, help="出力先")
 
+    parser.add_argument(
+        "--index_dir",
+        type=Path,
+        required=False,
+        help="`panda2anno.create_dataset_index`で作成したインデックスのディレクトリ。"
+        "指定しない場合は`~/.cache/panda2anno/index`の下の、input_dirごとのディレクトリです。インデックスが最新ならpickleファイルを読み込みません。",
+    )
     parser.add_argument("--sequence_id", type=str, nargs="+", required=False, help="出力対象のsequence id")
 
     return parser.parse_args()
 
 
 def get_unique_labels(sequence: Sequence) -> set[str]:
-    sequence.load_cuboids()
     # 先頭だけ見る
-    df = sequence.cuboids.data[0]
+    df = SequenceFrameReader(sequence).read_cuboids(0)
 
     result = set(df["label"].unique())
     logger.debug(f"{result=}")
     return result
 
 
+def get_unique_labels_from_index(sequence_index: SequenceIndex) -> set[str]:
+    # 先頭だけ見る
+    return set(sequence_index.frames[0].cuboid_label_counts.keys())
+
+
 def main() -> None:
     args = parse_args()
     set_default_logger()
 
     input_dir: Path = args.input_dir
+    index_dir: Path = args.index_dir if args.index_dir is not None else get_default_index_dir(input_dir)
 
     dataset = DataSet(str(input_dir))
 
@@ -53,7 +67,11 @@ def main() -> None:
         sequence = dataset[sequence_id]
         logger.info(f"{sequence_id=}のcuboidのlabel一覧を取得します。")
         try:
-            tmp_labels = get_unique_labels(sequence)
+            sequence_index = load_up_to_date_sequence_index(index_dir, sequence, sequence_id)
+            if sequence_index is not None:
+                tmp_labels = get_unique_labels_from_index(sequence_index)
+            else:
+                tmp_labels = get_unique_labels(sequence)
             labels = labels | tmp_labels
         except Exception:
             logger.warning(f"{sequence_id=}のcuboidのロードに失敗しました。", exc_info=True)
@@ -8,6 +8,12 @@ from typing import Any
 import pandas
 from pandaset import DataSet
 
+from panda2anno.common.dataset_index import (
+    SequenceIndex,
+    get_default_index_dir,
+    get_index_file_path,
+    load_up_to_date_sequence_index,
+)
 from panda2anno.common.utils import set_default_logger
 
 logger = logging.getLogger(__name__)
@@ -21,6 +27,13 @@ def parse_args():
     parser.add_argument("-i", "--input_dir", type=Path, required=True, help="pandasetのディレクトリ")
     parser.add_argument("-o", "--output", type=Path, required=True, help="出力先")
     parser.add_argument("--camera", type=str, default="front_camera", required=False, help="出力対象のcamera")
+    parser.add_argument(
+        "--index_dir",
+        type=Path,
+        required=False,
+        help="`panda2anno.create_dataset_index`で作成したインデックスのディレクトリ。"
+        "指定しない場合は`~/.cache/panda2anno/index`の下の、input_dirごとのディレクトリです。インデックスが最新ならpickleファイルを読み込みません。",
+    )
     parser.add_argument("--sequence_id", type=str, nargs="+", required=False, help="出力対象のsequence id")
 
     return parser.parse_args()
@@ -34,11 +47,18 @@ def get_datetime_from_json(timestamps_json: Path) -> str:
     return first_datetime.isoformat()
 
 
+def get_datetime_from_index(sequence_index: SequenceIndex, camera_name: str) -> str:
+    first_timestamp = sequence_index.camera_timestamps[camera_name][0]
+    first_datetime = datetime.datetime.fromtimestamp(first_timestamp)
+    return first_datetime.isoformat()
+
+
 def main() -> None:
     args = parse_args()
     set_default_logger()
 
     input_dir: Path = args.input_dir
+    index_dir: Path = args.index_dir if args.index_dir is not None else get_default_index_dir(input_dir)
 
     dataset = DataSet(str(input_dir))
 
@@ -52,7 +72,18 @@ def main() -> None:
     for sequence_id in sequence_id_list:
         logger.info(f"{sequence_id=}のsemsegのtimestamp情報を取得します。")
         try:
-            str_datetime = get_datetime_from_json(input_dir / sequence_id / "camera" / camera_name / "timestamps.json")
+            # インデックスがなければ、インデックスの確認で全ファイルの情報を取得せずに、timestamps.jsonだけを読み込む
+            sequence_index = (
+                load_up_to_date_sequence_index(index_dir, dataset[sequence_id], sequence_id)
+                if get_index_file_path(index_dir, sequence_id).exists()
+                else None
+            )
+            if sequence_index is not None:
+                str_datetime = get_datetime_from_index(sequence_index, camera_name)
+            else:
+                str_datetime = get_datetime_from_json(
+                    input_dir / sequence_id / "camera" / camera_name / "timestamps.json"
+                )
 
             data.append({"sequence_id": sequence_id, "datetime": str_datetime})
 
@@ -8,6 +8,8 @@ import pandas
 from pandaset import DataSet
 from pandaset.sequence import Sequence
 
+from panda2anno.common.dataset_index import SequenceIndex, get_default_index_dir, load_up_to_date_sequence_index
+from panda2anno.common.frame_reader import SequenceFrameReader
 from panda2anno.common.utils import set_default_logger
 
 logger = logging.getLogger(__name__)
@@ -21,25 +23,40 @@ def parse_args():
     parser.add_argument("-i", "--input_dir", type=Path, required=True, help="pandasetのディレクトリ")
     parser.add_argument("-o", "--output", type=Path, required=True, help="出力先")
 
+    parser.add_argument(
+        "--index_dir",
+        type=Path,
+        required=False,
+        help="`panda2anno.create_dataset_index`で作成したインデックスのディレクトリ。"
+        "指定しない場合は`~/.cache/panda2anno/index`の下の、input_dirごとのディレクトリです。インデックスが最新ならpickleファイルを読み込みません。",
+    )
     parser.add_argument("--sequence_id", type=str, nargs="+", required=False, help="出力対象のsequence id")
 
     return parser.parse_args()
 
 
 def get_label_counter(sequence: Sequence) -> dict[str, int]:
-    sequence.load_cuboids()
+    reader = SequenceFrameReader(sequence)
     # 先頭だけ見る
-    df = sequence.semseg.data[0]
+    df = reader.read_semseg(0)
     tmp = Counter(df["class"])
-    classes = sequence.semseg.classes
+    classes = reader.get_semseg_classes()
     return {classes[str(class_id)]: count for class_id, count in tmp.items()}
 
 
+def get_label_counter_from_index(sequence_index: SequenceIndex) -> dict[str, int]:
+    assert sequence_index.semseg_classes is not None
+    classes = sequence_index.semseg_classes
+    # 先頭だけ見る
+    return {classes[class_id]: count for class_id, count in sequence_index.frames[0].semseg_class_counts.items()}
+
+
 def main() -> None:
     args = parse_args()
     set_default_logger()
 
     input_dir: Path = args.input_dir
+    index_dir: Path = args.index_dir if args.index_dir is not None else get_default_index_dir(input_dir)
 
     dataset = DataSet(str(input_dir))
 
@@ -53,8 +70,11 @@ def main() -> None:
         sequence = dataset[sequence_id]
         logger.info(f"{sequence_id=}のsemsegのlabel一覧を取得します。")
         try:
-            sequence.load_semseg()
-            tmp = get_label_counter(sequence)
+            sequence_index = load_up_to_date_sequence_index(index_dir, sequence, sequence_id)
+            if sequence_index is not None:
+                tmp = get_label_counter_from_index(sequence_index)
+            else:
+                tmp = get_label_counter(sequence)
             tmp["sequence_id"] = sequence_id
             data.append(tmp)
 
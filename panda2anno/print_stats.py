@@ -0,0 +1,189 @@
+import datetime
+import logging
+from argparse import ArgumentDefaultsHelpFormatter, ArgumentParser
+from pathlib import Path
+from typing import Any, Optional
+
+import pandas
+from pandaset import DataSet
+
+from panda2anno.common.annofab import get_label_id_from_pandaset
+from panda2anno.common.dataset_index import (
+    SequenceIndex,
+    create_sequence_index,
+    get_default_index_dir,
+    load_up_to_date_sequence_index,
+)
+from panda2anno.common.utils import set_default_logger
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_FORMATS = ["csv", "parquet"]
+
+
+def sum_counts(counts_list: list[dict[str, int]]) -> dict[str, int]:
+    """フレームごとの個数を合計します。"""
+    if len(counts_list) == 0:
+        return {}
+    df = pandas.DataFrame.from_records(counts_list)
+    return {str(key): int(value) for key, value in df.sum().items()}
+
+
+def get_cuboid_label_counts(sequence_index: SequenceIndex) -> dict[str, int]:
+    """全フレームのcuboidのlabelごとの個数"""
+    return sum_counts([frame.cuboid_label_counts for frame in sequence_index.frames])
+
+
+def get_attribute_counts(sequence_index: SequenceIndex) -> dict[str, int]:
+    """
+    全フレームのcuboidの属性の値ごとの個数。keyは`{属性名}.{値}`です。
+    """
+    return sum_counts([frame.get_flat_attribute_counts() for frame in sequence_index.frames])
+
+
+def get_semseg_counts(sequence_index: SequenceIndex) -> dict[str, int]:
+    """全フレームのsemantic segmentationのクラス名ごとの点の数"""
+    if sequence_index.semseg_classes is None:
+        return {}
+    classes = sequence_index.semseg_classes
+    class_counts = sum_counts([frame.semseg_class_counts for frame in sequence_index.frames])
+    return {classes[class_id]: count for class_id, count in class_counts.items()}
+
+
+def get_first_datetime(sequence_index: SequenceIndex, camera_name: str) -> Optional[str]:
+    """カメラの先頭フレームの日時。カメラが存在しなければNone"""
+    timestamps = sequence_index.camera_timestamps.get(camera_name)
+    if timestamps is None or len(timestamps) == 0:
+        return None
+    return datetime.datetime.fromtimestamp(timestamps[0]).isoformat()
+
+
+def create_count_dataframe(rows: list[dict[str, Any]]) -> pandas.DataFrame:
+    """
+    sequence_idと個数を格納したdictのlistから、DataFrameを生成します。存在しない値の個数は0にします。
+    """
+    if len(rows) == 0:
+        return pandas.DataFrame(columns=["sequence_id"])
+    df = pandas.DataFrame.from_records(rows)
+    count_columns = sorted(set(df.columns) - {"sequence_id"})
+    df[count_columns] = df[count_columns].fillna(0).astype(int)
+    return df[["sequence_id"] + count_columns]
+
+
+class StatsCollector:
+    """
+    シーケンスごとの統計情報を集めて、指標ごとのDataFrameを生成します。
+
+    Args:
+        camera_name: 日時を取得するカメラ
+    """
+
+    def __init__(self, camera_name: str = "front_camera") -> None:
+        self.camera_name = camera_name
+        self.labels: set[str] = set()
+        self.cuboid_label_count_rows: list[dict[str, Any]] = []
+        self.attribute_count_rows: list[dict[str, Any]] = []
+        self.semseg_count_rows: list[dict[str, Any]] = []
+        self.datetime_rows: list[dict[str, Any]] = []
+
+    def add(self, sequence_index: SequenceIndex) -> None:
+        sequence_id = sequence_index.sequence_id
+        cuboid_label_counts = get_cuboid_label_counts(sequence_index)
+        self.labels.update(cuboid_label_counts.keys())
+        self.cuboid_label_count_rows.append({"sequence_id": sequence_id, **cuboid_label_counts})
+        self.attribute_count_rows.append({"sequence_id": sequence_id, **get_attribute_counts(sequence_index)})
+        if sequence_index.semseg_classes is not None:
+            self.semseg_count_rows.append({"sequence_id": sequence_id, **get_semseg_counts(sequence_index)})
+        self.datetime_rows.append(
+            {"sequence_id": sequence_id, "datetime": get_first_datetime(sequence_index, self.camera_name)}
+        )
+
+    def get_dataframes(self) -> dict[str, pandas.DataFrame]:
+        """keyが指標の名前、valueがその指標のDataFrameであるdictを返します。"""
+        label_list = sorted(self.labels)
+        return {
+            "label": pandas.DataFrame(
+                {"label_id": [get_label_id_from_pandaset(label) for label in label_list], "label_name": label_list}
+            ),
+            "cuboid_label_count": create_count_dataframe(self.cuboid_label_count_rows),
+            "attribute_count": create_count_dataframe(self.attribute_count_rows),
+            "semseg_count": create_count_dataframe(self.semseg_count_rows),
+            "datetime": pandas.DataFrame(self.datetime_rows, columns=["sequence_id", "datetime"]),
+        }
+
+
+def write_dataframes(dataframes: dict[str, pandas.DataFrame], output_dir: Path, output_format: str) -> None:
+    output_dir.mkdir(exist_ok=True, parents=True)
+    for metric_name, df in dataframes.items():
+        output_file = output_dir / f"{metric_name}.{output_format}"
+        if output_format == "parquet":
+            df.to_parquet(output_file, index=False)
+        else:
+            df.to_csv(output_file, index=False)
+        logger.debug(f"'{output_file}'を出力しました。")
+
+
+def parse_args():
+    parser = ArgumentParser(
+        description="PandaSetの各シーケンスを1回だけ読み込んで、cuboidのlabel一覧、label数、属性の値の数、semsegのクラスごとの点の数、日時を出力します。"
+        "個数は全フレームの合計です。",
+        formatter_class=ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("-i", "--input_dir", type=Path, required=True, help="pandasetのディレクトリ")
+    parser.add_argument(
+        "-o", "--output_dir", type=Path, required=True, help="出力先ディレクトリ。指標ごとに1個のファイルを出力します。"
+    )
+    parser.add_argument(
+        "--format",
+        type=str,
+        choices=OUTPUT_FORMATS,
+        default="csv",
+        required=False,
+        help="出力するファイルのフォーマット。parquetを指定する場合はpyarrowが必要です。",
+    )
+    parser.add_argument("--camera", type=str, default="front_camera", required=False, help="日時を取得するcamera")
+    parser.add_argument(
+        "--index_dir",
+        type=Path,
+        required=False,
+        help="`panda2anno.create_dataset_index`で作成したインデックスのディレクトリ。"
+        "指定しない場合は`~/.cache/panda2anno/index`の下の、input_dirごとのディレクトリです。インデックスが最新ならpickleファイルを読み込みません。",
+    )
+    parser.add_argument("--sequence_id", type=str, nargs="+", required=False, help="出力対象のsequence id")
+
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    set_default_logger()
+
+    input_dir: Path = args.input_dir
+    index_dir: Path = args.index_dir if args.index_dir is not None else get_default_index_dir(input_dir)
+
+    dataset = DataSet(str(input_dir))
+
+    if args.sequence_id is None:
+        sequence_id_list = dataset.sequences()
+    else:
+        sequence_id_list = args.sequence_id
+
+    collector = StatsCollector(camera_name=args.camera)
+    for sequence_id in sequence_id_list:
+        sequence = dataset[sequence_id]
+        logger.info(f"{sequence_id=}の統計情報を取得します。")
+        try:
+            sequence_index = load_up_to_date_sequence_index(index_dir, sequence, sequence_id)
+            if sequence_index is None:
+                sequence_index, _ = create_sequence_index(sequence, sequence_id)
+            collector.add(sequence_index)
+        except Exception:
+            logger.warning(f"{sequence_id=}の統計情報の取得に失敗しました。", exc_info=True)
+        finally:
+            dataset.unload(sequence_id)
+
+    write_dataframes(collector.get_dataframes(), args.output_dir, args.format)
+
+
+if __name__ == "__main__":
+    main()
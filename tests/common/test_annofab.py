@@ -0,0 +1,64 @@
+import json
+import math
+
+import numpy
+
+from panda2anno.common.annofab import (
+    encode_annotation_detail,
+    encode_cuboid_data,
+    get_cuboid_data_dict,
+    get_semseg_annotation_id,
+    write_annotation_file,
+)
+
+
+def test_get_semseg_annotation_id():
+    annotation_id = get_semseg_annotation_id("001-0", 5)
+    assert annotation_id == get_semseg_annotation_id("001-0", 5)
+    assert annotation_id != get_semseg_annotation_id("001-0", 6)
+    assert annotation_id != get_semseg_annotation_id("001-1", 5)
+
+
+def test_encode_cuboid_data():
+    values = numpy.array(
+        [
+            [1.867, 1.673, 4.629, -7.8784985, 36.812959, 0.2084706, 4.7455455, 0.0331504, -0.99945, 0.0, 0.0, 0.0, 1.0],
+            [1.0, 2.0, 3.0, -0.0, 1e-20, 1e20, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7],
+            # NaNやinfは`json.dumps`と同じ表現にする
+            [math.nan, math.inf, -math.inf, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0],
+        ]
+    )
+    actual = encode_cuboid_data(values)
+    expected = [json.dumps(json.dumps(get_cuboid_data_dict(row), separators=(",", ":"))) for row in values.tolist()]
+    assert actual == expected
+
+
+def test_encode_annotation_detail():
+    attributes = {"object_motion": "Moving", "rider_status": "", "tracking_id": "abc"}
+    actual = encode_annotation_detail("abc", 'Car "A" 車', json.dumps("x"), attributes=attributes)
+    expected = {
+        "annotation_id": "abc",
+        "label": 'Car "A" 車',
+        "attributes": attributes,
+        "data": {"data": "x", "_type": "Unknown"},
+    }
+    assert actual == json.dumps(expected)
+
+    assert encode_annotation_detail("abc", "Car", json.dumps("x")) == json.dumps(
+        {"annotation_id": "abc", "label": "Car", "data": {"data": "x", "_type": "Unknown"}}
+    )
+
+
+def test_write_annotation_file(tmp_path):
+    details = [encode_annotation_detail(f"id{i}", "Car", json.dumps(f"data{i}")) for i in range(3)]
+    output_file = tmp_path / "001-0.json"
+
+    assert write_annotation_file(output_file, iter(details))
+    assert output_file.read_text(encoding="utf-8") == json.dumps({"details": [json.loads(e) for e in details]})
+    # 一時ファイルは残らない
+    assert [e.name for e in tmp_path.iterdir()] == ["001-0.json"]
+
+    assert not write_annotation_file(output_file, details, skip_if_unchanged=True)
+    assert write_annotation_file(output_file, details[:1], skip_if_unchanged=True)
+    assert write_annotation_file(output_file, [])
+    assert output_file.read_text(encoding="utf-8") == '{"details": []}'
@@ -0,0 +1,40 @@
+import zipfile
+
+import pytest
+
+from panda2anno.common.annotation_archive import AnnotationArchive
+
+
+def test_annotation_archive(tmp_path):
+    zip_file = tmp_path / "out" / "001.zip"
+    with AnnotationArchive(zip_file, compression="stored") as archive:
+        archive.write_chunks("001/001-0.json", ['{"details": ', "[]", "}"])
+        archive.write_chunks("001/001-0/a", iter(["あ"]))
+        assert archive.entry_count == 2
+
+    with zipfile.ZipFile(zip_file) as f:
+        assert f.namelist() == ["001/001-0.json", "001/001-0/a"]
+        assert f.read("001/001-0.json") == b'{"details": []}'
+        assert f.read("001/001-0/a").decode("utf-8") == "あ"
+        assert f.getinfo("001/001-0.json").compress_type == zipfile.ZIP_STORED
+
+    # 一時ファイルは残らない
+    assert [e.name for e in zip_file.parent.iterdir()] == ["001.zip"]
+
+
+def test_annotation_archive__invalid_compression(tmp_path):
+    with pytest.raises(ValueError):
+        AnnotationArchive(tmp_path / "001.zip", compression="lzma")
+
+
+def test_annotation_archive__error(tmp_path):
+    zip_file = tmp_path / "001.zip"
+    zip_file.write_bytes(b"old")
+    with pytest.raises(RuntimeError):
+        with AnnotationArchive(zip_file) as archive:
+            archive.write_chunks("001/001-0.json", ["{}"])
+            raise RuntimeError("error")
+
+    # 途中まで書き込んだzipファイルは出力せず、既存のファイルは変更しない
+    assert [e.name for e in tmp_path.iterdir()] == ["001.zip"]
+    assert zip_file.read_bytes() == b"old"
@@ -0,0 +1,71 @@
+import os
+import shutil
+from collections import Counter
+
+from pandaset import DataSet
+
+from panda2anno.common.dataset_index import (
+    create_sequence_index,
+    get_default_index_dir,
+    load_sequence_index,
+    load_up_to_date_sequence_index,
+    save_sequence_index,
+)
+from panda2anno.common.frame_reader import SequenceFrameReader
+
+os.chdir(os.path.dirname(os.path.abspath(__file__)) + "/../../")
+
+sequence_id = "001"
+
+
+def test_create_sequence_index(tmp_path):
+    dataset = DataSet("tests/resources/pandaset/")
+    sequence = dataset[sequence_id]
+    reader = SequenceFrameReader(sequence)
+
+    sequence_index, reused_frame_count = create_sequence_index(sequence, sequence_id)
+    assert reused_frame_count == 0
+    assert sequence_index.frame_count == 1
+    assert sequence_index.lidar_poses == reader.get_lidar_poses()
+    assert set(sequence_index.camera_names) == {"front_camera", "back_camera"}
+
+    frame = sequence_index.frames[0]
+    assert frame.cuboid_label_counts == dict(Counter(reader.read_cuboids(0)["label"]))
+    semseg_counter = Counter(reader.read_semseg(0)["class"])
+    assert frame.semseg_class_counts == {str(class_id): count for class_id, count in semseg_counter.items()}
+
+    save_sequence_index(tmp_path, sequence_index)
+    assert load_sequence_index(tmp_path, sequence_id) == sequence_index
+    assert load_sequence_index(tmp_path, "999") is None
+
+
+def test_incremental_update(tmp_path):
+    input_dir = tmp_path / "pandaset"
+    shutil.copytree(f"tests/resources/pandaset/{sequence_id}", input_dir / sequence_id)
+    index_dir = tmp_path / "index"
+
+    sequence = DataSet(str(input_dir))[sequence_id]
+    sequence_index, _ = create_sequence_index(sequence, sequence_id)
+    save_sequence_index(index_dir, sequence_index)
+    assert load_up_to_date_sequence_index(index_dir, sequence, sequence_id) == sequence_index
+
+    # ファイルが変わっていないフレームは、前回の集計結果を利用する
+    _, reused_frame_count = create_sequence_index(sequence, sequence_id, previous=sequence_index)
+    assert reused_frame_count == 1
+
+    # ファイルが変更されたら、インデックスを利用しない
+    cuboids_file = input_dir / sequence_id / "annotations/cuboids/00.pkl.gz"
+    os.utime(cuboids_file, ns=(0, 0))
+    assert load_up_to_date_sequence_index(index_dir, sequence, sequence_id) is None
+    _, reused_frame_count = create_sequence_index(sequence, sequence_id, previous=sequence_index)
+    assert reused_frame_count == 0
+
+
+def test_get_default_index_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    input_dir = tmp_path / "pandaset"
+    index_dir = get_default_index_dir(input_dir)
+    # pandasetのディレクトリには出力しない
+    assert index_dir.parent == tmp_path / "cache/panda2anno/index"
+    assert index_dir == get_default_index_dir(tmp_path / "pandaset/../pandaset")
+    assert index_dir != get_default_index_dir(tmp_path / "other/pandaset")
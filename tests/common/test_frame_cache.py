@@ -0,0 +1,89 @@
+import os
+
+import numpy
+import pandas
+
+from panda2anno.common.frame_cache import FRAME_CACHE_DIR_ENV, FrameCache, get_default_frame_cache
+
+
+def _create_source_file(path, df: pandas.DataFrame):
+    df.to_pickle(path)
+    return path
+
+
+def test_load_dataframe(tmp_path):
+    df = pandas.DataFrame(
+        {
+            "x": numpy.array([0.1, 0.2, 0.3], dtype=numpy.float32),
+            "yaw": [0.1, 0.2, 0.3],
+            "stationary": [True, False, True],
+            "d": numpy.array([0, 1, 0], dtype=numpy.int64),
+        },
+        index=pandas.Index([10, 11, 12], name="index"),
+    )
+    # pandasetのpickleと同じく、列名はobject型
+    df.columns = pandas.Index(list(df.columns), dtype=object)
+    source_file = _create_source_file(tmp_path / "00.pkl.gz", df)
+    cache = FrameCache(tmp_path / "cache", max_size=1024 * 1024)
+
+    first = cache.load_dataframe(source_file, pandas.read_pickle)
+    second = cache.load_dataframe(source_file, pandas.read_pickle)
+    assert (cache.miss_count, cache.hit_count) == (1, 1)
+    pandas.testing.assert_frame_equal(first, df)
+    pandas.testing.assert_frame_equal(second, df)
+    assert (cache._get_entry_dir(cache.get_key(source_file)) / "0.npy").exists()
+
+    # 元ファイルが更新されたら、キャッシュを使わない
+    df2 = df.iloc[[2, 0]]
+    _create_source_file(source_file, df2)
+    os.utime(source_file, ns=(0, 1))
+    pandas.testing.assert_frame_equal(cache.load_dataframe(source_file, pandas.read_pickle), df2)
+    pandas.testing.assert_frame_equal(cache.load_dataframe(source_file, pandas.read_pickle), df2)
+    assert (cache.miss_count, cache.hit_count) == (2, 2)
+
+
+def test_load_dataframe__not_numeric(tmp_path):
+    """pickleが必要な列を含むDataFrameは、キャッシュに保存しないことを確認する"""
+    cache = FrameCache(tmp_path / "cache", max_size=1024 * 1024)
+    df_list = [
+        pandas.DataFrame({"uuid": pandas.Series(["a", "b", None], dtype=object), "yaw": [0.1, 0.2, 0.3]}),
+        pandas.DataFrame({"label": pandas.Categorical(["Car", "Bus", "Car"])}),
+        pandas.DataFrame({"x": [0.1, 0.2]}, index=pandas.Index(["a", "b"], dtype=object)),
+    ]
+    for i, df in enumerate(df_list):
+        source_file = _create_source_file(tmp_path / f"{i:02d}.pkl.gz", df)
+        for _ in range(2):
+            pandas.testing.assert_frame_equal(cache.load_dataframe(source_file, pandas.read_pickle), df)
+
+    assert (cache.miss_count, cache.hit_count) == (6, 0)
+    assert cache._list_entries() == []
+
+
+def test_evict(tmp_path):
+    cache = FrameCache(tmp_path / "cache", max_size=30_000)
+    source_files = [
+        _create_source_file(tmp_path / f"{i:02d}.pkl.gz", pandas.DataFrame({"x": numpy.arange(1000, dtype=float)}))
+        for i in range(5)
+    ]
+    for i, source_file in enumerate(source_files):
+        cache.load_dataframe(source_file, pandas.read_pickle)
+        # 0番目のフレームは毎回利用する
+        os.utime(cache._get_entry_dir(cache.get_key(source_files[0])) / "meta.json", ns=(i * 10 + 5, i * 10 + 5))
+        if i > 0:
+            os.utime(cache._get_entry_dir(cache.get_key(source_file)) / "meta.json", ns=(i * 10, i * 10))
+
+    assert cache._get_total_size() <= 30_000
+    cached = [cache._get_entry_dir(cache.get_key(e)).exists() for e in source_files]
+    # 最後に利用した日時が新しいものが残る
+    assert cached[0] and cached[4]
+    assert not cached[1]
+
+
+def test_get_default_frame_cache(tmp_path, monkeypatch):
+    monkeypatch.delenv(FRAME_CACHE_DIR_ENV, raising=False)
+    assert get_default_frame_cache() is None
+
+    monkeypatch.setenv(FRAME_CACHE_DIR_ENV, str(tmp_path / "cache"))
+    cache = get_default_frame_cache()
+    assert cache is not None and cache.cache_dir == tmp_path / "cache"
+    assert get_default_frame_cache() is cache
@@ -0,0 +1,66 @@
+from pathlib import Path
+
+import numpy
+import pytest
+
+from panda2anno.common.frame_parallel import SharedArrays, map_frames
+
+
+def _sum_points(task: int, shared_arrays: SharedArrays) -> float:
+    with shared_arrays.open() as arrays:
+        if task == -1:
+            raise RuntimeError("error")
+        return float(arrays["points"].sum())
+
+
+def _load(item: int) -> tuple[int, SharedArrays]:
+    shared_arrays = SharedArrays()
+    shared_arrays.put("points", numpy.full((item + 1, 3), item, dtype=numpy.float32))
+    return item, shared_arrays
+
+
+def _get_shared_memory_names() -> set[str]:
+    shm_dir = Path("/dev/shm")
+    return {e.name for e in shm_dir.iterdir()} if shm_dir.exists() else set()
+
+
+def test_shared_arrays():
+    shared_arrays = SharedArrays()
+    shared_arrays.put("xyz", numpy.arange(12, dtype=numpy.float64).reshape(4, 3))
+    shared_arrays.put("empty", numpy.empty(0, dtype=numpy.int64))
+    try:
+        with shared_arrays.open() as arrays:
+            numpy.testing.assert_array_equal(arrays["xyz"], numpy.arange(12).reshape(4, 3))
+            assert arrays["empty"].shape == (0,)
+    finally:
+        shared_arrays.release()
+
+
+def test_map_frames():
+    before = _get_shared_memory_names()
+    items = list(range(20))
+    results = list(map_frames(_load, _sum_points, items, workers=3, max_pending=4))
+
+    # 処理の完了順ではなく、itemsの順番で返す
+    assert [task for task, _ in results] == items
+    assert [result for _, result in results] == [float(e * (e + 1) * 3) for e in items]
+    # 共有メモリはすべて解放されている
+    assert _get_shared_memory_names() == before
+
+
+def test_map_frames__error():
+    before = _get_shared_memory_names()
+    with pytest.raises(RuntimeError):
+        list(map_frames(_load, _sum_points, [0, 1, -1, 3, 4, 5], workers=2))
+    assert _get_shared_memory_names() == before
+
+
+def test_map_frames__many_frames():
+    """読み込み中のフレームより多いフレームを、max_pendingを指定せずに処理しても停止しないことを確認する"""
+    before = _get_shared_memory_names()
+    items = list(range(40))
+    results = list(map_frames(_load, _sum_points, items, workers=2))
+
+    assert [task for task, _ in results] == items
+    assert [result for _, result in results] == [float(e * (e + 1) * 3) for e in items]
+    assert _get_shared_memory_names() == before
@@ -0,0 +1,35 @@
+import os
+
+from pandaset import DataSet
+
+from panda2anno.common.frame_reader import SequenceFrameReader
+
+os.chdir(os.path.dirname(os.path.abspath(__file__)) + "/../../")
+
+dataset = DataSet("tests/resources/pandaset/")
+
+sequence_id = "001"
+sequence = dataset[sequence_id]
+
+
+def test_read_lidar():
+    reader = SequenceFrameReader(sequence)
+    assert reader.get_frame_count() == 1
+    assert len(reader.get_lidar_poses()) == 1
+
+    lidar_data = reader.read_lidar(0)
+    assert list(lidar_data.columns) == ["x", "y", "z", "i", "t", "d"]
+    # シーケンス全体は読み込まない
+    assert sequence.lidar.data is None
+
+
+def test_read_camera_image():
+    reader = SequenceFrameReader(sequence)
+    assert set(reader.get_camera_names()) == {"front_camera", "back_camera"}
+    assert reader.get_camera_image_path("front_camera", 0).name == "00.jpg"
+    with reader.read_camera_image("front_camera", 0) as image:
+        assert image.format == "JPEG"
+
+
+def teardown_module(moduloe):
+    dataset.unload(sequence_id)
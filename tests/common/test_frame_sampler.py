@@ -0,0 +1,93 @@
+import math
+import os
+from argparse import ArgumentParser
+
+import numpy
+import pytest
+from pandaset import DataSet
+
+from panda2anno.common.frame_reader import SequenceFrameReader
+from panda2anno.common.frame_sampler import FrameSampler, add_frame_sampler_arguments, create_frame_sampler_from_args
+from panda2anno.common.pose import PoseArray
+
+os.chdir(os.path.dirname(os.path.abspath(__file__)) + "/../../")
+
+dataset = DataSet("tests/resources/pandaset/")
+
+sequence_id = "001"
+sequence = dataset[sequence_id]
+
+
+def teardown_module(module):
+    dataset.unload(sequence_id)
+
+
+def create_poses(positions: list[float], yaws: list[float]) -> PoseArray:
+    """x軸方向に移動して、z軸周りに回転するposeを作成する"""
+    half_yaws = numpy.radians(yaws) / 2
+    wxyz = numpy.stack([numpy.cos(half_yaws), numpy.zeros(len(yaws)), numpy.zeros(len(yaws)), numpy.sin(half_yaws)], 1)
+    tvec = numpy.stack([positions, numpy.zeros(len(positions)), numpy.zeros(len(positions))], 1)
+    return PoseArray(wxyz, tvec)
+
+
+# 停車（0-4）、2mずつ移動（5-9）、その場で10°ずつ回転（10-12）
+poses = create_poses(
+    positions=[0.0] * 5 + [2.0, 4.0, 6.0, 8.0, 10.0] + [10.0] * 3,
+    yaws=[0.0] * 10 + [10.0, 20.0, 30.0],
+)
+
+
+def test_select_keyframes__threshold():
+    # 停車中のフレームは選ばず、移動中のフレームは多く選ぶ
+    assert FrameSampler(min_translation=3.0).select_keyframes(poses) == [0, 6, 8]
+    assert FrameSampler(min_rotation=15.0).select_keyframes(poses) == [0, 11]
+    assert FrameSampler(min_translation=3.0, min_rotation=15.0).select_keyframes(poses) == [0, 6, 8, 11]
+
+
+def test_select_keyframes__target_count():
+    sampler = FrameSampler(min_translation=2.0, min_rotation=10.0, target_count=4)
+    # 移動量の合計は8なので、移動量が2ずつになるフレームを選ぶ
+    assert sampler.select_keyframes(poses) == [0, 6, 8, 10]
+
+    # フレーム数より多い場合は、すべてのフレームを選ぶ
+    assert FrameSampler(target_count=100).select_keyframes(poses) == list(range(len(poses)))
+
+    # 移動していない場合は、フレームの間隔が等しくなるように選ぶ
+    parked_poses = create_poses(positions=[0.0] * 9, yaws=[0.0] * 9)
+    assert FrameSampler(target_count=3).select_keyframes(parked_poses) == [0, 3, 6]
+
+
+def test_get_motions():
+    sampler = FrameSampler(min_translation=2.0, min_rotation=90.0)
+    start = create_poses([0.0], [0.0])
+    end = create_poses([1.0, 0.0], [0.0, -45.0])
+    assert sampler.get_motions(start.wxyz[0], start.tvec[0], end.wxyz, end.tvec) == pytest.approx([0.5, 0.5])
+    # クォータニオンの符号が逆でも、同じ回転とみなす
+    assert sampler.get_motions(start.wxyz[0], start.tvec[0], -end.wxyz, end.tvec) == pytest.approx([0.5, 0.5])
+    assert math.isclose(FrameSampler().get_motions(start.wxyz, start.tvec, start.wxyz, start.tvec)[0], 0.0)
+
+
+def test_select_frames():
+    reader = SequenceFrameReader(sequence)
+    assert FrameSampler().select_frames(reader) == list(range(reader.get_frame_count()))
+    assert FrameSampler(min_translation=1.0).select_frames(reader) == [0]
+    assert FrameSampler(target_count=5).select_frames(reader) == [0]
+
+
+def test_frame_sampler__invalid_argument():
+    with pytest.raises(ValueError):
+        FrameSampler(sampling_step=0)
+    with pytest.raises(ValueError):
+        FrameSampler(sampling_step=2, min_translation=1.0)
+    with pytest.raises(ValueError):
+        FrameSampler(target_count=0)
+    with pytest.raises(ValueError):
+        FrameSampler(min_rotation=-1.0)
+
+
+def test_create_frame_sampler_from_args():
+    parser = ArgumentParser()
+    add_frame_sampler_arguments(parser)
+    assert create_frame_sampler_from_args(parser.parse_args([])) == FrameSampler()
+    args = parser.parse_args(["--min_translation", "2", "--target_frame_count", "10"])
+    assert create_frame_sampler_from_args(args) == FrameSampler(min_translation=2.0, target_count=10)
@@ -0,0 +1,154 @@
+import os
+
+from panda2anno.common.manifest import MANIFEST_FILENAME, MANIFEST_JOURNAL_FILENAME, ManifestRecorder
+
+
+def test_manifest_recorder(tmp_path):
+    sequence_dir = tmp_path / "pandaset/001"
+    input_file = sequence_dir / "lidar/00.pkl.gz"
+    input_file.parent.mkdir(parents=True)
+    input_file.write_bytes(b"input")
+
+    output_dir = tmp_path / "out/001"
+    output_dir.mkdir(parents=True)
+    output_file = output_dir / "001-0.json"
+
+    recorder = ManifestRecorder(output_dir, sequence_dir, parameters={"sampling_step": 1})
+    assert not recorder.is_frame_up_to_date("001-0", [input_file], parameters={})
+    output_file.write_text("{}")
+    recorder.record_frame("001-0", [input_file], [output_file], parameters={})
+    recorder.compact()
+    assert (output_dir / MANIFEST_FILENAME).exists()
+    assert not (output_dir / MANIFEST_JOURNAL_FILENAME).exists()
+
+    # sampling_stepが変わっても、同じフレームは再利用できる
+    recorder = ManifestRecorder(output_dir, sequence_dir, parameters={"sampling_step": 10})
+    assert recorder.is_frame_up_to_date("001-0", [input_file], parameters={})
+    assert not recorder.is_frame_up_to_date("001-0", [input_file], parameters={"camera_name_list": []})
+    assert recorder.skipped_frame_count == 1
+
+    # 入力ファイルが変更された
+    stat = input_file.stat()
+    os.utime(input_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    recorder = ManifestRecorder(output_dir, sequence_dir, parameters={"sampling_step": 1})
+    assert not recorder.is_frame_up_to_date("001-0", [input_file], parameters={})
+
+    # forceを指定した
+    recorder = ManifestRecorder(output_dir, sequence_dir, parameters={"sampling_step": 1}, force=True)
+    recorder.record_frame("001-0", [input_file], [output_file], parameters={})
+    assert not recorder.is_frame_up_to_date("001-0", [input_file], parameters={})
+
+
+def test_manifest_recorder__remove_previous_output_files(tmp_path):
+    sequence_dir = tmp_path / "pandaset/001"
+    input_file = sequence_dir / "annotations/semseg/00.pkl.gz"
+    input_file.parent.mkdir(parents=True)
+    input_file.write_bytes(b"input")
+
+    output_dir = tmp_path / "out/001"
+    old_segment_file = output_dir / "001-0/old"
+    new_segment_file = output_dir / "001-0/new"
+    old_segment_file.parent.mkdir(parents=True)
+    old_segment_file.write_text("{}")
+    new_segment_file.write_text("{}")
+
+    recorder = ManifestRecorder(output_dir, sequence_dir, parameters={})
+    recorder.record_frame("001-0", [input_file], [old_segment_file], parameters={})
+    recorder.record_frame("001-0", [input_file], [new_segment_file], parameters={})
+    assert not old_segment_file.exists()
+    assert new_segment_file.exists()
+
+
+def test_manifest_recorder__compact_removes_unselected_frames(tmp_path):
+    """変換するフレームの条件を変えて実行した場合に、前回だけ出力したフレームのファイルを削除することを確認する"""
+    sequence_dir = tmp_path / "pandaset/001"
+    output_dir = tmp_path / "out/001"
+    input_files = {}
+    output_files = {}
+    for index in range(3):
+        input_file = sequence_dir / f"annotations/semseg/{index:02d}.pkl.gz"
+        input_file.parent.mkdir(parents=True, exist_ok=True)
+        input_file.write_bytes(b"input")
+        output_file = output_dir / f"001-{index}/segment"
+        output_file.parent.mkdir(parents=True)
+        output_file.write_text("{}")
+        input_files[f"001-{index}"] = input_file
+        output_files[f"001-{index}"] = output_file
+
+    recorder = ManifestRecorder(output_dir, sequence_dir, parameters={"sampling_step": 1})
+    for frame_id, input_file in input_files.items():
+        recorder.record_frame(frame_id, [input_file], [output_files[frame_id]], parameters={})
+    recorder.compact(frame_ids=list(input_files))
+
+    recorder = ManifestRecorder(output_dir, sequence_dir, parameters={"sampling_step": 2})
+    assert recorder.is_frame_up_to_date("001-0", [input_files["001-0"]], parameters={})
+    recorder.compact(frame_ids=["001-0", "001-2"])
+    assert output_files["001-0"].exists()
+    assert output_files["001-2"].exists()
+    assert not output_files["001-1"].exists()
+    # 空になったディレクトリも削除する
+    assert not output_files["001-1"].parent.exists()
+
+    recorder = ManifestRecorder(output_dir, sequence_dir, parameters={"sampling_step": 2})
+    assert set(recorder.manifest.frames) == {"001-0", "001-2"}
+
+
+def test_manifest_recorder__output_file_changed(tmp_path):
+    sequence_dir = tmp_path / "pandaset/001"
+    input_file = sequence_dir / "lidar/00.pkl.gz"
+    input_file.parent.mkdir(parents=True)
+    input_file.write_bytes(b"input")
+    output_dir = tmp_path / "out/001"
+    output_dir.mkdir(parents=True)
+    output_file = output_dir / "001-0.json"
+    output_file.write_text("{}")
+
+    recorder = ManifestRecorder(output_dir, sequence_dir, parameters={})
+    recorder.record_frame("001-0", [input_file], [output_file], parameters={})
+    recorder.compact()
+
+    # サイズが同じでも、出力ファイルが書き換えられていれば変換し直す
+    stat = output_file.stat()
+    output_file.write_text("[]")
+    os.utime(output_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert not ManifestRecorder(output_dir, sequence_dir, parameters={}).is_frame_up_to_date(
+        "001-0", [input_file], parameters={}
+    )
+
+
+def test_manifest_recorder__journal(tmp_path):
+    sequence_dir = tmp_path / "pandaset/001"
+    input_file = sequence_dir / "lidar/00.pkl.gz"
+    input_file.parent.mkdir(parents=True)
+    input_file.write_bytes(b"input")
+    output_dir = tmp_path / "out/001"
+    output_dir.mkdir(parents=True)
+    output_files = [output_dir / f"001-{i}.json" for i in range(3)]
+    for output_file in output_files:
+        output_file.write_text("{}")
+
+    recorder = ManifestRecorder(output_dir, sequence_dir, parameters={})
+    recorder.record_frame("001-0", [input_file], [output_files[0]], parameters={})
+    recorder.compact()
+    # compactせずに異常終了した場合も、ジャーナルファイルに追記したフレームは再利用できる
+    recorder = ManifestRecorder(output_dir, sequence_dir, parameters={})
+    recorder.record_frame("001-1", [input_file], [output_files[1]], parameters={})
+    recorder.record_frame("001-2", [input_file], [output_files[2]], parameters={})
+    journal_file = output_dir / MANIFEST_JOURNAL_FILENAME
+    # 最後の行が途中までしか書き込まれなかった場合
+    journal_file.write_text(journal_file.read_text()[:-10])
+
+    recorder = ManifestRecorder(output_dir, sequence_dir, parameters={})
+    assert recorder.is_frame_up_to_date("001-0", [input_file], parameters={})
+    assert recorder.is_frame_up_to_date("001-1", [input_file], parameters={})
+    assert not recorder.is_frame_up_to_date("001-2", [input_file], parameters={})
+
+
+def test_manifest_recorder__old_version(tmp_path):
+    output_dir = tmp_path / "out/001"
+    output_dir.mkdir(parents=True)
+    (output_dir / MANIFEST_FILENAME).write_text(
+        '{"parameters": {}, "frames": {"001-0": {"parameters": {}, "inputs": {}, "outputs": {}}}, "version": "1"}'
+    )
+    recorder = ManifestRecorder(output_dir, tmp_path / "pandaset/001", parameters={})
+    assert not recorder.is_frame_up_to_date("001-0", [], parameters={})
@@ -0,0 +1,106 @@
+import os
+import zipfile
+from pathlib import Path
+
+import pandas
+import pytest
+from pandaset import DataSet
+
+from panda2anno.common.frame_reader import SequenceFrameReader
+from panda2anno.common.manifest import ManifestRecorder
+from panda2anno.common.pandaset_archive import ArchiveSequenceFrameReader, PandasetArchive, create_frame_reader
+
+os.chdir(os.path.dirname(os.path.abspath(__file__)) + "/../../")
+
+input_dir = Path("tests/resources/pandaset/")
+dataset = DataSet(str(input_dir))
+
+sequence_id = "001"
+sequence = dataset[sequence_id]
+
+
+def teardown_module(module):
+    dataset.unload(sequence_id)
+
+
+@pytest.fixture
+def archive(tmp_path):
+    # 配布用のzipファイルと同じく、シーケンスのディレクトリの上にディレクトリがある構成にする
+    zip_file = tmp_path / "pandaset.zip"
+    with zipfile.ZipFile(zip_file, mode="w") as f:
+        for path in sorted(input_dir.rglob("*")):
+            f.write(path, arcname=f"pandaset/{path.relative_to(input_dir).as_posix()}")
+    archive = PandasetArchive(zip_file)
+    yield archive
+    archive.close()
+
+
+def test_pandaset_archive(archive):
+    assert archive.sequences() == [sequence_id]
+    with pytest.raises(KeyError):
+        archive["002"]
+
+    reader = create_frame_reader(archive[sequence_id])
+    assert isinstance(reader, ArchiveSequenceFrameReader)
+    expected = SequenceFrameReader(sequence)
+
+    assert reader.get_frame_count() == expected.get_frame_count()
+    assert reader.get_lidar_poses() == expected.get_lidar_poses()
+    assert reader.get_lidar_timestamps() == expected.get_lidar_timestamps()
+    pandas.testing.assert_frame_equal(reader.read_lidar(0), expected.read_lidar(0))
+
+    assert reader.get_camera_names() == sorted(expected.get_camera_names())
+    assert reader.get_camera_poses("front_camera") == expected.get_camera_poses("front_camera")
+    assert vars(reader.get_camera_intrinsics("front_camera")) == vars(expected.get_camera_intrinsics("front_camera"))
+    assert (
+        reader.read_camera_image_bytes("front_camera", 0)
+        == expected.get_camera_image_path("front_camera", 0).read_bytes()
+    )
+    with reader.read_camera_image("front_camera", 0) as image:
+        assert image.size == (1920, 1080)
+
+    assert reader.has_cuboids() and reader.has_semseg()
+    pandas.testing.assert_frame_equal(reader.read_cuboids(0), expected.read_cuboids(0))
+    pandas.testing.assert_frame_equal(reader.read_semseg(0), expected.read_semseg(0))
+    assert reader.get_semseg_classes() == expected.get_semseg_classes()
+
+    # 入力ファイルのパスは、シーケンスのディレクトリからの相対パスが同じになる
+    assert reader.get_lidar_file_path(0).relative_to(reader.get_sequence_dir()) == expected.get_lidar_file_path(
+        0
+    ).relative_to(expected.get_sequence_dir())
+
+
+def test_pandaset_archive__cache(tmp_path, archive):
+    reader = create_frame_reader(archive[sequence_id])
+    lidar_size = len(archive.read_bytes(archive.get_name(reader.get_lidar_file_path(0))))
+    assert (archive.hit_count, archive.miss_count) == (0, 1)
+    reader.read_lidar(0)
+    assert (archive.hit_count, archive.miss_count) == (1, 1)
+
+    # キャッシュのサイズを超えたら、最も古いファイルから削除する
+    small_archive = PandasetArchive(archive.zip_file, cache_size=lidar_size)
+    small_reader = create_frame_reader(small_archive[sequence_id])
+    small_reader.read_lidar(0)
+    small_reader.read_semseg(0)
+    small_reader.read_lidar(0)
+    assert (small_archive.hit_count, small_archive.miss_count) == (0, 3)
+    small_archive.close()
+
+
+def test_pandaset_archive__manifest(tmp_path, archive):
+    reader = create_frame_reader(archive[sequence_id])
+    input_files = [reader.get_lidar_file_path(0), reader.get_lidar_poses_file_path()]
+    output_file = tmp_path / "out" / "001-0.bin"
+    output_file.parent.mkdir()
+    output_file.write_bytes(b"0")
+
+    def create_manifest() -> ManifestRecorder:
+        return ManifestRecorder(
+            output_file.parent,
+            reader.get_sequence_dir(),
+            parameters={},
+            get_input_fingerprint=reader.get_input_fingerprint,
+        )
+
+    create_manifest().record_frame("001-0", input_files, [output_file], parameters={})
+    assert create_manifest().is_frame_up_to_date("001-0", input_files, parameters={})
@@ -0,0 +1,62 @@
+import os
+import zipfile
+from pathlib import Path
+
+from panda2anno.common.parallel import process_sequences
+from panda2anno.convert_cuboid_to_annofab_annotation import Cuboid2Annofab
+
+os.chdir(os.path.dirname(os.path.abspath(__file__)) + "/../../")
+
+input_dir = Path("tests/resources/pandaset/")
+output_dir = Path("tests/out/parallel")
+
+
+def test_process_sequences():
+    main_obj = Cuboid2Annofab()
+    failed_sequence_id_list = process_sequences(
+        main_obj.write_cuboid_annotations,
+        input_dir=input_dir,
+        output_dir=output_dir,
+        sequence_id_list=["001", "not_exists"],
+        process_name="test",
+        workers=2,
+    )
+    assert failed_sequence_id_list == ["not_exists"]
+    assert (output_dir / "001/001-0.json").exists()
+
+
+def test_process_sequences__zip_file(tmp_path):
+    zip_file = tmp_path / "pandaset.zip"
+    with zipfile.ZipFile(zip_file, mode="w") as f:
+        for path in sorted(input_dir.rglob("*")):
+            f.write(path, arcname=path.relative_to(input_dir).as_posix())
+
+    main_obj = Cuboid2Annofab()
+    for name, sequence_input in [("directory", input_dir), ("zip", zip_file)]:
+        failed_sequence_id_list = process_sequences(
+            main_obj.write_cuboid_annotations,
+            input_dir=sequence_input,
+            output_dir=tmp_path / name,
+            sequence_id_list=["001"],
+            process_name="test",
+        )
+        assert failed_sequence_id_list == []
+
+    assert (tmp_path / "zip/001/001-0.json").read_bytes() == (tmp_path / "directory/001/001-0.json").read_bytes()
+
+
+def record_output_dir(sequence, output_dir: Path, sequence_id: str) -> None:
+    (output_dir / f"{sequence_id}.txt").write_text(sequence_id)
+
+
+def test_process_sequences__output_dir_per_sequence(tmp_path):
+    failed_sequence_id_list = process_sequences(
+        record_output_dir,
+        input_dir=input_dir,
+        output_dir=tmp_path,
+        sequence_id_list=["001"],
+        process_name="test",
+        output_dir_per_sequence=False,
+    )
+    assert failed_sequence_id_list == []
+    assert (tmp_path / "001.txt").read_text() == "001"
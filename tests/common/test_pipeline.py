@@ -0,0 +1,88 @@
+import threading
+import time
+
+import pytest
+
+from panda2anno.common.pipeline import (
+    Pipeline,
+    PipelineConfig,
+    PipelineStage,
+    format_stage_reports,
+    parse_stage_workers,
+)
+
+
+def test_run():
+    results = []
+    lock = threading.Lock()
+
+    def write(item):
+        with lock:
+            results.append(item)
+
+    stages = [
+        PipelineStage("double", lambda x: x * 2, workers=3),
+        # Noneを返した要素は次のステージに渡さない
+        PipelineStage("filter", lambda x: x if x % 4 == 0 else None),
+        PipelineStage("write", write, workers=2),
+    ]
+    reports = Pipeline(stages, queue_size=2).run(range(100))
+    assert sorted(results) == [x * 2 for x in range(100) if x * 2 % 4 == 0]
+    assert [(e.name, e.item_count) for e in reports] == [("double", 100), ("filter", 100), ("write", 50)]
+    assert all(0 <= e.utilization <= 1 for e in reports)
+    assert "ボトルネック" in format_stage_reports(reports)
+
+
+def test_run__backpressure():
+    """後段のステージが遅い場合、前段のステージは上限を超えて要素を読み込まない"""
+    loaded_count = 0
+    written_count = 0
+    max_in_flight = 0
+    lock = threading.Lock()
+
+    def load(item):
+        nonlocal loaded_count, max_in_flight
+        with lock:
+            loaded_count += 1
+            max_in_flight = max(max_in_flight, loaded_count - written_count)
+        return item
+
+    def write(item):
+        nonlocal written_count
+        time.sleep(0.005)
+        with lock:
+            written_count += 1
+
+    queue_size = 2
+    reports = Pipeline([PipelineStage("load", load), PipelineStage("write", write)], queue_size=queue_size).run(
+        range(30)
+    )
+    # キューに入っている要素、writeステージが処理中の要素、loadステージがキューに入れようとしている要素
+    assert max_in_flight <= queue_size + 2
+    assert reports[0].output_wait_seconds > 0
+
+
+def test_run__error():
+    def fail(item):
+        if item == 5:
+            raise RuntimeError("error")
+        return item
+
+    stages = [PipelineStage("fail", fail), PipelineStage("noop", lambda x: x, workers=2)]
+    with pytest.raises(RuntimeError):
+        Pipeline(stages, queue_size=1).run(range(1000))
+
+
+def test_pipeline_config():
+    config = PipelineConfig(stage_workers=parse_stage_workers(["load=2", "write=3"]), process_stages=["transform"])
+    config.validate(["load", "transform", "write"], process_stage_names=["transform"])
+    assert config.create_stage("load", str).workers == 2
+    assert config.create_stage("transform", str).use_process
+    assert config.create_stage("other", str).workers == 1
+
+    with pytest.raises(ValueError):
+        config.validate(["load", "transform"], process_stage_names=["transform"])
+    with pytest.raises(ValueError):
+        config.validate(["load", "transform", "write"], process_stage_names=[])
+    with pytest.raises(ValueError):
+        parse_stage_workers(["load"])
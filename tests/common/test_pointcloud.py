@@ -0,0 +1,76 @@
+import numpy
+
+from panda2anno.common import pointcloud
+from panda2anno.common.pointcloud import PointCloudFilter, transform_and_pack_points, voxel_downsample
+from panda2anno.common.pose import Pose
+
+pandaset_pose = {
+    "position": {"x": 2.5866664556528294, "y": 2.466240979290467, "z": 1.8213244045644146},
+    "heading": {"w": 0.6554122851680118, "x": -0.650630103896342, "y": 0.27605590080108616, "z": -0.26628620690449},
+}
+
+
+def test_transform_and_pack_points():
+    rng = numpy.random.default_rng(0)
+    xyz = rng.uniform(-100, 100, size=(1000, 3))
+    intensity = rng.uniform(0, 255, size=1000)
+    pose = Pose.from_pandaset_pose(pandaset_pose).inverse()
+
+    actual = transform_and_pack_points(xyz, intensity, pose)
+
+    # 座標変換してから強度を結合する従来の方法
+    expected = numpy.hstack((pose * xyz, intensity[:, numpy.newaxis])).astype(numpy.float32)
+    assert actual.dtype == numpy.float32
+    assert actual.shape == (1000, 4)
+    numpy.testing.assert_array_equal(actual, expected)
+
+
+def test_transform_and_pack_points__large_translation(monkeypatch):
+    """原点から離れた位置でも、float64で変換してからfloat32にする従来の方法と一致することを確認する"""
+    # 複数のチャンクに分けて計算する場合も確認する
+    monkeypatch.setattr(pointcloud, "_TRANSFORM_CHUNK_SIZE", 300)
+    rng = numpy.random.default_rng(0)
+    offset = numpy.array([2000.0, -1500.0, 30.0])
+    xyz = offset + rng.uniform(-100, 100, size=(1000, 3))
+    intensity = rng.uniform(0, 255, size=1000)
+    pose = Pose(wxyz=Pose.from_pandaset_pose(pandaset_pose).wxyz, tvec=offset).inverse()
+
+    actual = transform_and_pack_points(xyz, intensity, pose)
+
+    expected = numpy.hstack((pose * xyz, intensity[:, numpy.newaxis])).astype(numpy.float32)
+    numpy.testing.assert_array_equal(actual, expected)
+
+
+def test_voxel_downsample():
+    points = numpy.array(
+        [
+            [0.01, 0.01, 0.01],
+            [0.02, 0.03, 0.04],  # 1個目と同じボクセル
+            [0.11, 0.01, 0.01],
+            [-0.01, 0.01, 0.01],
+        ]
+    )
+    assert list(voxel_downsample(points, voxel_size=0.1)) == [0, 2, 3]
+
+
+def test_point_cloud_filter():
+    points = numpy.array(
+        [
+            [1.0, 0.0, 0.0, 10],
+            [50.0, 0.0, 0.0, 20],  # max_rangeより遠い
+            [0.5, 0.0, 0.0, 30],  # min_rangeより近い
+            [1.0, 1.0, 5.0, 40],  # max_zより高い
+        ],
+        dtype=numpy.float32,
+    )
+    point_cloud_filter = PointCloudFilter(min_range=0.8, max_range=40, max_z=3)
+    actual = point_cloud_filter.apply(points)
+    assert actual[:, 3].tolist() == [10]
+
+    point_cloud_filter = PointCloudFilter(crop_box=(0, -1, -1, 2, 1, 1))
+    assert point_cloud_filter.apply(points)[:, 3].tolist() == [10, 30]
+
+    sensor_mask = PointCloudFilter(sensor_id=1).get_sensor_mask(numpy.array([0, 1, 1]))
+    assert sensor_mask is not None
+    assert sensor_mask.tolist() == [False, True, True]
+    assert PointCloudFilter().get_region_mask(points) is None
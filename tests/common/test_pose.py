@@ -1,4 +1,9 @@
-from panda2anno.common.pose import Pose
+import pickle
+
+import numpy
+import pytest
+
+from panda2anno.common.pose import Pose, PoseArray
 
 from pytest import approx
 
@@ -30,3 +35,87 @@ def test_inverse():
 
     assert list(unit_pose.quat) == approx([1, 0, 0, 0])
     assert unit_pose.tvec == approx([0, 0, 0])
+
+
+def test_cached_values():
+    pose = Pose.from_pandaset_pose(pandaset_pose)
+
+    assert pose.inverse() is pose.inverse()
+    assert pose.yaw == approx(pose.rotation.yaw_pitch_roll[0])
+    numpy.testing.assert_allclose(pose.rotation_matrix, pose.quat.rotation_matrix, atol=1e-15)
+
+    with pytest.raises(AttributeError):
+        setattr(pose, "tvec", numpy.array([1.0, 2.0, 3.0]))
+
+    # 行列は書き込めるコピーを返すので、変更してもPoseには影響しない
+    expected_matrix = pose.matrix
+    matrix = pose.matrix
+    matrix[0, 0] = 2
+    rotation_matrix = pose.rotation_matrix
+    rotation_matrix[0, 0] = 2
+    numpy.testing.assert_array_equal(pose.matrix, expected_matrix)
+    numpy.testing.assert_array_equal(pose.rotation_matrix, expected_matrix[:3, :3])
+
+
+def test_pickle():
+    pose = Pose.from_pandaset_pose(pandaset_pose)
+    assert pickle.loads(pickle.dumps(pose)) == pose
+
+
+def _create_random_poses(count: int) -> list[Pose]:
+    rng = numpy.random.default_rng(0)
+    wxyz = rng.normal(size=(count, 4))
+    wxyz /= numpy.linalg.norm(wxyz, axis=1, keepdims=True)
+    tvec = rng.uniform(-100, 100, size=(count, 3))
+    return [Pose(wxyz=q, tvec=t) for q, t in zip(wxyz, tvec)]
+
+
+def test_pose_array():
+    poses = _create_random_poses(10)
+    other_poses = _create_random_poses(10)[::-1]
+    pose_array = PoseArray.from_poses(poses)
+    other_pose_array = PoseArray.from_poses(other_poses)
+
+    assert len(pose_array) == 10
+    assert pose_array[3] == poses[3]
+    assert len(pose_array[[0, 2, 4]]) == 3
+
+    # 行列、逆変換、合成は、Poseで1個ずつ計算した結果と完全に一致する
+    numpy.testing.assert_array_equal(pose_array.matrices, [pose.matrix for pose in poses])
+    numpy.testing.assert_array_equal(pose_array.yaw, [pose.yaw for pose in poses])
+    numpy.testing.assert_allclose(pose_array.yaw, [pose.rotation.yaw_pitch_roll[0] for pose in poses], atol=1e-12)
+
+    inverse = pose_array.inverse()
+    numpy.testing.assert_array_equal(inverse.matrices, [pose.inverse().matrix for pose in poses])
+
+    composed = pose_array.inverse() * other_pose_array
+    expected = [pose.inverse() * other for pose, other in zip(poses, other_poses)]
+    numpy.testing.assert_array_equal(composed.matrices, [pose.matrix for pose in expected])
+
+    # Poseとの合成
+    numpy.testing.assert_array_equal(
+        (poses[0] * other_pose_array).matrices, [(poses[0] * other).matrix for other in other_poses]
+    )
+    numpy.testing.assert_array_equal(
+        (pose_array * other_poses[0]).matrices, [(pose * other_poses[0]).matrix for pose in poses]
+    )
+
+
+def test_pose_array__transform_points():
+    poses = _create_random_poses(3)
+    pose_array = PoseArray.from_poses(poses)
+    points = numpy.arange(3 * 5 * 3, dtype=numpy.float64).reshape(3, 5, 3)
+
+    numpy.testing.assert_allclose(
+        pose_array.transform_points(points), [pose * p for pose, p in zip(poses, points)], atol=1e-10
+    )
+    numpy.testing.assert_allclose(
+        pose_array.transform_points(points[:, 0, :]),
+        [(pose * p)[0] for pose, p in zip(poses, points[:, :1, :])],
+        atol=1e-10,
+    )
+
+
+def test_pose_array__from_pandaset_poses():
+    pose_array = PoseArray.from_pandaset_poses([pandaset_pose, pandaset_pose])
+    assert pose_array[1] == Pose.from_pandaset_pose(pandaset_pose)
@@ -0,0 +1,174 @@
+import os
+import threading
+import time
+from argparse import ArgumentParser
+from concurrent.futures import wait
+from pathlib import Path
+from typing import Optional
+
+import pandas
+import pytest
+from pandaset import DataSet
+
+from panda2anno.common.frame_cache import FrameCache
+from panda2anno.common.frame_reader import SequenceFrameReader
+from panda2anno.common.prefetch import (
+    FilePrefetcher,
+    PrefetchConfig,
+    add_prefetch_arguments,
+    create_prefetch_config_from_args,
+    prefetch_frames,
+)
+
+os.chdir(os.path.dirname(os.path.abspath(__file__)) + "/../../")
+
+dataset = DataSet("tests/resources/pandaset/")
+
+sequence_id = "001"
+sequence = dataset[sequence_id]
+
+
+def teardown_module(module):
+    dataset.unload(sequence_id)
+
+
+class SlowFileReader:
+    """NFSを想定して、読み込みに時間がかかるようにしたファイルの読み込み"""
+
+    def __init__(self, latency: float = 0.0, gate: Optional[threading.Event] = None) -> None:
+        self.latency = latency
+        self.gate = gate
+        self.read_paths: list[Path] = []
+        self._lock = threading.Lock()
+
+    def __call__(self, path: Path) -> bytes:
+        if self.gate is not None:
+            self.gate.wait()
+        time.sleep(self.latency)
+        with self._lock:
+            self.read_paths.append(path)
+        return path.read_bytes()
+
+
+def create_files(tmp_path: Path, count: int, size: int = 100) -> list[Path]:
+    result = []
+    for index in range(count):
+        path = tmp_path / f"{index:02d}.pkl.gz"
+        path.write_bytes(bytes([index]) * size)
+        result.append(path)
+    return result
+
+
+def test_file_prefetcher(tmp_path):
+    files = create_files(tmp_path, 5)
+    read_file = SlowFileReader(latency=0.2)
+    prefetcher = FilePrefetcher([[e] for e in files[:4]], max_frames=1, read_file=read_file)
+
+    # 最初のフレームは読み込み中なので待つ
+    assert prefetcher.read_bytes(files[0]) == files[0].read_bytes()
+    assert (prefetcher.stats.hit_count, prefetcher.stats.stall_count) == (0, 1)
+    assert prefetcher.stats.stall_seconds > 0
+
+    # 処理中に読み込みが終わったフレームは待たない
+    time.sleep(0.5)
+    assert prefetcher.read_bytes(files[1]) == files[1].read_bytes()
+    assert (prefetcher.stats.hit_count, prefetcher.stats.stall_count) == (1, 1)
+
+    # 先読みの対象でないファイルは、その場で読み込む
+    assert not prefetcher.is_target(files[4])
+    assert prefetcher.read_bytes(files[4]) == files[4].read_bytes()
+    assert prefetcher.stats.miss_count == 1
+
+    # 後のフレームのファイルを取得したら、取得されなかったフレームのファイルは破棄する
+    assert prefetcher.read_bytes(files[3]) == files[3].read_bytes()
+    assert prefetcher.stats.hit_count + prefetcher.stats.stall_count == 3
+    assert prefetcher.stats.dropped_count == 1
+    prefetcher.close()
+
+
+def test_file_prefetcher__only_listed_frames(tmp_path):
+    """`sampling_step`で選ばれたフレームのファイルだけを読み込むことを確認する"""
+    files = create_files(tmp_path, 6)
+    read_file = SlowFileReader()
+    sampled_files = files[::2]
+    prefetcher = FilePrefetcher([[e] for e in sampled_files], max_frames=2, read_file=read_file)
+    for path in sampled_files:
+        assert prefetcher.read_bytes(path) == path.read_bytes()
+    prefetcher.close()
+
+    assert sorted(read_file.read_paths) == sampled_files
+    assert prefetcher.stats.miss_count == 0
+    assert prefetcher.stats.dropped_count == 0
+
+
+def test_file_prefetcher__max_bytes(tmp_path):
+    files = create_files(tmp_path, 5, size=100)
+    gate = threading.Event()
+    read_file = SlowFileReader(gate=gate)
+    prefetcher = FilePrefetcher([[e] for e in files], max_frames=3, max_bytes=150, read_file=read_file)
+    # 読み込みが終わっていないファイルのサイズも上限に含める
+    assert list(prefetcher._futures) == files[:2]
+    gate.set()
+    wait(list(prefetcher._futures.values()))
+    assert len(read_file.read_paths) == 2
+
+    # 取得されていないファイルの合計サイズが上限以上なので、先読みしない
+    prefetcher.read_bytes(files[0])
+    assert list(prefetcher._futures) == files[1:3]
+
+    prefetcher.read_bytes(files[1])
+    assert list(prefetcher._futures) == files[2:4]
+    prefetcher.close()
+
+
+def test_file_prefetcher__invalid_argument():
+    with pytest.raises(ValueError):
+        FilePrefetcher([], max_frames=0)
+
+
+class LidarTarget:
+    def __init__(self, reader: SequenceFrameReader) -> None:
+        self.reader = reader
+
+    def get_prefetch_files(self, index: int) -> list[Path]:
+        return [self.reader.get_lidar_file_path(index)]
+
+
+def test_prefetch_frames():
+    reader = SequenceFrameReader(sequence, frame_cache=None)
+    expected = reader.read_lidar(0)
+
+    with prefetch_frames(reader, [0], [LidarTarget(reader)], PrefetchConfig()) as prefetcher:
+        assert prefetcher is not None
+        pandas.testing.assert_frame_equal(reader.read_lidar(0), expected)
+        # 先読みの対象でないファイルは、これまでどおり読み込む
+        pandas.testing.assert_frame_equal(reader.read_semseg(0), SequenceFrameReader(sequence).read_semseg(0))
+
+    assert reader.prefetcher is None
+    assert prefetcher.stats.hit_count + prefetcher.stats.stall_count == 1
+    assert prefetcher.stats.miss_count == 0
+
+    with prefetch_frames(reader, [0], [LidarTarget(reader)], None) as prefetcher:
+        assert prefetcher is None
+
+
+def test_prefetch_frames__frame_cache(tmp_path):
+    reader = SequenceFrameReader(sequence, frame_cache=FrameCache(tmp_path, max_size=1024 * 1024 * 1024))
+    assert not reader.is_frame_cached(reader.get_lidar_file_path(0))
+    reader.read_lidar(0)
+    assert reader.is_frame_cached(reader.get_lidar_file_path(0))
+    expected = reader.read_lidar(0)
+
+    # フレームキャッシュに保存されているファイルは先読みしない
+    with prefetch_frames(reader, [0], [LidarTarget(reader)], PrefetchConfig()) as prefetcher:
+        assert prefetcher is not None
+        assert not prefetcher.is_target(reader.get_lidar_file_path(0))
+        pandas.testing.assert_frame_equal(reader.read_lidar(0), expected)
+
+
+def test_create_prefetch_config_from_args():
+    parser = ArgumentParser()
+    add_prefetch_arguments(parser, exclusive_options=["--frame_workers"])
+    assert create_prefetch_config_from_args(parser.parse_args([])) is None
+    args = parser.parse_args(["--prefetch_frames", "3", "--prefetch_max_mb", "64"])
+    assert create_prefetch_config_from_args(args) == PrefetchConfig(frames=3, max_mb=64)
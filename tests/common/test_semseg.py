@@ -0,0 +1,54 @@
+import json
+
+import numpy
+import pandas
+import pytest
+from annofab_3dpc.annotation import SegmentData
+
+from panda2anno.common.semseg import group_point_indices_by_class, write_segment_file
+
+
+def test_group_point_indices_by_class():
+    rng = numpy.random.default_rng(0)
+    class_ids = rng.integers(0, 40, size=1000)
+    semseg_data = pandas.DataFrame({"class": class_ids}, index=numpy.arange(1000) + 5)
+
+    actual = group_point_indices_by_class(semseg_data["class"].to_numpy(), semseg_data.index.to_numpy())
+
+    expected_class_ids = list(semseg_data["class"].unique())
+    assert [class_id for class_id, _ in actual] == expected_class_ids
+    for class_id, point_indices in actual:
+        assert list(point_indices) == list(semseg_data[semseg_data["class"] == class_id].index)
+
+
+def test_group_point_indices_by_class__default_point_indices():
+    actual = group_point_indices_by_class(numpy.array([3, 1, 3, 2, 1]))
+    assert [(class_id, list(point_indices)) for class_id, point_indices in actual] == [
+        (3, [0, 2]),
+        (1, [1, 4]),
+        (2, [3]),
+    ]
+    assert group_point_indices_by_class(numpy.array([], dtype=numpy.int64)) == []
+
+
+def test_write_segment_file(tmp_path):
+    output_file = tmp_path / "segment"
+    write_segment_file(numpy.array([1, 5, 7]), output_file)
+    assert output_file.read_text() == SegmentData([1, 5, 7]).to_json()
+    assert json.loads(output_file.read_text())["points"] == [1, 5, 7]
+
+
+@pytest.mark.parametrize("point_count", [0, 1, 65536, 65537, 200000])
+def test_write_segment_file__same_as_segment_data(tmp_path, point_count):
+    point_indices = numpy.arange(point_count, dtype=numpy.int64) * 3
+    output_file = tmp_path / "segment"
+    write_segment_file(point_indices, output_file)
+    assert output_file.read_text() == SegmentData(point_indices.tolist()).to_json()
+
+
+def test_write_segment_file__skip_if_unchanged(tmp_path):
+    output_file = tmp_path / "segment"
+    assert write_segment_file(numpy.array([1, 5, 7]), output_file, skip_if_unchanged=True)
+    assert not write_segment_file(numpy.array([1, 5, 7]), output_file, skip_if_unchanged=True)
+    assert write_segment_file(numpy.array([1, 5]), output_file, skip_if_unchanged=True)
+    assert output_file.read_text() == SegmentData([1, 5]).to_json()
@@ -0,0 +1,38 @@
+from panda2anno.common.utils import copy_file, is_file_content_equal
+
+
+def test_copy_file(tmp_path):
+    src = tmp_path / "src.jpg"
+    src.write_bytes(b"\xff\xd8\xff" + bytes(range(256)) * 100)
+    dst = tmp_path / "dst.jpg"
+
+    copy_file(src, dst)
+    assert dst.read_bytes() == src.read_bytes()
+    assert dst.stat().st_ino != src.stat().st_ino
+
+
+def test_copy_file__hardlink(tmp_path):
+    src = tmp_path / "src.jpg"
+    src.write_bytes(b"foo")
+    dst = tmp_path / "dst.jpg"
+
+    copy_file(src, dst, hardlink=True)
+    assert dst.stat().st_ino == src.stat().st_ino
+
+    # ハードリンクで出力したファイルをコピーで上書きしても、コピー元は変わらない
+    other = tmp_path / "other.jpg"
+    other.write_bytes(b"bar")
+    copy_file(other, dst)
+    assert dst.read_bytes() == b"bar"
+    assert src.read_bytes() == b"foo"
+
+
+def test_is_file_content_equal(tmp_path):
+    path = tmp_path / "foo.txt"
+    assert not is_file_content_equal(path, [b"foo"])
+
+    path.write_bytes(b"foobar")
+    assert is_file_content_equal(path, [b"foo", b"bar"])
+    assert not is_file_content_equal(path, [b"foo"])
+    assert not is_file_content_equal(path, [b"foo", b"baz"])
+    assert not is_file_content_equal(path, [b"foo", b"bar", b"!"])
@@ -0,0 +1,70 @@
+import filecmp
+import os
+
+import pytest
+from pandaset import DataSet
+
+from panda2anno.common.frame_sampler import FrameSampler
+from panda2anno.common.manifest import MANIFEST_FILENAME
+from panda2anno.convert_all import PandasetConverter
+from panda2anno.convert_cuboid_to_annofab_annotation import Cuboid2Annofab
+from panda2anno.convert_data_to_kitti import Pandaset2Kitti
+from panda2anno.convert_semseg_to_annofab_annotation import Semseg2Annofab
+
+os.chdir(os.path.dirname(os.path.abspath(__file__)) + "/../")
+
+dataset = DataSet("tests/resources/pandaset/")
+
+sequence_id = "001"
+sequence = dataset[sequence_id]
+
+
+def _assert_same_directory(dir1, dir2):
+    comparison = filecmp.dircmp(dir1, dir2)
+    assert comparison.left_only == [] and comparison.right_only == []
+    # マニフェストには出力ファイルの更新日時を記録するので、内容は比較しない
+    common_files = [e for e in comparison.common_files if e != MANIFEST_FILENAME]
+    _, mismatch, errors = filecmp.cmpfiles(dir1, dir2, common_files, shallow=False)
+    assert mismatch == [] and errors == []
+    for subdir in comparison.common_dirs:
+        _assert_same_directory(dir1 / subdir, dir2 / subdir)
+
+
+def test_write_sequence(tmp_path):
+    pandaset2kitti = Pandaset2Kitti()
+    cuboid2annofab = Cuboid2Annofab()
+    semseg2annofab = Semseg2Annofab()
+    main_obj = PandasetConverter(
+        pandaset2kitti=pandaset2kitti, cuboid2annofab=cuboid2annofab, semseg2annofab=semseg2annofab
+    )
+    main_obj.write_sequence(sequence, output_dir=tmp_path / "all", sequence_id=sequence_id)
+
+    # 個別のコマンドと同じファイルを出力する
+    separate_dir = tmp_path / "separate"
+    pandaset2kitti.write_kitti_scene(sequence, output_dir=separate_dir / "kitti" / sequence_id, sequence_id=sequence_id)
+    cuboid2annofab.write_cuboid_annotations(
+        sequence, output_dir=separate_dir / "cuboids" / sequence_id, sequence_id=sequence_id
+    )
+    semseg2annofab.write_semseg_annotations(
+        sequence, output_dir=separate_dir / "semseg" / sequence_id, sequence_id=sequence_id
+    )
+    _assert_same_directory(tmp_path / "all", separate_dir)
+
+
+def test_pandaset_converter__frame_sampler():
+    frame_sampler = FrameSampler(min_translation=1.0)
+    main_obj = PandasetConverter(
+        pandaset2kitti=Pandaset2Kitti(frame_sampler=frame_sampler),
+        cuboid2annofab=Cuboid2Annofab(frame_sampler=frame_sampler),
+    )
+    assert main_obj.frame_sampler == frame_sampler
+
+    # 出力ごとにフレームが異なると、id_listが一致しなくなる
+    with pytest.raises(ValueError):
+        PandasetConverter(
+            pandaset2kitti=Pandaset2Kitti(frame_sampler=frame_sampler), cuboid2annofab=Cuboid2Annofab(sampling_step=2)
+        )
+
+
+def teardown_module(moduloe):
+    dataset.unload(sequence_id)
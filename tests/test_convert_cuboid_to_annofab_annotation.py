@@ -1,7 +1,30 @@
-from panda2anno.convert_cuboid_to_annofab_annotation import Cuboid2Annofab
-from pandaset import DataSet
+import json
+import math
 import os
+import sys
+import zipfile
 from pathlib import Path
+from typing import Any, Hashable, Mapping
+
+import numpy
+import pandas
+import pytest
+from annofab_3dpc.annotation import (
+    CuboidAnnotationDetailDataV2,
+    CuboidDirection,
+    CuboidShapeV2,
+    EulerAnglesZXY,
+    Location,
+    Size,
+    Vector3,
+)
+from pandaset import DataSet
+from pyquaternion import Quaternion
+
+from panda2anno.common.frame_reader import SequenceFrameReader
+from panda2anno.common.frame_sampler import FrameSampler
+from panda2anno.common.pose import Pose
+from panda2anno.convert_cuboid_to_annofab_annotation import Cuboid2Annofab, main
 
 os.chdir(os.path.dirname(os.path.abspath(__file__)) + "/../")
 
@@ -22,3 +45,121 @@ def test_main():
 
 def teardown_module(moduloe):
     dataset.unload(sequence_id)
+
+
+def get_expected_annotation_detail(cuboid: Mapping[Hashable, Any], lidar_pose: Pose) -> dict[str, Any]:
+    """
+    1個のcuboidに対応するAnnofabのアノテーションを、annofab_3dpcのクラスとpyquaternionで1個ずつ計算します。
+    位置と向きの計算結果を確認するためのもので、label、属性は`Cuboid2Annofab`と同じ方法で設定します。
+    """
+    inverse_lidar_pose = lidar_pose.inverse()
+    position = inverse_lidar_pose * numpy.array([[cuboid["position.x"], cuboid["position.y"], cuboid["position.z"]]])
+    # pandasetのyawはY軸に対するyawなので、math.pi/2を加える
+    rotation = EulerAnglesZXY(0, 0, inverse_lidar_pose.yaw + cuboid["yaw"] + math.pi / 2)
+
+    rotation_matrix = Quaternion(rotation.to_quaternion()).rotation_matrix
+    front = (rotation_matrix @ numpy.array([1, 0, 0]).T).flatten()
+    up = (rotation_matrix @ numpy.array([0, 0, 1]).T).flatten()
+    data = CuboidAnnotationDetailDataV2(
+        CuboidShapeV2(
+            dimensions=Size(width=cuboid["dimensions.x"], height=cuboid["dimensions.z"], depth=cuboid["dimensions.y"]),
+            location=Location(position[0][0], position[0][1], position[0][2]),
+            rotation=rotation,
+            direction=CuboidDirection(front=Vector3(front[0], front[1], front[2]), up=Vector3(up[0], up[1], up[2])),
+        )
+    )
+    return {
+        "annotation_id": cuboid["uuid"],
+        "label": cuboid["label"],
+        "attributes": Cuboid2Annofab._get_attributes(cuboid),
+        "data": data.dump(),
+    }
+
+
+def test_get_encoded_annotation_details():
+    """列単位で計算してテンプレートでエンコードした結果が、1個ずつ計算してJSONにした結果と一致することを確認する"""
+    main_obj = Cuboid2Annofab()
+    reader = SequenceFrameReader(sequence)
+    cuboid_data = reader.read_cuboids(0)
+    # 境界付近のyawも確認する
+    yaws = numpy.resize([0.0, -0.0, math.pi, -math.pi, math.pi / 2, -math.pi / 2], len(cuboid_data))
+    cuboid_data = pandas.concat([cuboid_data, cuboid_data.assign(yaw=yaws)], ignore_index=True)
+    lidar_pose = Pose.from_pandaset_pose(reader.get_lidar_poses()[0])
+
+    expected = [
+        json.dumps(get_expected_annotation_detail(cuboid, lidar_pose)) for cuboid in cuboid_data.to_dict("records")
+    ]
+    assert main_obj.get_encoded_annotation_details(cuboid_data, lidar_pose) == expected
+
+    assert main_obj.get_encoded_annotation_details(cuboid_data.iloc[0:0], lidar_pose) == []
+
+
+def test_write_cuboid_annotation_json(tmp_path):
+    """テンプレートで出力したファイルが、`json.dump`で出力した場合と同じバイト列になることを確認する"""
+    main_obj = Cuboid2Annofab()
+    reader = SequenceFrameReader(sequence)
+    cuboid_data = reader.read_cuboids(0)
+    lidar_pose = Pose.from_pandaset_pose(reader.get_lidar_poses()[0])
+
+    output_file = tmp_path / "001-0.json"
+    main_obj.write_cuboid_annotation_json(cuboid_data, lidar_pose, output_file)
+    details = [get_expected_annotation_detail(cuboid, lidar_pose) for cuboid in cuboid_data.to_dict("records")]
+    assert output_file.read_text(encoding="utf-8") == json.dumps({"details": details})
+
+    main_obj.write_cuboid_annotation_json(cuboid_data.iloc[0:0], lidar_pose, output_file)
+    assert output_file.read_text(encoding="utf-8") == json.dumps({"details": []})
+
+
+def test_write_cuboid_annotations__frame_sampler_changed(tmp_path, monkeypatch):
+    """変換するフレームの条件を変えて実行し直すと、出力しなくなったフレームのファイルを削除することを確認する"""
+    main_obj = Cuboid2Annofab()
+    main_obj.write_cuboid_annotations(sequence, output_dir=tmp_path, sequence_id=sequence_id)
+    assert (tmp_path / "001-0.json").exists()
+
+    # テスト用のシーケンスは1フレームだけなので、フレームを選ばない条件に変えたことにする
+    monkeypatch.setattr(FrameSampler, "select_frames", lambda self, reader: [])
+    main_obj.write_cuboid_annotations(sequence, output_dir=tmp_path, sequence_id=sequence_id)
+    assert not (tmp_path / "001-0.json").exists()
+
+
+def test_write_cuboid_annotations__zip(tmp_path):
+    Cuboid2Annofab().write_cuboid_annotations(
+        sequence, output_dir=tmp_path / "directory" / sequence_id, sequence_id=sequence_id
+    )
+
+    main_obj = Cuboid2Annofab(output_format="zip")
+    with main_obj.open_dataset_archive(tmp_path / "zip"):
+        main_obj.write_cuboid_annotations(sequence, output_dir=tmp_path / "zip" / sequence_id, sequence_id=sequence_id)
+
+    with zipfile.ZipFile(tmp_path / "zip" / "annotation.zip") as zip_file:
+        assert zip_file.namelist() == [f"{sequence_id}/{sequence_id}-0.json"]
+        assert (
+            zip_file.read(f"{sequence_id}/{sequence_id}-0.json")
+            == (tmp_path / "directory" / sequence_id / f"{sequence_id}-0.json").read_bytes()
+        )
+
+
+def test_main__zip_scope_dataset_with_failed_sequence(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        sys,
+        "argv",
+        [
+            "convert_cuboid_to_annofab_annotation",
+            "--input_dir",
+            "tests/resources/pandaset/",
+            "--output_dir",
+            str(tmp_path),
+            "--sequence_id",
+            sequence_id,
+            "not_exists",
+            "--output_format",
+            "zip",
+            "--zip_scope",
+            "dataset",
+        ],
+    )
+    with pytest.raises(RuntimeError):
+        main()
+
+    # 失敗したシーケンスがある場合は、zipファイルを出力しない
+    assert list(tmp_path.iterdir()) == []
@@ -1,6 +1,14 @@
+from panda2anno.common.frame_reader import SequenceFrameReader
+from panda2anno.common.frame_sampler import FrameSampler
+from panda2anno.common.kitti import Scene as KittiScene
+from panda2anno.common.pipeline import PipelineConfig
+from panda2anno.common.pose import Pose
+from panda2anno.common.prefetch import PrefetchConfig
 from panda2anno.convert_data_to_kitti import Pandaset2Kitti
 from pandaset import DataSet
+import json
 import os
+import shutil
 from pathlib import Path
 
 os.chdir(os.path.dirname(os.path.abspath(__file__)) + "/../")
@@ -20,5 +28,144 @@ def test_main():
     dataset.unload(sequence_id)
 
 
+def test_write_kitti_scene__calibration(tmp_path):
+    """まとめて計算したキャリブレーションファイルが、Poseで1フレームずつ計算した場合と完全に一致することを確認する"""
+    Pandaset2Kitti().write_kitti_scene(sequence, output_dir=tmp_path / "kitti", sequence_id=sequence_id)
+
+    reader = SequenceFrameReader(sequence)
+    lidar_pose = Pose.from_pandaset_pose(reader.get_lidar_poses()[0])
+    for camera_name in reader.get_camera_names():
+        expected_file = tmp_path / f"expected-{camera_name}.txt"
+        Pandaset2Kitti.write_calibration_file(
+            camera_pose=Pose.from_pandaset_pose(reader.get_camera_poses(camera_name)[0]),
+            lidar_pose=lidar_pose,
+            camera_intrinsics=reader.get_camera_intrinsics(camera_name),
+            output_file=expected_file,
+        )
+        actual_file = tmp_path / "kitti" / f"calib-{camera_name}" / f"{sequence_id}-0.txt"
+        assert actual_file.read_text() == expected_file.read_text()
+
+
 def teardown_module(moduloe):
     dataset.unload(sequence_id)
+
+
+def test_write_kitti_scene__pipeline(tmp_path):
+    Pandaset2Kitti(image_output_mode="reencode").write_kitti_scene(
+        sequence, output_dir=tmp_path / "serial", sequence_id=sequence_id
+    )
+    pipeline_config = PipelineConfig(stage_workers={"load": 2, "write": 2}, queue_size=1)
+    Pandaset2Kitti(image_output_mode="reencode", pipeline_config=pipeline_config).write_kitti_scene(
+        sequence, output_dir=tmp_path / "pipeline", sequence_id=sequence_id
+    )
+
+    # 1フレームずつ出力した場合と同じファイルを出力する
+    serial_files = sorted(e.relative_to(tmp_path / "serial") for e in (tmp_path / "serial").rglob("*") if e.is_file())
+    pipeline_files = sorted(
+        e.relative_to(tmp_path / "pipeline") for e in (tmp_path / "pipeline").rglob("*") if e.is_file()
+    )
+    assert serial_files == pipeline_files
+    for relative_path in serial_files:
+        if relative_path.name == ".panda2anno_manifest":
+            continue
+        assert (tmp_path / "serial" / relative_path).read_bytes() == (
+            tmp_path / "pipeline" / relative_path
+        ).read_bytes(), relative_path
+
+
+def test_write_kitti_scene__frame_workers(tmp_path):
+    Pandaset2Kitti().write_kitti_scene(sequence, output_dir=tmp_path / "serial", sequence_id=sequence_id)
+    Pandaset2Kitti(frame_workers=2).write_kitti_scene(
+        sequence, output_dir=tmp_path / "parallel", sequence_id=sequence_id
+    )
+
+    serial_files = sorted(e.relative_to(tmp_path / "serial") for e in (tmp_path / "serial").rglob("*") if e.is_file())
+    parallel_files = sorted(
+        e.relative_to(tmp_path / "parallel") for e in (tmp_path / "parallel").rglob("*") if e.is_file()
+    )
+    assert serial_files == parallel_files
+    for relative_path in serial_files:
+        if relative_path.name == ".panda2anno_manifest":
+            continue
+        assert (tmp_path / "serial" / relative_path).read_bytes() == (
+            tmp_path / "parallel" / relative_path
+        ).read_bytes(), relative_path
+
+
+def test_write_kitti_scene__prefetch(tmp_path):
+    Pandaset2Kitti().write_kitti_scene(sequence, output_dir=tmp_path / "serial", sequence_id=sequence_id)
+    Pandaset2Kitti(prefetch_config=PrefetchConfig(frames=1)).write_kitti_scene(
+        sequence, output_dir=tmp_path / "prefetch", sequence_id=sequence_id
+    )
+
+    serial_files = sorted(e.relative_to(tmp_path / "serial") for e in (tmp_path / "serial").rglob("*") if e.is_file())
+    prefetch_files = sorted(
+        e.relative_to(tmp_path / "prefetch") for e in (tmp_path / "prefetch").rglob("*") if e.is_file()
+    )
+    assert serial_files == prefetch_files
+    for relative_path in serial_files:
+        if relative_path.name == ".panda2anno_manifest":
+            continue
+        assert (tmp_path / "serial" / relative_path).read_bytes() == (
+            tmp_path / "prefetch" / relative_path
+        ).read_bytes(), relative_path
+
+
+def test_write_kitti_scene__reencode_after_hardlink(tmp_path):
+    """ハードリンクで出力した後に再エンコードで出力し直しても、元のJPEGファイルを書き換えないことを確認する"""
+    input_dir = tmp_path / "pandaset"
+    shutil.copytree(f"tests/resources/pandaset/{sequence_id}", input_dir / sequence_id)
+    source_image = input_dir / sequence_id / "camera/front_camera/00.jpg"
+    source_bytes = source_image.read_bytes()
+
+    for name, pipeline_config in [("serial", None), ("pipeline", PipelineConfig())]:
+        sequence_copy = DataSet(str(input_dir))[sequence_id]
+        Pandaset2Kitti(camera_name_list=["front_camera"], image_output_mode="hardlink").write_kitti_scene(
+            sequence_copy, output_dir=tmp_path / name, sequence_id=sequence_id
+        )
+        assert source_image.stat().st_nlink == 2
+        Pandaset2Kitti(
+            camera_name_list=["front_camera"], image_output_mode="reencode", pipeline_config=pipeline_config
+        ).write_kitti_scene(sequence_copy, output_dir=tmp_path / name, sequence_id=sequence_id)
+
+        assert source_image.read_bytes() == source_bytes, name
+        assert source_image.stat().st_nlink == 1, name
+        assert (tmp_path / name / "image-front_camera/001-0.jpg").read_bytes() != source_bytes
+
+
+def test_write_kitti_scene__frame_sampler_changed(tmp_path, monkeypatch):
+    """変換するフレームの条件を変えて実行し直すと、出力しなくなったフレームのファイルを削除することを確認する"""
+    main_obj = Pandaset2Kitti(camera_name_list=["front_camera"])
+    main_obj.write_kitti_scene(sequence, output_dir=tmp_path, sequence_id=sequence_id)
+    frame_files = [tmp_path / "velodyne/001-0.bin", tmp_path / "calib-front_camera/001-0.txt"]
+    frame_files.extend((tmp_path / "image-front_camera").glob("001-0.*"))
+    assert len(frame_files) == 3 and all(e.exists() for e in frame_files)
+
+    # テスト用のシーケンスは1フレームだけなので、フレームを選ばない条件に変えたことにする
+    monkeypatch.setattr(FrameSampler, "select_frames", lambda self, reader: [])
+    main_obj.write_kitti_scene(sequence, output_dir=tmp_path, sequence_id=sequence_id)
+    assert not any(e.exists() for e in frame_files)
+    assert KittiScene.decode_path(tmp_path / "scene.meta").id_list == []
+
+
+def test_write_kitti_scene__no_images(tmp_path):
+    Pandaset2Kitti(camera_name_list=["front_camera"], no_images=True).write_kitti_scene(
+        sequence, output_dir=tmp_path, sequence_id=sequence_id
+    )
+
+    assert not (tmp_path / "image-front_camera").exists()
+    assert (tmp_path / "calib-front_camera/001-0.txt").exists()
+    # 視野角はカメラのposeと内部パラメータから出力する
+    scene = KittiScene.decode_path(tmp_path / "scene.meta")
+    assert len(scene.images) == 1
+    assert scene.images[0].camera_view_setting is not None
+    # 作成しない画像のディレクトリは参照しない
+    assert scene.images[0].image_dir is None
+    series_list = json.loads((tmp_path / "scene.meta").read_text())["serieses"]
+    assert all("image_dir" not in e for e in series_list if e["type"] == "kitti_image")
+
+
+def test_write_kitti_scene__no_camera(tmp_path):
+    Pandaset2Kitti(camera_name_list=[]).write_kitti_scene(sequence, output_dir=tmp_path, sequence_id=sequence_id)
+
+    assert sorted(e.name for e in tmp_path.iterdir()) == [".panda2anno_manifest", "scene.meta", "velodyne"]
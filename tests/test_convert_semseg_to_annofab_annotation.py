@@ -1,8 +1,12 @@
-from panda2anno.convert_semseg_to_annofab_annotation import Semseg2Annofab
+from panda2anno.convert_semseg_to_annofab_annotation import CHANGED_INPUT_DATA_FILENAME, Semseg2Annofab
 from pandaset import DataSet
 import os
+import zipfile
 from pathlib import Path
 
+import pandas
+import pytest
+
 os.chdir(os.path.dirname(os.path.abspath(__file__)) + "/../")
 
 output_dir = Path("tests/out")
@@ -22,3 +26,104 @@ def test_main():
 
 def teardown_module(moduloe):
     dataset.unload(sequence_id)
+
+
+def test_write_semseg_annotation_json__incremental(tmp_path):
+    semseg_classes = {"1": "Car", "2": "Road", "3": "Building"}
+    semseg_data = pandas.DataFrame({"class": [1, 2, 2, 3, 1]})
+
+    output_files = Semseg2Annofab.write_semseg_annotation_json(
+        semseg_data, semseg_classes, task_dir=tmp_path, input_data_id="001-0"
+    )
+    # annotation_idは(input_data_id, クラスID)から決まる
+    assert output_files == Semseg2Annofab.write_semseg_annotation_json(
+        semseg_data, semseg_classes, task_dir=tmp_path, input_data_id="001-0"
+    )
+    contents = {e: e.read_bytes() for e in output_files}
+
+    # クラス3の点がなくなり、クラス1の点が変わった場合
+    changed_data = pandas.DataFrame({"class": [1, 2, 2, 2, 2]})
+    changed_output_files = Semseg2Annofab.write_semseg_annotation_json(
+        changed_data, semseg_classes, task_dir=tmp_path, input_data_id="001-0", incremental=True
+    )
+    car_file, road_file, building_file, json_file = output_files
+    assert changed_output_files == [car_file, road_file, json_file]
+    assert car_file.read_bytes() != contents[car_file]
+    assert road_file.read_bytes() != contents[road_file]
+    assert not building_file.exists()
+    assert json_file.read_bytes() != contents[json_file]
+
+    # 内容が変わらなければ書き込まない。書き込んだかどうかを時刻の精度に依存せずに判定できるように、更新日時を過去にする
+    for output_file in changed_output_files:
+        os.utime(output_file, ns=(0, 0))
+    json_inode = json_file.stat().st_ino
+    Semseg2Annofab.write_semseg_annotation_json(
+        changed_data, semseg_classes, task_dir=tmp_path, input_data_id="001-0", incremental=True
+    )
+    assert [e.stat().st_mtime_ns for e in changed_output_files] == [0, 0, 0]
+    assert json_file.stat().st_ino == json_inode
+
+
+def test_write_semseg_annotations__incremental_changed_input_data(tmp_path):
+    changed_input_data_file = tmp_path / CHANGED_INPUT_DATA_FILENAME
+
+    Semseg2Annofab(incremental=True).write_semseg_annotations(sequence, output_dir=tmp_path, sequence_id=sequence_id)
+    assert changed_input_data_file.read_text() == "001-0\n"
+
+    # インポートした後に削除すれば、内容が変わったフレームだけが記録される
+    changed_input_data_file.unlink()
+    Semseg2Annofab(force=True, incremental=True).write_semseg_annotations(
+        sequence, output_dir=tmp_path, sequence_id=sequence_id
+    )
+    assert not changed_input_data_file.exists()
+
+    (tmp_path / "001-0.json").write_text("{}")
+    for _ in range(2):
+        Semseg2Annofab(force=True, incremental=True).write_semseg_annotations(
+            sequence, output_dir=tmp_path, sequence_id=sequence_id
+        )
+    assert changed_input_data_file.read_text() == "001-0\n"
+
+
+def test_write_semseg_annotations__frame_workers(tmp_path):
+    Semseg2Annofab().write_semseg_annotations(sequence, output_dir=tmp_path / "serial", sequence_id=sequence_id)
+    Semseg2Annofab(frame_workers=2).write_semseg_annotations(
+        sequence, output_dir=tmp_path / "parallel", sequence_id=sequence_id
+    )
+
+    serial_files = sorted(e.relative_to(tmp_path / "serial") for e in (tmp_path / "serial").rglob("*") if e.is_file())
+    for relative_path in serial_files:
+        if relative_path.name == ".panda2anno_manifest":
+            continue
+        assert (tmp_path / "serial" / relative_path).read_bytes() == (
+            tmp_path / "parallel" / relative_path
+        ).read_bytes(), relative_path
+
+
+def test_write_semseg_annotations__zip(tmp_path):
+    Semseg2Annofab().write_semseg_annotations(
+        sequence, output_dir=tmp_path / "directory" / sequence_id, sequence_id=sequence_id
+    )
+    for zip_compression in ["stored", "deflate"]:
+        Semseg2Annofab(output_format="zip", zip_compression=zip_compression).write_semseg_annotations(
+            sequence, output_dir=tmp_path / zip_compression / sequence_id, sequence_id=sequence_id
+        )
+
+    # ディレクトリに出力した場合と同じ構成、同じ内容のエントリが書き込まれる
+    expected = {
+        e.relative_to(tmp_path / "directory").as_posix(): e.read_bytes()
+        for e in (tmp_path / "directory").rglob("*")
+        if e.is_file() and e.name != ".panda2anno_manifest"
+    }
+    for zip_compression, compress_type in [("stored", zipfile.ZIP_STORED), ("deflate", zipfile.ZIP_DEFLATED)]:
+        assert not (tmp_path / zip_compression / sequence_id).exists()
+        with zipfile.ZipFile(tmp_path / zip_compression / f"{sequence_id}.zip") as zip_file:
+            assert {e.filename: zip_file.read(e) for e in zip_file.infolist()} == expected
+            assert {e.compress_type for e in zip_file.infolist()} == {compress_type}
+
+
+def test_semseg2annofab__zip_and_incremental():
+    with pytest.raises(ValueError):
+        Semseg2Annofab(output_format="zip", incremental=True)
+    with pytest.raises(ValueError):
+        Semseg2Annofab(output_format="zip", frame_workers=2)
@@ -0,0 +1,45 @@
+import os
+
+from pandaset import DataSet
+
+from panda2anno.common.dataset_index import create_sequence_index
+from panda2anno.print_attribute_count import (
+    create_frame_df,
+    get_attribute_counter_from_index,
+    get_attribute_counter_from_values,
+    get_frame_df_from_index,
+    get_frame_df_from_values,
+    read_attribute_values,
+)
+
+os.chdir(os.path.dirname(os.path.abspath(__file__)) + "/../")
+
+dataset = DataSet("tests/resources/pandaset/")
+
+sequence_id = "001"
+sequence = dataset[sequence_id]
+
+
+def test_read_attribute_values():
+    attribute_values = read_attribute_values(sequence)
+    assert list(attribute_values.columns) == ["frame_index", "attribute", "value"]
+    assert attribute_values["value"].dtype == "category"
+
+    counter = get_attribute_counter_from_values(attribute_values)
+    sequence_index, _ = create_sequence_index(sequence, sequence_id)
+    # インデックスから集計した結果と一致する
+    assert counter.to_dict() == get_attribute_counter_from_index(sequence_index).to_dict()
+    assert counter.object_motion["nan"] > 0
+
+    frame_df = create_frame_df({sequence_id: get_frame_df_from_values(attribute_values)})
+    frame_df_from_index = create_frame_df({sequence_id: get_frame_df_from_index(sequence_index)})
+    assert frame_df.to_dict("records") == frame_df_from_index.to_dict("records")
+    assert list(frame_df.columns[:2]) == ["sequence_id", "frame_index"]
+    row = frame_df.iloc[0].to_dict()
+    assert {key: value for key, value in row.items() if str(key).startswith("object_motion.")} == {
+        f"object_motion.{value}": count for value, count in counter.object_motion.items()
+    }
+
+
+def teardown_module(moduloe):
+    dataset.unload(sequence_id)
@@ -0,0 +1,57 @@
+import os
+from collections import Counter
+
+from pandaset import DataSet
+
+from panda2anno.common.dataset_index import FrameIndex, SequenceIndex, create_sequence_index
+from panda2anno.common.frame_reader import SequenceFrameReader
+from panda2anno.print_stats import StatsCollector, get_attribute_counts, get_semseg_counts, write_dataframes
+
+os.chdir(os.path.dirname(os.path.abspath(__file__)) + "/../")
+
+dataset = DataSet("tests/resources/pandaset/")
+
+sequence_id = "001"
+sequence = dataset[sequence_id]
+
+
+def test_stats_collector(tmp_path):
+    sequence_index, _ = create_sequence_index(sequence, sequence_id)
+    collector = StatsCollector()
+    collector.add(sequence_index)
+    dataframes = collector.get_dataframes()
+
+    reader = SequenceFrameReader(sequence)
+    cuboid_data = reader.read_cuboids(0)
+    label_counts = dataframes["cuboid_label_count"].set_index("sequence_id").loc[sequence_id].to_dict()
+    assert label_counts == dict(Counter(cuboid_data["label"]))
+    assert list(dataframes["label"]["label_name"]) == sorted(set(cuboid_data["label"]))
+    assert len(dataframes["datetime"]) == 1
+
+    write_dataframes(dataframes, tmp_path, "csv")
+    assert {e.name for e in tmp_path.iterdir()} == {f"{name}.csv" for name in dataframes}
+
+
+def test_sum_over_frames():
+    sequence_index = SequenceIndex(
+        sequence_id="001",
+        frame_count=2,
+        lidar_poses=[],
+        lidar_timestamps=[],
+        camera_timestamps={},
+        semseg_classes={"1": "Car", "2": "Road"},
+        frames=[
+            FrameIndex(cuboid_attribute_counts={"object_motion": {"Moving": 2}}, semseg_class_counts={"1": 3}),
+            FrameIndex(
+                cuboid_attribute_counts={"object_motion": {"Moving": 1, "nan": 4}},
+                semseg_class_counts={"1": 1, "2": 5},
+            ),
+        ],
+        source_files={},
+    )
+    assert get_attribute_counts(sequence_index) == {"object_motion.Moving": 3, "object_motion.nan": 4}
+    assert get_semseg_counts(sequence_index) == {"Car": 4, "Road": 5}
+
+
+def teardown_module(moduloe):
+    dataset.unload(sequence_id)